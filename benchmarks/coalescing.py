@@ -0,0 +1,86 @@
+"""
+Compare backend round trips and throughput with and without coalescing
+writes, for concurrent requests each adding one member
+
+    $ python benchmarks/coalescing.py --threads 64 --writes 50 --latency 0.001
+
+The RAM backend stands in for a busy remote one, handling a call at a time
+and taking --latency seconds over each.
+"""
+
+from argparse import ArgumentParser
+from os import environ
+from threading import Lock, Thread
+from time import perf_counter, sleep
+
+# Backends are built by hand below
+environ['IDNEST_DEFER_CONFIG'] = "True"
+
+from idnest.blueprint import BLUEPRINT, CoalescingStorageBackend, RAMStorageBackend
+
+
+class RemoteRAMStorageBackend(RAMStorageBackend):
+    """
+    The RAM backend, counting the calls adding members and taking latency
+    seconds over each, one at a time
+    """
+    def __init__(self, bp, latency):
+        super().__init__(bp)
+        self.latency = latency
+        self.lock = Lock()
+        self.round_trips = 0
+
+    def add_member(self, c_id, m_id):
+        return self.add_members(c_id, [m_id])[0]
+
+    def add_members(self, c_id, m_ids):
+        # One call at a time, like a server that's already the bottleneck
+        with self.lock:
+            sleep(self.latency)
+            self.round_trips += 1
+            return [super(RemoteRAMStorageBackend, self).add_member(c_id, m_id)
+                    for m_id in m_ids]
+
+
+def run(storage, args):
+    c_ids = storage.mint_containers(args.containers)
+
+    def writer(n):
+        for i in range(args.writes):
+            storage.add_member(c_ids[(n + i) % len(c_ids)], "{}-{}".format(n, i))
+
+    threads = [Thread(target=writer, args=(n,)) for n in range(args.threads)]
+    start = perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return perf_counter() - start
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", type=int, default=64)
+    parser.add_argument("--writes", type=int, default=50, help="Writes per thread")
+    parser.add_argument("--containers", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.001,
+                        help="Seconds each call to the backend takes")
+    parser.add_argument("--window", type=float, default=0.002)
+    args = parser.parse_args()
+    writes = args.threads * args.writes
+    print("{} threads making {} writes to {} containers".format(
+        args.threads, writes, args.containers))
+    backend = RemoteRAMStorageBackend(BLUEPRINT, args.latency)
+    elapsed = run(backend, args)
+    direct = backend.round_trips
+    print("{:>10}: {:6d} round trips, {:8.0f} writes/s".format(
+        "direct", direct, writes / elapsed))
+    backend = RemoteRAMStorageBackend(BLUEPRINT, args.latency)
+    elapsed = run(CoalescingStorageBackend(backend, window=args.window), args)
+    print("{:>10}: {:6d} round trips, {:8.0f} writes/s".format(
+        "coalesced", backend.round_trips, writes / elapsed))
+    print("coalescing makes {:.1f}x fewer round trips".format(direct / backend.round_trips))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Compare the CPU time spent building the links in a page of members
+
+    $ python benchmarks/links.py --limit 1000 --repeat 200
+
+Times building a page's links with a url_for per member (as listings used
+to), with a link template, and then whole GETs of the page with and without
+links=false, all against the RAM backend.
+"""
+
+from argparse import ArgumentParser
+from os import environ
+from time import process_time
+
+# The backend is set up by hand below
+environ['IDNEST_DEFER_CONFIG'] = "True"
+
+import idnest
+from idnest.blueprint import API, BLUEPRINT, Member, RAMStorageBackend, link_template
+
+
+def cpu_time(f, repeat):
+    start = process_time()
+    for _ in range(repeat):
+        f()
+    return (process_time() - start) / repeat
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--limit", type=int, default=1000, help="Members per page")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    BLUEPRINT.config['storage'] = RAMStorageBackend(BLUEPRINT)
+    c_id = BLUEPRINT.config['storage'].mint_container()
+    m_ids = ["ark:/61001/{:012x}".format(i) for i in range(args.limit)]
+    BLUEPRINT.config['storage'].add_members(c_id, m_ids)
+    client = idnest.app.test_client()
+
+    def url_for_links():
+        return [API.url_for(Member, container_id=c_id, member_id=x) for x in m_ids]
+
+    def template_links():
+        link = link_template(Member, "member_id", container_id=c_id)
+        return [link(x) for x in m_ids]
+
+    with idnest.app.test_request_context("/{}/".format(c_id)):
+        assert url_for_links() == template_links()
+        results = [
+            ("url_for per link", cpu_time(url_for_links, args.repeat)),
+            ("link template", cpu_time(template_links, args.repeat))
+        ]
+    for name, query in [("GET page", ""), ("GET page, links=false", "&links=false")]:
+        url = "/{}/?limit={}{}".format(c_id, args.limit, query)
+        results.append((name, cpu_time(lambda: client.get(url), args.repeat)))
+    print("{} links per page, CPU time per page:".format(args.limit))
+    for name, seconds in results:
+        print("{:>24}: {:8.3f} ms".format(name, seconds * 1000))
+    print("link templates build links {:.1f}x faster".format(results[0][1] / results[1][1]))
+
+
+if __name__ == "__main__":
+    main()
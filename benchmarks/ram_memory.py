@@ -0,0 +1,72 @@
+"""
+Compare the memory the RAM storage backend takes to hold the same data in
+its default and compact modes
+
+    $ python benchmarks/ram_memory.py --containers 10000 --members 200 --distinct 100000
+
+Every container gets --members members, drawn from a pool of --distinct
+member ids, so the smaller the pool the more the ids repeat across
+containers (which is what interning saves on).
+"""
+
+from argparse import ArgumentParser
+from os import environ
+from random import Random
+from time import perf_counter
+import gc
+import tracemalloc
+
+from flask import Blueprint
+
+# Backends are built by hand below
+environ['IDNEST_DEFER_CONFIG'] = "True"
+
+from idnest.blueprint import CompactRAMStorageBackend, RAMStorageBackend
+
+
+def measure(backend, args):
+    bp = Blueprint("benchmark", __name__)
+    bp.config = {"ID_SCHEME": "uuid4"}
+    rand = Random(args.seed)
+    # Member ids are built up front, as they'd arrive with requests, so
+    # only what the backend keeps of them counts
+    pool = ["ark:/61001/{:012x}".format(rand.getrandbits(48)) for _ in range(args.distinct)]
+    gc.collect()
+    tracemalloc.start()
+    start = perf_counter()
+    storage = backend(bp)
+    for c_id in storage.mint_containers(args.containers):
+        storage.add_members(c_id, [pool[rand.randrange(len(pool))]
+                                   for _ in range(args.members)])
+    elapsed = perf_counter() - start
+    del pool
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return storage, current, elapsed
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--containers", type=int, default=10000)
+    parser.add_argument("--members", type=int, default=200,
+                        help="Members per container")
+    parser.add_argument("--distinct", type=int, default=100000,
+                        help="How many distinct member ids to draw from")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    associations = args.containers * args.members
+    print("{} containers x {} members ({} associations, {} distinct member ids)".format(
+        args.containers, args.members, associations, args.distinct))
+    results = []
+    for name, backend in [("default", RAMStorageBackend), ("compact", CompactRAMStorageBackend)]:
+        storage, size, elapsed = measure(backend, args)
+        results.append(size)
+        print("{:>8}: {:8.1f} MiB ({:6.1f} bytes per association), loaded in {:.1f}s".format(
+            name, size / 2 ** 20, size / associations, elapsed))
+        del storage
+    print("compact mode uses {:.1f}x less memory".format(results[0] / results[1]))
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,28 @@ class Configuration(metaclass=MetaFlaskEnv):
     ENV_PREFIX = 'IDNEST_'
     DEBUG = False
     DEFER_CONFIG = False
+    ID_SCHEME = "uuid4"
+    CACHE = False
+    CACHE_MAXSIZE = 10000
+    CACHE_TTL = 60
+    COALESCE_WRITES = False
+    COALESCE_WINDOW = 0.002
+    COALESCE_MAX_BATCH = 1000
+    RAM_COMPACT = False
+    RAM_JOURNAL_DIR = None
+    RAM_JOURNAL_COMMIT_DELAY = 0
+    RAM_SNAPSHOT_INTERVAL = 300
+    SQLITE_PATH = None
+    SQLITE_TIMEOUT = 5
+    JSON_LIBRARY = "json"
+    REDIS_MAX_CONNECTIONS = 100
+    IMPORT_BATCH_SIZE = 1000
+    IMPORT_MAX_PENDING = 10000
+    EXPORT_CHUNK_SIZE = 1000
+    RAM_ALLOW_DUPLICATE_MEMBERS = True
+    SHARD_BACKEND = "ram"
+    SHARDS = ""
+    SHARD_VNODES = 64
 
 
 app = Flask(__name__)
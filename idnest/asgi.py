@@ -0,0 +1,390 @@
+"""
+Serve idnest's core routes over ASGI
+
+The Flask app ties a worker up for the whole round trip to the storage
+backend, this app awaits the async backends in idnest.blueprint.aio
+instead, so one process can have any number of requests in flight:
+
+    $ uvicorn idnest.asgi:app
+
+It serves the routes of the Root, Container, Member and Version resources,
+with the same arguments, responses and configuration as the Flask app.
+"""
+
+from asyncio import Lock
+from io import BytesIO
+from urllib.parse import parse_qsl, quote
+import json
+import logging
+
+from werkzeug.datastructures import ETags
+from werkzeug.formparser import FormDataParser
+from werkzeug.http import parse_etags, parse_options_header, quote_etag
+
+from flask_restful import inputs
+
+from .blueprint import BLUEPRINT, COUNT_HEADER, __version__, make_etag
+from .blueprint.aio import IAsyncStorageBackend, AsyncMongoStorageBackend, \
+    AsyncRedisStorageBackend, AsyncRAMStorageBackend
+from .blueprint.exceptions import PartialBulkOperationError
+from .blueprint.representations import Listing, json_dumper
+
+log = logging.getLogger(__name__)
+
+MESSAGES = {
+    400: "The browser (or proxy) sent a request that this server could not understand.",
+    404: "The requested URL was not found on the server. If you entered the URL manually " +
+         "please check your spelling and try again.",
+    405: "The method is not allowed for the requested URL."
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message=None, headers=None):
+        self.status = status
+        self.message = MESSAGES.get(status) if message is None else message
+        self.headers = headers or {}
+
+
+class Request:
+    def __init__(self, scope, body):
+        self.method = scope["method"]
+        self.root_path = scope.get("root_path", "")
+        self.headers = {k.decode("latin-1").lower(): v.decode("latin-1")
+                        for k, v in scope["headers"]}
+        self.query = parse_qsl(scope.get("query_string", b"").decode("latin-1"),
+                               keep_blank_values=True)
+        self.body = body
+
+    def values(self, name):
+        """
+        Every value given for name, looking (like reqparse) in a JSON body,
+        then the query string, then a form body
+        """
+        values = []
+        mimetype, options = parse_options_header(self.headers.get("content-type", ""))
+        if mimetype == "application/json" and self.body:
+            try:
+                data = json.loads(self.body)
+            except ValueError:
+                raise HTTPError(400)
+            if isinstance(data, dict) and name in data:
+                value = data[name]
+                values.extend(value if isinstance(value, list) else [value])
+        values.extend(v for k, v in self.query if k == name)
+        if mimetype in ("multipart/form-data", "application/x-www-form-urlencoded"):
+            _, form, _ = FormDataParser().parse(BytesIO(self.body), mimetype,
+                                                len(self.body), options)
+            values.extend(form.getlist(name))
+        return values
+
+    def arg(self, name, type=str, default=None, help=None):
+        values = self.values(name)
+        if not values:
+            return default
+        try:
+            return type(values[0])
+        except (TypeError, ValueError) as e:
+            raise HTTPError(400, {name: help or str(e)})
+
+    def arg_list(self, name, help=None):
+        values = [str(x) for x in self.values(name)]
+        if not values:
+            raise HTTPError(400, {name: help})
+        return values
+
+    def if_none_match(self):
+        header = self.headers.get("if-none-match")
+        return parse_etags(header) if header else ETags()
+
+    def url_for(self, *segments):
+        return self.root_path + "/" + "/".join(quote(x, safe="/:") for x in segments)
+
+
+class IdnestASGI:
+    """
+    An ASGI application over an IAsyncStorageBackend
+    """
+    def __init__(self, storage, config):
+        if not isinstance(storage, IAsyncStorageBackend):
+            raise TypeError("storage must be an IAsyncStorageBackend")
+        self.storage = storage
+        self.config = config
+        self.dumps = json_dumper(config.get("JSON_LIBRARY", "json"))
+        self.ready = False
+        self.setup_lock = Lock()
+
+    async def setup(self):
+        async with self.setup_lock:
+            if not self.ready:
+                await self.storage.setup()
+                self.ready = True
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        if scope["type"] != "http":
+            return
+        await self.setup()
+        body = []
+        while True:
+            message = await receive()
+            body.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        request = Request(scope, b"".join(body))
+        try:
+            status, data, headers = await self.dispatch(request, scope["path"])
+        except HTTPError as e:
+            status, headers = e.status, e.headers
+            data = None if status == 304 else {"message": e.message}
+        await self.respond(send, status, data, headers, request.method == "HEAD")
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await self.setup()
+                except Exception as e:
+                    log.critical("Storage backend setup failed: {}".format(e))
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def respond(self, send, status, data, headers, head=False):
+        headers = [(k.lower().encode("latin-1"), v.encode("latin-1"))
+                   for k, v in headers.items()]
+        body = b""
+        if data is not None:
+            body = self.dumps(data)
+            headers.append((b"content-type", b"application/json"))
+        headers.append((b"content-length", str(len(body)).encode("latin-1")))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": b"" if head else body})
+
+    async def dispatch(self, request, path):
+        # Route the same URLs as the Flask app, to the same handlers
+        segments = path[1:].split("/")
+        if path == "/":
+            handlers = {"GET": self.ls_containers, "POST": self.mint_containers}
+            args = ()
+        elif path == "/version":
+            handlers = {"GET": self.version}
+            args = ()
+        elif len(segments) == 2 and segments[0] and segments[1] == "":
+            handlers = {"GET": self.ls_members, "HEAD": self.count_members,
+                        "POST": self.add_members, "DELETE": self.rm_container}
+            args = (segments[0],)
+        elif len(segments) == 2 and segments[0] and segments[1]:
+            handlers = {"GET": self.get_member, "DELETE": self.rm_member}
+            args = tuple(segments)
+        elif len(segments) == 1 and segments[0]:
+            # The Flask app redirects to the container, as its route has a
+            # trailing slash
+            location = request.url_for(segments[0], "")
+            raise HTTPError(308, "Redirecting to {}".format(location), {"Location": location})
+        else:
+            raise HTTPError(404)
+        method = request.method
+        if method == "HEAD" and method not in handlers:
+            method = "GET"
+        if method not in handlers:
+            raise HTTPError(405, headers={"Allow": ", ".join(sorted(handlers))})
+        return await handlers[method](request, *args)
+
+    def check_limit(self, limit):
+        if limit > self.config.get("MAX_LIMIT", 1000):
+            log.warning(
+                "Received request above MAX_LIMIT (or 1000 if undefined), capping.")
+            limit = self.config.get("MAX_LIMIT", 1000)
+        return limit
+
+    def check_not_modified(self, request, etag):
+        if etag is not None and request.if_none_match().contains(etag):
+            raise HTTPError(304, headers={"ETag": quote_etag(etag)})
+
+    def etag_headers(self, etag):
+        return {} if etag is None else {"ETag": quote_etag(etag)}
+
+    def representation(self, *args):
+        # As the Flask app's, which never runs in debug mode here
+        return (self.config.get("JSON_LIBRARY", "json").lower(), False) + args
+
+    def pagination_args(self, request):
+        return request.arg("cursor", default="0"), \
+            self.check_limit(request.arg("limit", int, default=1000))
+
+    def link(self, request, *segments):
+        """
+        A function building the link to segments with its argument in place
+        of the None among them, or None if the request asked for listings
+        without links
+        """
+        if not request.arg("links", inputs.boolean, default=True):
+            return None
+        i = segments.index(None)
+        return lambda x: request.url_for(*segments[:i], x, *segments[i + 1:])
+
+    async def mint_containers(self, request):
+        num = self.check_limit(request.arg("num", int, default=1,
+                                           help="How many containers to mint."))
+        try:
+            minted = await self.storage.mint_containers(num)
+        except PartialBulkOperationError as e:
+            return e.status_code, e.to_dict(), {}
+        return 200, {
+            "Minted": Listing(minted, self.link(request, None, "")),
+            "_self": {"identifier": None, "_link": request.url_for("")}
+        }, {}
+
+    async def ls_containers(self, request):
+        cursor, limit = self.pagination_args(request)
+        links = request.arg("links", inputs.boolean, default=True)
+        etag = make_etag("containers", await self.storage.containers_version(),
+                         variant=self.representation(cursor, limit, links))
+        self.check_not_modified(request, etag)
+        try:
+            next_cursor, page = await self.storage.ls_containers(cursor, limit)
+        except ValueError:
+            log.critical("Malformed cursor: {}".format(cursor))
+            raise HTTPError(400)
+        return 200, {
+            "Containers": Listing(page, self.link(request, None, "")),
+            "pagination": {
+                "cursor": cursor,
+                "limit": limit,
+                "next_cursor": next_cursor
+            },
+            "_self": {"identifier": None, "_link": request.url_for("")}
+        }, self.etag_headers(etag)
+
+    async def add_members(self, request, container_id):
+        m_ids = request.arg_list("member", help="The member id to add")
+        try:
+            added = await self.storage.add_members(container_id, m_ids)
+        except KeyError:
+            log.critical("Container with id {} not found".format(container_id))
+            raise HTTPError(404)
+        return 200, {
+            "Added": Listing(added, self.link(request, container_id, None)),
+            "_self": {"identifier": container_id, "_link": request.url_for(container_id, "")}
+        }, {}
+
+    async def ls_members(self, request, container_id):
+        cursor, limit = self.pagination_args(request)
+        links = request.arg("links", inputs.boolean, default=True)
+        want_total = request.arg("total", inputs.boolean, default=False)
+        try:
+            if want_total:
+                total = await self.storage.count_members(container_id)
+                if total is None:
+                    raise KeyError
+            elif not await self.storage.container_exists(container_id):
+                raise KeyError
+            etag = make_etag(container_id, await self.storage.container_version(container_id),
+                             variant=self.representation(cursor, limit, links, want_total))
+            self.check_not_modified(request, etag)
+            next_cursor, page = await self.storage.ls_members(container_id, cursor, limit)
+        except KeyError:
+            log.critical("Container with id {} not found".format(container_id))
+            raise HTTPError(404)
+        except ValueError:
+            log.critical("Malformed cursor: {}".format(cursor))
+            raise HTTPError(400)
+        pagination = {
+            "cursor": cursor,
+            "limit": limit,
+            "next_cursor": next_cursor
+        }
+        if want_total:
+            pagination["total"] = total
+        return 200, {
+            "Members": Listing(page, self.link(request, container_id, None)),
+            "pagination": pagination,
+            "_self": {"identifier": container_id, "_link": request.url_for(container_id, "")}
+        }, self.etag_headers(etag)
+
+    async def count_members(self, request, container_id):
+        # Tagged as GET would tag the listing
+        cursor, limit = self.pagination_args(request)
+        links = request.arg("links", inputs.boolean, default=True)
+        want_total = request.arg("total", inputs.boolean, default=False)
+        total = await self.storage.count_members(container_id)
+        if total is None:
+            log.critical("Container with id {} not found".format(container_id))
+            raise HTTPError(404)
+        etag = make_etag(container_id, await self.storage.container_version(container_id),
+                         variant=self.representation(cursor, limit, links, want_total))
+        self.check_not_modified(request, etag)
+        return 200, None, dict(self.etag_headers(etag), **{COUNT_HEADER: str(total)})
+
+    async def rm_container(self, request, container_id):
+        await self.storage.rm_container(container_id)
+        return 200, {
+            "Deleted": True,
+            "_self": {"identifier": container_id, "_link": request.url_for(container_id, "")}
+        }, {}
+
+    async def get_member(self, request, container_id, member_id):
+        # Checked before the tag, as If-None-Match: * matches any tag
+        if not await self.storage.member_exists(container_id, member_id):
+            log.critical("Container with id {} ".format(container_id) +
+                         "or member with id {} ".format(member_id) +
+                         "not found")
+            raise HTTPError(404)
+        etag = make_etag(container_id, member_id,
+                         await self.storage.container_version(container_id),
+                         variant=self.representation())
+        self.check_not_modified(request, etag)
+        return 200, {
+            "_self": {"identifier": member_id,
+                      "_link": request.url_for(container_id, member_id)},
+            "Container": {"identifier": container_id,
+                          "_link": request.url_for(container_id, "")}
+        }, self.etag_headers(etag)
+
+    async def rm_member(self, request, container_id, member_id):
+        await self.storage.rm_member(container_id, member_id)
+        return 200, {
+            "Deleted": True,
+            "_self": {"identifier": member_id,
+                      "_link": request.url_for(container_id, member_id)},
+            "Container": {"identifier": container_id,
+                          "_link": request.url_for(container_id, "")}
+        }, {}
+
+    async def version(self, request):
+        return 200, {"version": __version__}, {}
+
+
+def create_app(bp):
+    """
+    Build the ASGI app from the same configuration as the Flask app
+    """
+    storage_choice = bp.config.get("STORAGE_BACKEND")
+
+    if storage_choice is None:
+        raise RuntimeError(
+            "Missing required configuration value 'STORAGE_BACKEND'"
+        )
+
+    supported_backends = {
+        "mongodb": AsyncMongoStorageBackend,
+        "redis": AsyncRedisStorageBackend,
+        "ram": AsyncRAMStorageBackend
+    }
+
+    if storage_choice.lower() not in supported_backends:
+        raise RuntimeError(
+            "Unsupported STORAGE_BACKEND for the ASGI app: {}\n".format(storage_choice) +
+            "Supported storage backends include: " +
+            "{}".format(", ".join(supported_backends.keys()))
+        )
+    return IdnestASGI(supported_backends[storage_choice.lower()](bp), bp.config)
+
+
+app = None if BLUEPRINT.config.get("DEFER_CONFIG") else create_app(BLUEPRINT)
@@ -6,17 +6,40 @@ __author__ = "Brian Balsamo"
 __email__ = "balsamo@uchicago.edu"
 __version__ = "0.0.1"
 
-from uuid import uuid4
 from abc import ABCMeta, abstractmethod
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from bisect import bisect_left, bisect_right, insort
+from array import array
+from concurrent.futures import Future
+from contextlib import contextmanager
+from itertools import count, groupby, islice
+from operator import itemgetter
+from time import time_ns
+from uuid import uuid4
+import csv
+import hashlib
+import heapq
+import json
 import logging
+import os
+import re
+import sqlite3
+import threading
 
-from flask import Blueprint, jsonify, abort, Response
-from flask_restful import Resource, Api, reqparse
+from flask import Blueprint, jsonify, abort, current_app, Response, request, \
+    stream_with_context
+from flask_restful import Resource, Api, inputs, reqparse
+from werkzeug.http import quote_etag
 
 import redis
 from pymongo import MongoClient, ASCENDING
+from pymongo.errors import BulkWriteError
 
-from .exceptions import Error, ImproperConfigurationError
+from .exceptions import Error, ImproperConfigurationError, PartialBulkOperationError
+from .identifiers import minter
+from .cache import LRUCache, MISSING
+from .representations import Listing, item_json, json_dumper, output_json
+from . import journal
 
 BLUEPRINT = Blueprint('idnest', __name__)
 
@@ -34,6 +57,47 @@ def handle_errors(error):
     return response
 
 
+# Keyset cursors are prefixed so they can never be mistaken for the plain
+# integer offsets older clients may still be holding on to.
+KEYSET_CURSOR_PREFIX = "k"
+
+
+def encode_cursor(key):
+    """
+    Build an opaque keyset cursor meaning "everything after key"
+    """
+    return KEYSET_CURSOR_PREFIX + urlsafe_b64encode(key.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """
+    Split a cursor into an (offset, key) pair, exactly one of which is not None
+
+    Raises ValueError on malformed cursors.
+    """
+    cursor = str(cursor)
+    if cursor.startswith(KEYSET_CURSOR_PREFIX):
+        return None, urlsafe_b64decode(cursor[len(KEYSET_CURSOR_PREFIX):].encode("ascii")).\
+            decode("utf-8")
+    offset = int(cursor)
+    if offset < 0:
+        raise ValueError("Negative cursor: {}".format(cursor))
+    return offset, None
+
+
+def page_sorted(keys, cursor, limit):
+    """
+    Page through a sorted list of keys
+    """
+    offset, after = decode_cursor(cursor)
+    if after is not None:
+        offset = bisect_right(keys, after)
+    page = keys[offset:offset + limit]
+    if page and offset + len(page) < len(keys):
+        return encode_cursor(page[-1]), page
+    return None, page
+
+
 class IStorageBackend(metaclass=ABCMeta):
     """
     _Abstracts_
@@ -54,6 +118,24 @@ class IStorageBackend(metaclass=ABCMeta):
     * add_members
     * rm_members
     * member_exists
+    * members_exist
+    * iter_members
+    * count_members
+    * ls_members_many
+    * ls_member_containers
+
+    _Optional_
+    (Over-ride these to enable the features that rely on them)
+
+    * containers_version
+    * container_version
+
+    _Optional Capabilities_
+    (Implement these to allow the features that need them, which check for
+    them up front)
+
+    * create_containers(c_ids): add empty containers with the given ids,
+      minted elsewhere. Needed to be a shard of a ShardedStorageBackend.
     """
     @abstractmethod
     def mint_container(self):
@@ -99,53 +181,359 @@ class IStorageBackend(metaclass=ABCMeta):
     def member_exists(self, c_id, qm_id):
         pass
 
+    def members_exist(self, c_id, m_ids):
+        """
+        Whether each of the member ids is in the container, as a list of bools
+        """
+        return [self.member_exists(c_id, m_id) for m_id in m_ids]
+
+    def iter_members(self, c_id, chunk_size=1000):
+        """
+        Generate every member of the container in order, fetching them
+        chunk_size at a time
+        """
+        cursor = "0"
+        while cursor is not None:
+            cursor, page = self.ls_members(c_id, cursor, chunk_size)
+            yield from page
+
+    def count_members(self, c_id):
+        """
+        How many members the container holds, counting every occurrence of
+        a member, or None if it doesn't exist
+
+        This fallback pages through all of them, backends should count them
+        without fetching any.
+        """
+        if not self.container_exists(c_id):
+            return None
+        return sum(1 for _ in self.iter_members(c_id))
+
+    def ls_members_many(self, c_ids, limit):
+        """
+        The first page of members of each of the containers, as a dict of
+        c_id -> (next_cursor, page), with None for containers that don't exist
+        """
+        return {
+            c_id: self.ls_members(c_id, "0", limit) if self.container_exists(c_id) else None
+            for c_id in c_ids
+        }
+
+    def ls_member_containers(self, m_id, cursor, limit):
+        """
+        Page through the ids of the containers holding m_id, in id order
+
+        This fallback checks every container in turn, backends should keep
+        a reverse index instead.
+        """
+        c_ids = []
+        next_cursor = cursor
+        while next_cursor is not None and len(c_ids) <= limit:
+            next_cursor, page = self.ls_containers(next_cursor, limit)
+            c_ids.extend(x for x in page if self.member_exists(x, m_id))
+        if len(c_ids) > limit:
+            return encode_cursor(c_ids[limit - 1]), c_ids[:limit]
+        return None, c_ids
+
+    def containers_version(self):
+        """
+        A number which changes whenever a container is minted or removed,
+        or None if the backend doesn't keep track
+
+        Used to tag container listings for conditional requests.
+        """
+        return None
+
+    def container_version(self, c_id):
+        """
+        A number which changes whenever the container's members change or
+        it is removed, or None if the backend doesn't keep track (or the
+        container doesn't exist)
+
+        Used to tag member listings and members for conditional requests.
+        """
+        return None
+
+
+class MemberList:
+    """
+    An insertion ordered sequence of member ids with O(1) membership
+    tests and removals
+
+    Removed members leave a tombstone (None) in their slot, so the slots
+    of everything else, and the keyset cursors handed out against them,
+    stay put. Tombstones are compacted away once they outnumber the live
+    members.
+    """
+    TOMBSTONE = None
+
+    def __init__(self, allow_duplicates=True):
+        self.allow_duplicates = allow_duplicates
+        # Member ids in insertion order, None where one has been removed
+        self.slots = []
+        # The insertion sequence number of each slot, always ascending
+        self.seqs = array('Q')
+        # member id -> its slot, or a list of its slots (oldest first)
+        # if it is present more than once
+        self.positions = {}
+        self.next_seq = 0
+        self.removed = 0
+
+    def __len__(self):
+        return len(self.slots) - self.removed
+
+    def __contains__(self, m_id):
+        return m_id in self.positions
+
+    def __iter__(self):
+        return (m_id for m_id in self.slots if m_id is not None)
+
+    def append(self, m_id):
+        pos = self.positions.get(m_id)
+        if pos is not None:
+            if not self.allow_duplicates:
+                return False
+            if isinstance(pos, list):
+                pos.append(len(self.slots))
+            else:
+                self.positions[m_id] = [pos, len(self.slots)]
+        else:
+            self.positions[m_id] = len(self.slots)
+        self.slots.append(m_id)
+        self.seqs.append(self.next_seq)
+        self.next_seq += 1
+        return True
+
+    def remove(self, m_id):
+        """
+        Remove the oldest occurrence of m_id, returning whether there was one
+        """
+        pos = self.positions.get(m_id)
+        if pos is None:
+            return False
+        if isinstance(pos, list):
+            slot = pos.pop(0)
+            if len(pos) == 1:
+                self.positions[m_id] = pos[0]
+        else:
+            slot = pos
+            del self.positions[m_id]
+        self.slots[slot] = None
+        self.removed += 1
+        if self.removed > len(self):
+            self.compact()
+        return True
+
+    @classmethod
+    def restore(cls, m_ids, seqs, next_seq, allow_duplicates=True):
+        """
+        Rebuild a MemberList from its live members and their sequence numbers
+        """
+        members = cls(allow_duplicates)
+        members.slots = m_ids
+        members.seqs = seqs
+        members.next_seq = next_seq
+        members.reindex()
+        return members
+
+    def compact(self):
+        live = [i for i, m_id in enumerate(self.slots) if m_id is not None]
+        self.slots = [self.slots[i] for i in live]
+        self.seqs = array('Q', (self.seqs[i] for i in live))
+        self.removed = 0
+        self.reindex()
+
+    def reindex(self):
+        # Most containers hold no duplicates, which dict() can index alone
+        self.positions = dict(zip(self.slots, range(len(self.slots))))
+        if len(self.positions) == len(self.slots):
+            return
+        self.positions = {}
+        for slot, m_id in enumerate(self.slots):
+            pos = self.positions.get(m_id)
+            if pos is None:
+                self.positions[m_id] = slot
+            elif isinstance(pos, list):
+                pos.append(slot)
+            else:
+                self.positions[m_id] = [pos, slot]
+
+    def page(self, limit, offset=None, after=None):
+        """
+        Return up to limit live members, starting either offset live members
+        in or just past the member with sequence number after, along with
+        the sequence number to resume from (None if nothing follows).
+        """
+        tombstone = self.TOMBSTONE
+        if after is not None:
+            slot = bisect_right(self.seqs, after)
+        elif not self.removed:
+            slot = offset
+        else:
+            slot = 0
+            while offset > 0 and slot < len(self.slots):
+                if self.slots[slot] != tombstone:
+                    offset -= 1
+                slot += 1
+        page = []
+        last = None
+        while slot < len(self.slots):
+            m_id = self.slots[slot]
+            if m_id != tombstone:
+                if len(page) == limit:
+                    return page, None if last is None else self.seqs[last]
+                page.append(m_id)
+                last = slot
+            slot += 1
+        return page, None
+
+
+class CompactMemberList:
+    """
+    The members of a container in compact mode, as symbols in an array
+
+    Membership is answered by the backend's index of which containers hold
+    each symbol, so unlike MemberList there are no per-member positions,
+    and removals look for the slot to clear in the array instead.
+
+    Until a compaction first leaves gaps in them, each slot's sequence
+    number is its index, so they aren't stored.
+    """
+    TOMBSTONE = 0xFFFFFFFF
+
+    __slots__ = ("key", "ordinal", "version", "slots", "stored_seqs", "next_seq", "removed")
+
+    def __init__(self, key, ordinal, version):
+        self.key = key
+        # The container's number in the backend's index
+        self.ordinal = ordinal
+        self.version = version
+        self.slots = array('I')
+        self.stored_seqs = None
+        self.next_seq = 0
+        self.removed = 0
+
+    __len__ = MemberList.__len__
+    page = MemberList.page
+
+    @property
+    def seqs(self):
+        return range(len(self.slots)) if self.stored_seqs is None else self.stored_seqs
+
+    def __contains__(self, sym):
+        return sym in self.slots
+
+    def __iter__(self):
+        return (sym for sym in self.slots if sym != self.TOMBSTONE)
+
+    def append(self, sym):
+        self.slots.append(sym)
+        if self.stored_seqs is not None:
+            self.stored_seqs.append(self.next_seq)
+        self.next_seq += 1
+
+    def remove(self, sym):
+        try:
+            slot = self.slots.index(sym)
+        except ValueError:
+            return False
+        self.slots[slot] = self.TOMBSTONE
+        self.removed += 1
+        if self.removed > len(self):
+            self.compact()
+        return True
+
+    def compact(self):
+        seqs = self.seqs
+        live = [i for i, sym in enumerate(self.slots) if sym != self.TOMBSTONE]
+        self.stored_seqs = array('Q', (seqs[i] for i in live))
+        self.slots = array('I', (self.slots[i] for i in live))
+        self.removed = 0
+
 
 class RAMStorageBackend(IStorageBackend):
     def __init__(self, bp):
+        self.mint_ids = minter(bp.config.get("ID_SCHEME", "uuid4"))
         self.data = {}
+        self.allow_duplicate_members = bp.config.get("RAM_ALLOW_DUPLICATE_MEMBERS", True)
+        # Container ids, kept sorted as they are minted and removed so
+        # listings never have to sort the whole keyspace.
+        self.c_ids = []
+        # Versions are drawn from a single counter starting at the current
+        # time, so they never repeat, even across restarts.
+        self.version_counter = count(time_ns())
+        self.versions = {}
+        self.root_version = next(self.version_counter)
+        # member id -> ids of the containers holding it, or None until
+        # something asks for it if it wasn't built up alongside the data
+        self.member_containers = {}
 
     def mint_container(self):
-        new_c_id = uuid4().hex
-        self.data[new_c_id] = []
-        return new_c_id
+        return self.mint_containers(1)[0]
+
+    def mint_containers(self, num):
+        return self.create_containers(self.mint_ids(num))
+
+    def create_containers(self, new_c_ids):
+        """
+        Add empty containers with the given (new) ids
+        """
+        for new_c_id in new_c_ids:
+            self.data[new_c_id] = MemberList(self.allow_duplicate_members)
+            self.versions[new_c_id] = next(self.version_counter)
+            # Time ordered ids always land at the end, making this an append
+            insort(self.c_ids, new_c_id)
+        self.root_version = next(self.version_counter)
+        return new_c_ids
 
     def rm_container(self, c_id):
         try:
-            del self.data[c_id]
+            members = self.data.pop(c_id)
         except KeyError:
             pass
+        else:
+            if self.member_containers is not None:
+                for m_id in members.positions:
+                    self.unindex_member(c_id, m_id)
+            del self.c_ids[bisect_left(self.c_ids, c_id)]
+            del self.versions[c_id]
+            self.root_version = next(self.version_counter)
         return c_id
 
     def ls_containers(self, cursor, limit):
-        def peek(cursor, limit):
-            try:
-                sorted(self.data.keys())[cursor + limit]
-                return str(cursor + limit)
-            except IndexError:
-                return None
-        cursor = int(cursor)
-        return peek(cursor, limit), list(sorted(self.data.keys()))[cursor:cursor + limit]
+        return page_sorted(self.c_ids, cursor, limit)
 
     def add_member(self, c_id, m_id):
-        self.data[c_id].append(m_id)
+        if self.data[c_id].append(m_id):
+            self.versions[c_id] = next(self.version_counter)
+            if self.member_containers is not None:
+                self.member_containers.setdefault(m_id, set()).add(c_id)
         return m_id
 
     def rm_member(self, c_id, m_id):
-        try:
-            self.data[c_id].remove(m_id)
-        except ValueError:
-            pass
+        members = self.data[c_id]
+        if members.remove(m_id):
+            self.versions[c_id] = next(self.version_counter)
+            if m_id not in members and self.member_containers is not None:
+                self.unindex_member(c_id, m_id)
         return m_id
 
+    def unindex_member(self, c_id, m_id):
+        c_ids = self.member_containers[m_id]
+        c_ids.discard(c_id)
+        if not c_ids:
+            del self.member_containers[m_id]
+
     def ls_members(self, c_id, cursor, limit):
-        def peek(cursor, limit):
-            try:
-                self.data[c_id][cursor + limit]
-                return str(cursor + limit)
-            except IndexError:
-                return None
-        cursor = int(cursor)
-        return peek(cursor, limit), self.data[c_id][cursor:cursor + limit]
+        offset, after = decode_cursor(cursor)
+        if after is not None:
+            after = int(after)
+        page, next_seq = self.data[c_id].page(limit, offset=offset, after=after)
+        return None if next_seq is None else encode_cursor(str(next_seq)), page
+
+    def count_members(self, c_id):
+        members = self.data.get(c_id)
+        return None if members is None else len(members)
 
     def container_exists(self, c_id):
         return c_id in self.data.keys()
@@ -156,111 +544,969 @@ class RAMStorageBackend(IStorageBackend):
         except KeyError:
             return False
 
+    def members_exist(self, c_id, m_ids):
+        members = self.data.get(c_id, ())
+        return [m_id in members for m_id in m_ids]
+
+    def iter_members(self, c_id, chunk_size=1000):
+        return iter(self.data[c_id])
+
+    def ls_members_many(self, c_ids, limit):
+        return {
+            c_id: self.ls_members(c_id, "0", limit) if c_id in self.data else None
+            for c_id in c_ids
+        }
+
+    def ls_member_containers(self, m_id, cursor, limit):
+        if self.member_containers is None:
+            self.member_containers = {}
+            for c_id, members in self.data.items():
+                for x in members.positions:
+                    self.member_containers.setdefault(x, set()).add(c_id)
+        return page_sorted(sorted(self.member_containers.get(m_id, ())), cursor, limit)
+
+    def containers_version(self):
+        return self.root_version
+
+    def container_version(self, c_id):
+        return self.versions.get(c_id)
+
+    def copy_state(self):
+        """
+        Copy the containers out, quickly, for iter_state() to take its time over
+        """
+        return [(c_id, members.slots[:], members.seqs[:], members.next_seq)
+                for c_id, members in self.data.items()]
+
+    def iter_state(self, state):
+        """
+        Generate the (c_id, member ids, their sequence numbers, next sequence
+        number) of every container in a copy_state()
+        """
+        for c_id, slots, seqs, next_seq in state:
+            yield (c_id, [x for x in slots if x is not None],
+                   array('Q', (seq for x, seq in zip(slots, seqs) if x is not None)), next_seq)
+
+    def load_state(self, containers):
+        """
+        Replace everything with the containers generated by iter_state()
+        """
+        self.data = {}
+        self.versions = {}
+        for c_id, m_ids, seqs, next_seq in containers:
+            self.data[c_id] = MemberList.restore(m_ids, seqs, next_seq,
+                                                 self.allow_duplicate_members)
+            self.versions[c_id] = next(self.version_counter)
+        # Sorting once beats inserting each id in order
+        self.c_ids = sorted(self.data)
+        # Indexing every member would take longer than loading them, leave
+        # the reverse index until it's first needed
+        self.member_containers = None
+        self.root_version = next(self.version_counter)
+
+
+class CompactRAMStorageBackend(RAMStorageBackend):
+    """
+    The RAM backend, holding the same data in a fraction of the memory
+
+    * Container ids (which have to be minted as 32 hex digits, by uuid4 or
+      uuid7) are kept as their 16 bytes
+    * Member ids are interned as symbols (ints) shared by every container,
+      which holds its members' symbols in an array (see CompactMemberList)
+    * Containers are numbered, and the number of the container holding each
+      symbol (or an array of them, if more than one does) serves as both
+      the membership and reverse index
+
+    Removing a member searches its container's array, so takes time in the
+    size of the container.
+    """
+    HEX_ID = re.compile("[0-9a-f]{32}")
+    # Past this many containers holding a member, their numbers are kept in
+    # a set instead of an array searched from end to end
+    MAX_HOLDERS_ARRAY = 32
+
+    def __init__(self, bp):
+        super().__init__(bp)
+        if bp.config.get("ID_SCHEME", "uuid4").lower() not in ("uuid4", "uuid7"):
+            raise RuntimeError("RAM_COMPACT requires an ID_SCHEME of uuid4 or uuid7")
+        # member id -> symbol
+        self.symbols = {}
+        # symbol -> member id, and symbol -> number(s) of the container(s)
+        # holding it, None for symbols that are free to reuse
+        self.names = []
+        self.holders = []
+        self.free_symbols = []
+        # container number -> CompactMemberList, None for numbers free to reuse
+        self.containers = []
+        self.free_ordinals = []
+
+    def key(self, c_id):
+        if self.HEX_ID.fullmatch(c_id) is None:
+            raise KeyError(c_id)
+        return bytes.fromhex(c_id)
+
+    def members(self, c_id):
+        return self.data[self.key(c_id)]
+
+    def intern(self, m_id):
+        sym = self.symbols.get(m_id)
+        if sym is None:
+            if self.free_symbols:
+                sym = self.free_symbols.pop()
+                self.names[sym] = m_id
+            else:
+                sym = len(self.names)
+                self.names.append(m_id)
+                self.holders.append(None)
+            self.symbols[m_id] = sym
+        return sym
+
+    def holds(self, sym, ordinal):
+        if sym is None:
+            return False
+        holders = self.holders[sym]
+        if type(holders) is int:
+            return holders == ordinal
+        return holders is not None and ordinal in holders
+
+    def index(self, sym, ordinal):
+        holders = self.holders[sym]
+        if holders is None:
+            self.holders[sym] = ordinal
+        elif type(holders) is int:
+            if holders != ordinal:
+                self.holders[sym] = array('I', [holders, ordinal])
+        elif isinstance(holders, set):
+            holders.add(ordinal)
+        elif ordinal not in holders:
+            holders.append(ordinal)
+            if len(holders) > self.MAX_HOLDERS_ARRAY:
+                self.holders[sym] = set(holders)
+
+    def unindex(self, sym, ordinal):
+        holders = self.holders[sym]
+        if type(holders) is not int:
+            holders.remove(ordinal)
+            if len(holders) == 1:
+                self.holders[sym] = holders.pop()
+            return
+        # Nothing holds the member any more, free its symbol
+        del self.symbols[self.names[sym]]
+        self.names[sym] = None
+        self.holders[sym] = None
+        self.free_symbols.append(sym)
+
+    def add_container(self, key):
+        if self.free_ordinals:
+            ordinal = self.free_ordinals.pop()
+        else:
+            ordinal = len(self.containers)
+            self.containers.append(None)
+        members = CompactMemberList(key, ordinal, next(self.version_counter))
+        self.containers[ordinal] = members
+        self.data[key] = members
+        return members
+
+    def create_containers(self, new_c_ids):
+        for new_c_id in new_c_ids:
+            key = self.key(new_c_id)
+            self.add_container(key)
+            insort(self.c_ids, key)
+        self.root_version = next(self.version_counter)
+        return new_c_ids
+
+    def rm_container(self, c_id):
+        try:
+            members = self.members(c_id)
+        except KeyError:
+            return c_id
+        del self.data[members.key]
+        for sym in set(members):
+            self.unindex(sym, members.ordinal)
+        self.containers[members.ordinal] = None
+        self.free_ordinals.append(members.ordinal)
+        del self.c_ids[bisect_left(self.c_ids, members.key)]
+        self.root_version = next(self.version_counter)
+        return c_id
+
+    def ls_containers(self, cursor, limit):
+        offset, after = decode_cursor(cursor)
+        if after is not None:
+            offset = bisect_right(self.c_ids, bytes.fromhex(after))
+        page = self.c_ids[offset:offset + limit]
+        if page and offset + len(page) < len(self.c_ids):
+            return encode_cursor(page[-1].hex()), [x.hex() for x in page]
+        return None, [x.hex() for x in page]
+
+    def add_to(self, members, m_id):
+        sym = self.intern(m_id)
+        if self.allow_duplicate_members or not self.holds(sym, members.ordinal):
+            members.append(sym)
+            members.version = next(self.version_counter)
+            self.index(sym, members.ordinal)
+        return m_id
+
+    def remove_from(self, members, m_id):
+        sym = self.symbols.get(m_id)
+        if self.holds(sym, members.ordinal) and members.remove(sym):
+            members.version = next(self.version_counter)
+            if not self.allow_duplicate_members or sym not in members:
+                self.unindex(sym, members.ordinal)
+        return m_id
+
+    def add_member(self, c_id, m_id):
+        return self.add_to(self.members(c_id), m_id)
+
+    def add_members(self, c_id, m_ids):
+        # Looking the container up once for all of them
+        members = self.members(c_id)
+        return [self.add_to(members, m_id) for m_id in m_ids]
+
+    def rm_member(self, c_id, m_id):
+        return self.remove_from(self.members(c_id), m_id)
+
+    def rm_members(self, c_id, m_ids):
+        members = self.members(c_id)
+        return [self.remove_from(members, m_id) for m_id in m_ids]
+
+    def ls_members(self, c_id, cursor, limit):
+        offset, after = decode_cursor(cursor)
+        if after is not None:
+            after = int(after)
+        page, next_seq = self.members(c_id).page(limit, offset=offset, after=after)
+        names = self.names
+        return None if next_seq is None else encode_cursor(str(next_seq)), \
+            [names[x] for x in page]
+
+    def count_members(self, c_id):
+        try:
+            return len(self.members(c_id))
+        except KeyError:
+            return None
+
+    def container_exists(self, c_id):
+        return self.HEX_ID.fullmatch(c_id) is not None and bytes.fromhex(c_id) in self.data
+
+    def member_exists(self, c_id, m_id):
+        return self.members_exist(c_id, [m_id])[0]
+
+    def members_exist(self, c_id, m_ids):
+        if not self.container_exists(c_id):
+            return [False for _ in m_ids]
+        ordinal = self.data[bytes.fromhex(c_id)].ordinal
+        return [self.holds(self.symbols.get(m_id), ordinal) for m_id in m_ids]
+
+    def iter_members(self, c_id, chunk_size=1000):
+        members = self.members(c_id)
+        names = self.names
+        return (names[x] for x in members)
+
+    def ls_members_many(self, c_ids, limit):
+        return {
+            c_id: self.ls_members(c_id, "0", limit) if self.container_exists(c_id) else None
+            for c_id in c_ids
+        }
+
+    def ls_member_containers(self, m_id, cursor, limit):
+        sym = self.symbols.get(m_id)
+        holders = () if sym is None else self.holders[sym]
+        if type(holders) is int:
+            holders = (holders,)
+        return page_sorted(sorted(self.containers[x].key.hex() for x in holders),
+                           cursor, limit)
+
+    def container_version(self, c_id):
+        try:
+            return self.members(c_id).version
+        except KeyError:
+            return None
+
+    def copy_state(self):
+        return self.names[:], [
+            (members.key, members.slots[:],
+             None if members.stored_seqs is None else members.stored_seqs[:], members.next_seq)
+            for members in self.data.values()
+        ]
+
+    def iter_state(self, state):
+        names, containers = state
+        tombstone = CompactMemberList.TOMBSTONE
+        for key, slots, seqs, next_seq in containers:
+            if seqs is None:
+                seqs = range(len(slots))
+            yield (key.hex(), [names[x] for x in slots if x != tombstone],
+                   array('Q', (seq for x, seq in zip(slots, seqs) if x != tombstone)), next_seq)
+
+    def load_state(self, containers):
+        self.data = {}
+        self.symbols = {}
+        self.names = []
+        self.holders = []
+        self.free_symbols = []
+        self.containers = []
+        self.free_ordinals = []
+        for c_id, m_ids, seqs, next_seq in containers:
+            members = self.add_container(self.key(c_id))
+            members.slots = array('I', [self.intern(m_id) for m_id in m_ids])
+            members.next_seq = next_seq
+            # Ascending sequence numbers ending at one less than their count
+            # can only be the slot indexes, which needn't be stored
+            if next_seq != len(seqs) or (seqs and seqs[-1] != len(seqs) - 1):
+                members.stored_seqs = seqs
+            for sym in set(members.slots):
+                self.index(sym, members.ordinal)
+        self.c_ids = sorted(self.data)
+        self.root_version = next(self.version_counter)
+
+
+class JournaledRAMStorageBackend(RAMStorageBackend):
+    """
+    The RAM backend, made durable by journaling every change to disk before
+    acknowledging it and periodically snapshotting everything
+
+    Changes are applied and journaled under a lock, so the journal holds
+    them in the order they were applied, but the wait for the journal to
+    reach the disk happens outside it, letting concurrent writers share
+    fsyncs. (Until then, readers may already see a change.)
+
+    Once a journal write fails the backend is read-only: every write raises
+    IOError, and no more snapshots are taken, so a restart comes back to
+    what was journaled. Changes that failed to reach the journal stay
+    visible until then, though their writers were told they failed.
+
+    On startup the latest snapshot is loaded and then every journal file
+    written since it is replayed.
+    """
+    def __init__(self, bp):
+        super().__init__(bp)
+        self.directory = bp.config["RAM_JOURNAL_DIR"]
+        os.makedirs(self.directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.snapshot_lock = threading.Lock()
+        generation = self.restore()
+        self.journal = journal.Journal(self.directory, generation,
+                                       bp.config.get("RAM_JOURNAL_COMMIT_DELAY", 0))
+        self.snapshot_ticket = self.journal.appended
+        self.snapshot_interval = bp.config.get("RAM_SNAPSHOT_INTERVAL", 300)
+        self.stopped = threading.Event()
+        self.snapshotter = None
+        if self.snapshot_interval:
+            self.snapshotter = threading.Thread(target=self.snapshot_periodically,
+                                                name="idnest-snapshot", daemon=True)
+            self.snapshotter.start()
+
+    def restore(self):
+        """
+        Load the latest snapshot and replay the journal since it, returning
+        the generation of the last journal file
+        """
+        generation = 0
+        snapshot = os.path.join(self.directory, journal.SNAPSHOT_NAME)
+        if os.path.exists(snapshot):
+            generation, containers = journal.read_snapshot(snapshot)
+            self.load_state(containers)
+            log.info("Loaded {} containers from {}".format(len(containers), snapshot))
+        for x in journal.journal_generations(self.directory):
+            if x < generation:
+                continue
+            for op, ids in journal.read_journal(journal.journal_path(self.directory, x)):
+                self.apply(op, ids)
+            generation = x
+        return generation
+
+    def apply(self, op, ids):
+        # Straight to the (unjournaled) implementation this is mixed into
+        if op == journal.MINT:
+            super().create_containers(ids)
+        elif op == journal.RM_CONTAINERS:
+            for c_id in ids:
+                super().rm_container(c_id)
+        elif op == journal.ADD_MEMBERS:
+            for m_id in ids[1:]:
+                super().add_member(ids[0], m_id)
+        elif op == journal.RM_MEMBERS:
+            for m_id in ids[1:]:
+                super().rm_member(ids[0], m_id)
+        else:
+            raise ValueError("Unknown journal operation: {}".format(op))
+
+    def write(self, op, ids):
+        """
+        Apply a change and return once it has been journaled
+        """
+        with self.lock:
+            # Only journal changes that will replay cleanly
+            if op in (journal.ADD_MEMBERS, journal.RM_MEMBERS) and \
+                    not self.container_exists(ids[0]):
+                raise KeyError(ids[0])
+            # Journaled first, which refuses the change once the journal
+            # has failed
+            ticket = self.journal.append(op, ids)
+            self.apply(op, ids)
+        self.journal.wait(ticket)
+
+    def mint_container(self):
+        return self.mint_containers(1)[0]
+
+    def create_containers(self, new_c_ids):
+        new_c_ids = list(new_c_ids)
+        if new_c_ids:
+            self.write(journal.MINT, new_c_ids)
+        return new_c_ids
+
+    def rm_container(self, c_id):
+        return self.rm_containers([c_id])[0]
+
+    def rm_containers(self, c_ids):
+        c_ids = list(c_ids)
+        if c_ids:
+            self.write(journal.RM_CONTAINERS, c_ids)
+        return c_ids
+
+    def add_member(self, c_id, m_id):
+        return self.add_members(c_id, [m_id])[0]
+
+    def add_members(self, c_id, m_ids):
+        m_ids = list(m_ids)
+        if m_ids:
+            self.write(journal.ADD_MEMBERS, [c_id] + m_ids)
+        return m_ids
+
+    def rm_member(self, c_id, m_id):
+        return self.rm_members(c_id, [m_id])[0]
+
+    def rm_members(self, c_id, m_ids):
+        m_ids = list(m_ids)
+        if m_ids:
+            self.write(journal.RM_MEMBERS, [c_id] + m_ids)
+        return m_ids
+
+    def snapshot(self):
+        """
+        Write a snapshot of everything, after which the journal files it
+        covers are removed
+        """
+        with self.snapshot_lock:
+            with self.lock:
+                if self.journal.error is not None:
+                    raise IOError("Journal write failed: {}".format(self.journal.error))
+                # Copying is far quicker than encoding, hold writers up only
+                # for that
+                generation = self.journal.rotate()
+                self.snapshot_ticket = self.journal.appended
+                state = self.copy_state()
+            journal.write_snapshot(os.path.join(self.directory, journal.SNAPSHOT_NAME),
+                                   generation, self.iter_state(state))
+            for x in journal.journal_generations(self.directory):
+                if x < generation:
+                    os.remove(journal.journal_path(self.directory, x))
+            journal.fsync_directory(self.directory)
+            return generation
+
+    def snapshot_periodically(self):
+        while not self.stopped.wait(self.snapshot_interval):
+            # Nothing to do if nothing was written since the last one, and
+            # nothing to trust in memory once the journal has failed
+            if self.journal.appended == self.snapshot_ticket or \
+                    self.journal.error is not None:
+                continue
+            try:
+                self.snapshot()
+            except Exception as e:
+                log.critical("Snapshot failed: {}".format(e))
+
+    def close(self):
+        self.stopped.set()
+        if self.snapshotter is not None:
+            self.snapshotter.join()
+        self.journal.close()
+
+
+class JournaledCompactRAMStorageBackend(JournaledRAMStorageBackend, CompactRAMStorageBackend):
+    """
+    The compact RAM backend, journaled
+    """
+
+
+def ram_storage_backend(config):
+    """
+    The flavour of RAM backend the configuration asks for
+    """
+    if config.get("RAM_JOURNAL_DIR"):
+        if config.get("RAM_COMPACT"):
+            return JournaledCompactRAMStorageBackend
+        return JournaledRAMStorageBackend
+    if config.get("RAM_COMPACT"):
+        return CompactRAMStorageBackend
+    return RAMStorageBackend
+
 
 class MongoStorageBackend(IStorageBackend):
+    """
+    One document per container, {'_id': c_id, 'members': [...], 'version': n},
+    with the version bumped by every change to the members.
+
+    The version of the container listing lives in the 'meta' collection.
+
+    A (multikey) index on members serves as the reverse index from members
+    to the containers holding them.
+    """
     def __init__(self, bp):
+        self.mint_ids = minter(bp.config.get("ID_SCHEME", "uuid4"))
         client = MongoClient(bp.config["MONGO_HOST"],
                              bp.config.get("MONGO_PORT", 27017))
         self.db = client[bp.config["MONGO_DB"]]
+        self.db.containers.create_index([('members', ASCENDING), ('_id', ASCENDING)])
 
     def mint_container(self):
-        id = uuid4().hex
-        self.db.containers.insert_one({'members': [], '_id': id})
+        id = self.mint_ids(1)[0]
+        self.db.containers.insert_one({'members': [], '_id': id, 'version': 0})
+        self.bump_containers_version()
         return id
 
     def rm_container(self, c_id):
-        self.db.containers.delete_one({'_id': c_id})
+        if self.db.containers.delete_one({'_id': c_id}).deleted_count:
+            self.bump_containers_version()
         return c_id
 
+    def bump_containers_version(self):
+        self.db.meta.update_one({'_id': 'containers'}, {'$inc': {'version': 1}}, upsert=True)
+
+    def mint_containers(self, num):
+        return self.create_containers(self.mint_ids(num))
+
+    def create_containers(self, c_ids):
+        ids = list(c_ids)
+        if not ids:
+            return ids
+        try:
+            self.db.containers.insert_many([{'members': [], '_id': x, 'version': 0}
+                                            for x in ids])
+        except BulkWriteError as e:
+            # Ordered inserts stop at the first error, so everything before
+            # it made it in and nothing after it did.
+            inserted = e.details['nInserted']
+            log.critical("Minted {} of {} containers before failing: {}".format(
+                inserted, len(ids), e.details['writeErrors']))
+            raise PartialBulkOperationError(
+                "Minted {} of {} containers".format(inserted, len(ids)),
+                succeeded=ids[:inserted], failed=ids[inserted:]
+            )
+        finally:
+            self.bump_containers_version()
+        return ids
+
+    def rm_containers(self, c_ids):
+        c_ids = list(c_ids)
+        if self.db.containers.delete_many({'_id': {'$in': c_ids}}).deleted_count:
+            self.bump_containers_version()
+        return c_ids
+
     def ls_containers(self, cursor, limit):
-        def peek(cursor, limit):
-            if len([str(x['_id']) for x in
-                    self.db.containers.find().sort('_id', ASCENDING).
-                    skip(cursor + limit).limit(1)]) > 0:
-                return str(cursor + limit)
-            else:
-                return None
-        cursor = int(cursor)
-        return peek(cursor, limit), \
-            [str(x['_id']) for x in self.db.containers.find()
-             .sort('_id', ASCENDING)
-             .skip(cursor).limit(limit)]
+        return self.page_containers({}, cursor, limit)
+
+    def page_containers(self, query, cursor, limit):
+        if limit < 1:
+            return None, []
+        offset, after = decode_cursor(cursor)
+        # Fetch one extra id to find out whether there is a next page
+        if after is not None:
+            results = self.db.containers.find(dict(query, _id={'$gt': after}), {'_id': 1})
+        else:
+            results = self.db.containers.find(query, {'_id': 1}).skip(offset)
+        page = [str(x['_id']) for x in results.sort('_id', ASCENDING).limit(limit + 1)]
+        if len(page) > limit:
+            del page[limit:]
+            return encode_cursor(page[-1]), page
+        return None, page
 
     def add_member(self, c_id, m_id):
-        r = self.db.containers.update_one({'_id': c_id}, {'$push': {'members': m_id}})
+        r = self.db.containers.update_one({'_id': c_id}, {'$push': {'members': m_id},
+                                                          '$inc': {'version': 1}})
         if r.modified_count < 1:
             raise KeyError
         return m_id
 
+    def add_members(self, c_id, m_ids):
+        m_ids = list(m_ids)
+        if not m_ids:
+            return m_ids
+        # A single document update is atomic: either every member lands or,
+        # if the container doesn't exist, none do.
+        r = self.db.containers.update_one({'_id': c_id},
+                                          {'$push': {'members': {'$each': m_ids}},
+                                           '$inc': {'version': 1}})
+        if r.matched_count < 1:
+            raise KeyError(c_id)
+        return m_ids
+
     def rm_member(self, c_id, m_id):
-        self.db.containers.update_one({'_id': c_id}, {'$pull': {'members': m_id}})
+        # Only match (and so only bump the version of) containers that hold m_id
+        self.db.containers.update_one({'_id': c_id, 'members': m_id},
+                                      {'$pull': {'members': m_id}, '$inc': {'version': 1}})
         return m_id
 
+    def rm_members(self, c_id, m_ids):
+        m_ids = list(m_ids)
+        self.db.containers.update_one({'_id': c_id, 'members': {'$in': m_ids}},
+                                      {'$pullAll': {'members': m_ids}, '$inc': {'version': 1}})
+        return m_ids
+
     def ls_members(self, c_id, cursor, limit):
-        def peek(cursor, limit, members):
-            try:
-                members[cursor + limit]
-                return str(cursor + limit)
-            except IndexError:
-                return None
-        cursor = int(cursor)
-        c = self.db.containers.find_one({'_id': c_id})
-        return peek(cursor, limit, c['members']), c['members'][cursor:cursor + limit]
+        offset, _ = decode_cursor(cursor)
+        if offset is None:
+            raise ValueError("Member cursors are offsets in this backend")
+        if limit < 1:
+            return None, []
+        # Let the server cut the page (plus one member, to find out whether
+        # there is a next page) out of the members array
+        c = self.db.containers.find_one(
+            {'_id': c_id}, {'_id': 0, 'members': {'$slice': [offset, limit + 1]}}
+        )
+        if c is None:
+            raise KeyError(c_id)
+        page = c['members']
+        if len(page) > limit:
+            return str(offset + limit), page[:limit]
+        return None, page
+
+    def count_members(self, c_id):
+        # Sized server side, so only the count comes back
+        for c in self.db.containers.aggregate([
+                {'$match': {'_id': c_id}},
+                {'$project': {'_id': 0, 'count': {'$size': '$members'}}}
+        ]):
+            return c['count']
+        return None
 
     def container_exists(self, c_id):
-        return bool(self.db.containers.find_one({'_id': c_id}))
+        return self.db.containers.find_one({'_id': c_id}, {'_id': 1}) is not None
 
     def member_exists(self, c_id, m_id):
-        c = self.db.containers.find_one({'_id': c_id})
+        return self.db.containers.find_one({'_id': c_id, 'members': m_id}, {'_id': 1}) \
+            is not None
+
+    def members_exist(self, c_id, m_ids):
+        m_ids = list(m_ids)
+        # Intersect server side so only the matching ids come back
+        present = set()
+        for x in self.db.containers.aggregate([
+                {'$match': {'_id': c_id}},
+                {'$project': {'_id': 0, 'present': {'$setIntersection': ['$members', m_ids]}}}
+        ]):
+            present.update(x['present'])
+        return [m_id in present for m_id in m_ids]
+
+    def ls_members_many(self, c_ids, limit):
+        c_ids = list(c_ids)
+        limit = max(limit, 0)
+        results = dict.fromkeys(c_ids)
+        for c in self.db.containers.find({'_id': {'$in': c_ids}},
+                                         {'members': {'$slice': limit + 1}}):
+            page = c['members']
+            if len(page) > limit:
+                results[c['_id']] = (str(limit), page[:limit])
+            else:
+                results[c['_id']] = (None, page)
+        return results
+
+    def iter_members(self, c_id, chunk_size=1000):
+        # Unwinding server side lets the cursor stream the members array
+        # rather than shipping it as a single document
+        results = self.db.containers.aggregate([
+            {'$match': {'_id': c_id}},
+            {'$project': {'_id': 0, 'members': 1}},
+            {'$unwind': '$members'}
+        ], batchSize=chunk_size)
+        for x in results:
+            yield x['members']
+
+    def ls_member_containers(self, m_id, cursor, limit):
+        return self.page_containers({'members': m_id}, cursor, limit)
+
+    def containers_version(self):
+        meta = self.db.meta.find_one({'_id': 'containers'})
+        return 0 if meta is None else meta['version']
+
+    def container_version(self, c_id):
+        c = self.db.containers.find_one({'_id': c_id}, {'_id': 0, 'version': 1})
         if c is None:
-            return False
-        return m_id in c['members']
+            return None
+        # Containers minted before versions were kept start out at 0
+        return c.get('version', 0)
 
 
 class RedisStorageBackend(IStorageBackend):
+    """
+    Each container is a list keyed by its id, holding a sentinel 0 (to keep
+    Redis from deleting the key while the container is empty) followed by
+    its members in insertion order.
+
+    Alongside it "<c_id>:index" is a hash of member id -> number of
+    occurrences, so membership checks never have to walk the list.
+
+    Every container id is also registered in a sorted set, all scored 0 so
+    that it sorts lexically, which ls_containers pages through.
+
+    "<c_id>:version" counts changes to the container's members, and
+    "idnest:containers_version" changes to the set of containers.
+
+    "idnest:member:<m_id>" is a sorted set, like the registry, of the ids
+    of the containers holding m_id.
+    """
+    # Bumped whenever the key layout changes, see migrate()
+    SCHEMA_VERSION = 3
+    SCHEMA_VERSION_KEY = "idnest:schema_version"
+    CONTAINERS_KEY = "idnest:containers"
+    CONTAINERS_VERSION_KEY = "idnest:containers_version"
+    MEMBER_KEY_PREFIX = "idnest:member:"
+
+    # Scripts run atomically server side, so nothing can remove a container
+    # between checking it exists and writing to it, and each batch of ids
+    # costs a single round trip.
+
+    # Only ids in the registry are containers, any other key (our own
+    # included) is left alone.
+
+    # KEYS: member list (whose key is the container id), member index,
+    #       container version, container registry, then the reverse index
+    #       key of each member id
+    # ARGV: member ids
+    # Returns the new length of the list, or -1 if the container doesn't exist
+    ADD_MEMBERS_SCRIPT = """
+if not redis.call('ZSCORE', KEYS[4], KEYS[1]) then
+    return -1
+end
+local length = 0
+-- unpack() is bounded by the Lua stack, so push in chunks
+for i = 1, #ARGV, 1000 do
+    length = redis.call('RPUSH', KEYS[1], unpack(ARGV, i, math.min(i + 999, #ARGV)))
+end
+for i, m_id in ipairs(ARGV) do
+    if redis.call('HINCRBY', KEYS[2], m_id, 1) == 1 then
+        redis.call('ZADD', KEYS[4 + i], 0, KEYS[1])
+    end
+end
+redis.call('INCR', KEYS[3])
+return length
+"""
+
+    # KEYS: member list (whose key is the container id), member index,
+    #       container version, container registry, then the reverse index
+    #       key of each member id
+    # ARGV: member ids
+    # Returns how many of the ids were present to be removed
+    RM_MEMBERS_SCRIPT = """
+if not redis.call('ZSCORE', KEYS[4], KEYS[1]) then
+    return 0
+end
+local removed = 0
+for i, m_id in ipairs(ARGV) do
+    if redis.call('HEXISTS', KEYS[2], m_id) == 1 then
+        if m_id == '0' then
+            -- LREM works from the head, so get the sentinel out of its way
+            redis.call('LPOP', KEYS[1])
+            redis.call('LREM', KEYS[1], 1, m_id)
+            redis.call('LPUSH', KEYS[1], 0)
+        else
+            redis.call('LREM', KEYS[1], 1, m_id)
+        end
+        if redis.call('HINCRBY', KEYS[2], m_id, -1) < 1 then
+            redis.call('HDEL', KEYS[2], m_id)
+            redis.call('ZREM', KEYS[4 + i], KEYS[1])
+        end
+        removed = removed + 1
+    end
+end
+if removed > 0 then
+    redis.call('INCR', KEYS[3])
+end
+return removed
+"""
+
+    # The reverse index keys to update depend on what is in the containers,
+    # so unlike the others this script has to build key names itself.
+    # KEYS: container registry, container listing version
+    # ARGV: reverse index key prefix, then container ids
+    # Returns how many of the ids were containers to be removed
+    RM_CONTAINERS_SCRIPT = """
+local removed = 0
+for i = 2, #ARGV do
+    local c_id = ARGV[i]
+    if redis.call('ZSCORE', KEYS[1], c_id) then
+        local index_key = c_id .. ':index'
+        for _, m_id in ipairs(redis.call('HKEYS', index_key)) do
+            redis.call('ZREM', ARGV[1] .. m_id, c_id)
+        end
+        redis.call('DEL', c_id, index_key, c_id .. ':version')
+        redis.call('ZREM', KEYS[1], c_id)
+        removed = removed + 1
+    end
+end
+if removed > 0 then
+    redis.call('INCR', KEYS[2])
+end
+return removed
+"""
+
     def __init__(self, bp):
+        self.mint_ids = minter(bp.config.get("ID_SCHEME", "uuid4"))
         self.r = redis.StrictRedis(
             host=bp.config["REDIS_HOST"],
             port=bp.config.get("REDIS_PORT", 6379),
             db=bp.config["REDIS_DB"]
         )
+        self.add_members_script = self.r.register_script(self.ADD_MEMBERS_SCRIPT)
+        self.rm_members_script = self.r.register_script(self.RM_MEMBERS_SCRIPT)
+        self.rm_containers_script = self.r.register_script(self.RM_CONTAINERS_SCRIPT)
+        self.migrate()
+
+    @staticmethod
+    def index_key(c_id):
+        return "{}:index".format(c_id)
+
+    @staticmethod
+    def version_key(c_id):
+        return "{}:version".format(c_id)
+
+    @classmethod
+    def container_keys(cls, c_id):
+        return [c_id, cls.index_key(c_id), cls.version_key(c_id)]
+
+    @classmethod
+    def members_script_keys(cls, c_id, m_ids):
+        """
+        The KEYS of the scripts adding and removing members
+        """
+        return cls.container_keys(c_id) + [cls.CONTAINERS_KEY] + \
+            [cls.member_key(m_id) for m_id in m_ids]
+
+    @classmethod
+    def member_key(cls, m_id):
+        return cls.MEMBER_KEY_PREFIX + m_id
+
+    @staticmethod
+    def is_container_key(key):
+        # Container ids never contain a ":", everything else we store does
+        return b":" not in key
+
+    @staticmethod
+    def is_container_id(c_id):
+        """
+        Whether c_id could name a container at all
+
+        Ids with a ":" in them are never looked up, as the keys built from
+        them could be some other container's (or our own).
+        """
+        return ":" not in c_id
+
+    def migrate(self):
+        """
+        Bring a database written by an older version of this backend up to
+        the current key layout
+        """
+        version = int(self.r.get(self.SCHEMA_VERSION_KEY) or 0)
+        if version >= self.SCHEMA_VERSION:
+            return
+        log.warning("Migrating redis storage from schema version {} to {}".format(
+            version, self.SCHEMA_VERSION))
+        if version < 1:
+            # Version 0 containers were bare lists, build their member indexes
+            for key in self.r.scan_iter():
+                if not self.is_container_key(key) or self.r.type(key) != b"list":
+                    continue
+                counts = {}
+                for m_id in self.r.lrange(key, 1, -1):
+                    counts[m_id] = counts.get(m_id, 0) + 1
+                index_key = self.index_key(key.decode("utf-8"))
+                with self.r.pipeline() as p:
+                    p.delete(index_key)
+                    if counts:
+                        p.hset(index_key, mapping=counts)
+                    p.execute()
+        if version < 2:
+            # Register every existing container
+            for key in self.r.scan_iter():
+                if self.is_container_key(key) and self.r.type(key) == b"list":
+                    self.r.zadd(self.CONTAINERS_KEY, {key: 0})
+        if version < 3:
+            # Build the reverse index from the member indexes
+            for c_id in self.r.zscan_iter(self.CONTAINERS_KEY):
+                c_id = c_id[0].decode("utf-8")
+                with self.r.pipeline() as p:
+                    for m_id in self.r.hkeys(self.index_key(c_id)):
+                        p.zadd(self.member_key(m_id.decode("utf-8")), {c_id: 0})
+                    p.execute()
+        self.r.set(self.SCHEMA_VERSION_KEY, self.SCHEMA_VERSION)
 
     def mint_container(self):
-        c_id = uuid4().hex
-        self.r.lpush(c_id, 0)
-        return c_id
+        return self.mint_containers(1)[0]
+
+    def mint_containers(self, num):
+        return self.create_containers(self.mint_ids(num))
+
+    def create_containers(self, c_ids):
+        c_ids = list(c_ids)
+        if c_ids:
+            with self.r.pipeline() as p:
+                for c_id in c_ids:
+                    p.lpush(c_id, 0)
+                p.zadd(self.CONTAINERS_KEY, {c_id: 0 for c_id in c_ids})
+                p.incr(self.CONTAINERS_VERSION_KEY)
+                p.execute()
+        return c_ids
 
     def rm_container(self, c_id):
-        self.r.delete(c_id)
-        return c_id
+        return self.rm_containers([c_id])[0]
+
+    def rm_containers(self, c_ids):
+        c_ids = list(c_ids)
+        valid = [c_id for c_id in c_ids if self.is_container_id(c_id)]
+        if valid:
+            self.rm_containers_script(keys=[self.CONTAINERS_KEY, self.CONTAINERS_VERSION_KEY],
+                                      args=[self.MEMBER_KEY_PREFIX] + valid)
+        return c_ids
 
     def ls_containers(self, cursor, limit):
-        results = []
-        # Using count here is weird, as redis doesn't garuntee that
-        # the number of returned elements is _exactly_ the count
-        # argument. See https://redis.io/commands/scan. Thus
-        # This implementation gets a little fuzzy, and things may actually
-        # return a # of elements slightly greater than limit at the moment
-        while cursor != 0 and limit > 0:
-            cursor, data = self.r.scan(cursor=cursor)
-            if limit:
-                limit = limit - len(data)
-            for item in data:
-                results.append(item)
-        return None if cursor == 0 else str(cursor), [x.decode("utf-8") for x in results]
+        return self.page_lex(self.CONTAINERS_KEY, cursor, limit)
+
+    def page_lex(self, key, cursor, limit):
+        """
+        Page through a sorted set whose members are all scored 0
+        """
+        if limit < 1:
+            return None, []
+        offset, after = decode_cursor(cursor)
+        # Fetch one extra id to find out whether there is a next page
+        if after is not None:
+            page = self.r.zrangebylex(key, "(" + after, "+", start=0, num=limit + 1)
+        else:
+            page = self.r.zrange(key, offset, offset + limit)
+        page = [x.decode("utf-8") for x in page]
+        if len(page) > limit:
+            del page[limit:]
+            return encode_cursor(page[-1]), page
+        return None, page
 
     def container_exists(self, c_id):
-        return c_id in self.r
+        return self.is_container_id(c_id) and \
+            self.r.zscore(self.CONTAINERS_KEY, c_id) is not None
 
     def add_member(self, c_id, m_id):
-        if not self.container_exists(c_id):
+        return self.add_members(c_id, [m_id])[0]
+
+    def add_members(self, c_id, m_ids):
+        m_ids = list(m_ids)
+        if not m_ids:
+            return m_ids
+        keys = self.members_script_keys(c_id, m_ids)
+        if not self.is_container_id(c_id) or self.add_members_script(keys=keys, args=m_ids) < 0:
             raise KeyError(
                 "Can't put a member in a container that doesn't exist. c_id: {}".format(
                     c_id
                 )
             )
-        self.r.rpush(c_id, m_id)
-        return m_id
+        return m_ids
 
     def ls_members(self, c_id, cursor, limit):
         def peek(c_id, cursor, limit):
@@ -269,18 +1515,1032 @@ class RedisStorageBackend(IStorageBackend):
             else:
                 return None
         cursor = int(cursor)
+        if not self.is_container_id(c_id):
+            return None, []
         # Skip the 0 we're using to keep Redis from deleting our key
         if cursor == 0:
             cursor = 1
         return peek(c_id, cursor, limit), \
             [x.decode("utf-8") for x in self.r.lrange(c_id, cursor, cursor + limit - 1)]
 
+    def count_members(self, c_id):
+        if not self.is_container_id(c_id):
+            return None
+        with self.r.pipeline() as p:
+            p.zscore(self.CONTAINERS_KEY, c_id)
+            p.llen(c_id)
+            # LLEN fails on any key that isn't a list, which only matters
+            # if it isn't a container anyway
+            registered, length = p.execute(raise_on_error=False)
+        # Less the sentinel, which every container holds
+        return None if registered is None else length - 1
+
     def rm_member(self, c_id, m_id):
-        self.r.lrem(c_id, 1, m_id)
-        return m_id
+        return self.rm_members(c_id, [m_id])[0]
+
+    def rm_members(self, c_id, m_ids):
+        m_ids = list(m_ids)
+        if m_ids and self.is_container_id(c_id):
+            self.rm_members_script(keys=self.members_script_keys(c_id, m_ids), args=m_ids)
+        return m_ids
 
     def member_exists(self, c_id, m_id):
-        return m_id in (x.decode("utf-8") for x in self.r.lrange(c_id, 1, -1))
+        return self.is_container_id(c_id) and bool(self.r.hexists(self.index_key(c_id), m_id))
+
+    def members_exist(self, c_id, m_ids):
+        m_ids = list(m_ids)
+        if not m_ids or not self.is_container_id(c_id):
+            return [False] * len(m_ids)
+        return [x is not None for x in self.r.hmget(self.index_key(c_id), m_ids)]
+
+    def ls_members_many(self, c_ids, limit):
+        c_ids = list(c_ids)
+        limit = max(limit, 0)
+        with self.r.pipeline(transaction=False) as p:
+            for c_id in c_ids:
+                p.zscore(self.CONTAINERS_KEY, c_id)
+                p.lrange(c_id, 0, limit + 1)
+            # LRANGE fails on keys that aren't lists, which aren't containers
+            replies = p.execute(raise_on_error=False)
+        results = {}
+        for c_id, registered, page in zip(c_ids, replies[::2], replies[1::2]):
+            if registered is None or not self.is_container_id(c_id):
+                results[c_id] = None
+                continue
+            # Less the sentinel
+            page = [x.decode("utf-8") for x in page[1:]]
+            if len(page) > limit:
+                results[c_id] = (str(limit + 1), page[:limit])
+            else:
+                results[c_id] = (None, page)
+        return results
+
+    def iter_members(self, c_id, chunk_size=1000):
+        if not self.is_container_id(c_id):
+            return
+        # Skip the sentinel
+        start = 1
+        while True:
+            chunk = self.r.lrange(c_id, start, start + chunk_size - 1)
+            for x in chunk:
+                yield x.decode("utf-8")
+            if len(chunk) < chunk_size:
+                return
+            start += chunk_size
+
+    def ls_member_containers(self, m_id, cursor, limit):
+        return self.page_lex(self.member_key(m_id), cursor, limit)
+
+    def containers_version(self):
+        return int(self.r.get(self.CONTAINERS_VERSION_KEY) or 0)
+
+    def container_version(self, c_id):
+        if not self.is_container_id(c_id):
+            return None
+        with self.r.pipeline() as p:
+            p.zscore(self.CONTAINERS_KEY, c_id)
+            p.get(self.version_key(c_id))
+            registered, version = p.execute(raise_on_error=False)
+        if registered is None:
+            return None
+        return int(version or 0)
+
+
+class SQLiteStorageBackend(IStorageBackend):
+    """
+    A single database file, in WAL mode so readers never wait on the writer
+
+    Containers are rows of their own, carrying the version and count of their
+    members, and every membership is a row of members whose autoincrementing seq keeps
+    insertion order (and is never reused, so member cursors stay valid).
+
+    members is indexed on (container, seq) to page through a container and
+    on (member, container) for existence checks and the reverse index.
+
+    Each thread gets its own connection, which caches the prepared statement
+    of every query below.
+    """
+    # Bumped whenever the schema changes, kept in PRAGMA user_version
+    SCHEMA_VERSION = 2
+
+    SCHEMA = """
+CREATE TABLE IF NOT EXISTS containers (
+    id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0,
+    size INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS members (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    container TEXT NOT NULL REFERENCES containers (id) ON DELETE CASCADE,
+    member TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS members_by_container ON members (container, seq);
+CREATE INDEX IF NOT EXISTS members_by_member ON members (member, container);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+) WITHOUT ROWID;
+INSERT OR IGNORE INTO meta (key, value) VALUES ('containers_version', 0);
+"""
+
+    # What brings the tables of each older schema version up to the next,
+    # as SCHEMA leaves existing tables alone
+    MIGRATIONS = {
+        1: """
+ALTER TABLE containers ADD COLUMN size INTEGER NOT NULL DEFAULT 0;
+UPDATE containers SET size = (SELECT count(*) FROM members WHERE container = containers.id);
+"""
+    }
+
+    INSERT_CONTAINER = "INSERT INTO containers (id) VALUES (?)"
+    DELETE_CONTAINER = "DELETE FROM containers WHERE id = ?"
+    CONTAINER_EXISTS = "SELECT 1 FROM containers WHERE id = ?"
+    CONTAINERS_AFTER = "SELECT id FROM containers WHERE id > ? ORDER BY id LIMIT ?"
+    CONTAINERS_FROM = "SELECT id FROM containers ORDER BY id LIMIT ? OFFSET ?"
+    BUMP_CONTAINERS_VERSION = \
+        "UPDATE meta SET value = value + 1 WHERE key = 'containers_version'"
+    CONTAINERS_VERSION = "SELECT value FROM meta WHERE key = 'containers_version'"
+    GROW_CONTAINER = \
+        "UPDATE containers SET version = version + 1, size = size + ? WHERE id = ?"
+    SHRINK_CONTAINER = \
+        "UPDATE containers SET version = version + 1, size = size - ? WHERE id = ?"
+    CONTAINER_VERSION = "SELECT version FROM containers WHERE id = ?"
+    CONTAINER_SIZE = "SELECT size FROM containers WHERE id = ?"
+    INSERT_MEMBER = "INSERT INTO members (container, member) VALUES (?, ?)"
+    # Like the other backends, remove only the oldest occurrence of a member
+    DELETE_MEMBER = """
+DELETE FROM members WHERE seq = (
+    SELECT min(seq) FROM members WHERE member = ? AND container = ?
+)"""
+    MEMBER_EXISTS = "SELECT 1 FROM members WHERE member = ? AND container = ? LIMIT 1"
+    MEMBERS_AFTER = \
+        "SELECT seq, member FROM members WHERE container = ? AND seq > ? ORDER BY seq LIMIT ?"
+    MEMBERS_FROM = \
+        "SELECT seq, member FROM members WHERE container = ? ORDER BY seq LIMIT ? OFFSET ?"
+    MEMBER_CONTAINERS_AFTER = """
+SELECT DISTINCT container FROM members WHERE member = ? AND container > ?
+ORDER BY container LIMIT ?"""
+    MEMBER_CONTAINERS_FROM = """
+SELECT DISTINCT container FROM members WHERE member = ?
+ORDER BY container LIMIT ? OFFSET ?"""
+
+    # Well under the lowest limit on bound parameters SQLite is built with
+    MAX_PARAMETERS = 900
+
+    def __init__(self, bp):
+        self.mint_ids = minter(bp.config.get("ID_SCHEME", "uuid4"))
+        self.path = bp.config["SQLITE_PATH"]
+        self.timeout = bp.config.get("SQLITE_TIMEOUT", 5)
+        self.local = threading.local()
+        db = self.db
+        db.execute("PRAGMA journal_mode = WAL")
+        if db.execute("PRAGMA user_version").fetchone()[0] < self.SCHEMA_VERSION:
+            with self.transaction() as db:
+                # Read again, now nothing else can be migrating it
+                version = db.execute("PRAGMA user_version").fetchone()[0]
+                statements = self.SCHEMA.split(";")
+                if version:
+                    for old in range(version, self.SCHEMA_VERSION):
+                        statements.extend(self.MIGRATIONS[old].split(";"))
+                # Not executescript(), which would commit the transaction first
+                for statement in statements:
+                    if statement.strip():
+                        db.execute(statement)
+                db.execute("PRAGMA user_version = {}".format(self.SCHEMA_VERSION))
+
+    @property
+    def db(self):
+        """
+        This thread's connection, opened on first use
+        """
+        try:
+            return self.local.db
+        except AttributeError:
+            pass
+        # Autocommit, transactions are begun explicitly by transaction()
+        db = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                             cached_statements=256)
+        db.execute("PRAGMA foreign_keys = ON")
+        # Durable as of the last checkpoint, which is plenty in WAL mode
+        db.execute("PRAGMA synchronous = NORMAL")
+        self.local.db = db
+        return db
+
+    @contextmanager
+    def transaction(self):
+        """
+        Run a block of writes atomically
+
+        BEGIN IMMEDIATE takes the write lock up front, waiting for it (up to
+        SQLITE_TIMEOUT) rather than failing when another writer got there
+        first.
+        """
+        db = self.db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def chunks(self, xs):
+        for i in range(0, len(xs), self.MAX_PARAMETERS):
+            yield xs[i:i + self.MAX_PARAMETERS]
+
+    def mint_container(self):
+        return self.mint_containers(1)[0]
+
+    def mint_containers(self, num):
+        return self.create_containers(self.mint_ids(num))
+
+    def create_containers(self, c_ids):
+        c_ids = list(c_ids)
+        if c_ids:
+            with self.transaction() as db:
+                db.executemany(self.INSERT_CONTAINER, ((c_id,) for c_id in c_ids))
+                db.execute(self.BUMP_CONTAINERS_VERSION)
+        return c_ids
+
+    def rm_container(self, c_id):
+        return self.rm_containers([c_id])[0]
+
+    def rm_containers(self, c_ids):
+        c_ids = list(c_ids)
+        if c_ids:
+            with self.transaction() as db:
+                # Their members go with them, ON DELETE CASCADE
+                if db.executemany(self.DELETE_CONTAINER, ((c_id,) for c_id in c_ids)).rowcount:
+                    db.execute(self.BUMP_CONTAINERS_VERSION)
+        return c_ids
+
+    def ls_containers(self, cursor, limit):
+        return self.page_keys(self.CONTAINERS_AFTER, self.CONTAINERS_FROM, (), cursor, limit)
+
+    def page_keys(self, after_query, from_query, args, cursor, limit):
+        """
+        Page through the sorted ids a query selects, given a version of it
+        taking the id to start after and one taking an offset
+        """
+        if limit < 1:
+            return None, []
+        offset, after = decode_cursor(cursor)
+        # Fetch one extra id to find out whether there is a next page
+        if after is not None:
+            rows = self.db.execute(after_query, args + (after, limit + 1))
+        else:
+            rows = self.db.execute(from_query, args + (limit + 1, offset))
+        page = [x[0] for x in rows]
+        if len(page) > limit:
+            del page[limit:]
+            return encode_cursor(page[-1]), page
+        return None, page
+
+    def container_exists(self, c_id):
+        return self.db.execute(self.CONTAINER_EXISTS, (c_id,)).fetchone() is not None
+
+    def add_member(self, c_id, m_id):
+        return self.add_members(c_id, [m_id])[0]
+
+    def add_members(self, c_id, m_ids):
+        m_ids = list(m_ids)
+        if not m_ids:
+            return m_ids
+        with self.transaction() as db:
+            if db.execute(self.GROW_CONTAINER, (len(m_ids), c_id)).rowcount < 1:
+                raise KeyError(c_id)
+            db.executemany(self.INSERT_MEMBER, ((c_id, m_id) for m_id in m_ids))
+        return m_ids
+
+    def ls_members(self, c_id, cursor, limit):
+        offset, after = decode_cursor(cursor)
+        if limit < 1:
+            return None, []
+        if after is not None:
+            rows = self.db.execute(self.MEMBERS_AFTER, (c_id, int(after), limit + 1))
+        else:
+            rows = self.db.execute(self.MEMBERS_FROM, (c_id, limit + 1, offset))
+        rows = rows.fetchall()
+        if not rows and not self.container_exists(c_id):
+            raise KeyError(c_id)
+        if len(rows) > limit:
+            return encode_cursor(str(rows[limit - 1][0])), [x[1] for x in rows[:limit]]
+        return None, [x[1] for x in rows]
+
+    def count_members(self, c_id):
+        row = self.db.execute(self.CONTAINER_SIZE, (c_id,)).fetchone()
+        return None if row is None else row[0]
+
+    def rm_member(self, c_id, m_id):
+        return self.rm_members(c_id, [m_id])[0]
+
+    def rm_members(self, c_id, m_ids):
+        m_ids = list(m_ids)
+        if m_ids:
+            with self.transaction() as db:
+                removed = db.executemany(self.DELETE_MEMBER,
+                                         ((m_id, c_id) for m_id in m_ids)).rowcount
+                if removed:
+                    db.execute(self.SHRINK_CONTAINER, (removed, c_id))
+        return m_ids
+
+    def member_exists(self, c_id, m_id):
+        return self.db.execute(self.MEMBER_EXISTS, (m_id, c_id)).fetchone() is not None
+
+    def members_exist(self, c_id, m_ids):
+        m_ids = list(m_ids)
+        present = set()
+        for chunk in self.chunks(list(set(m_ids))):
+            present.update(x[0] for x in self.db.execute(
+                "SELECT DISTINCT member FROM members WHERE container = ? AND member IN ({})".
+                format(", ".join("?" * len(chunk))), [c_id] + chunk))
+        return [m_id in present for m_id in m_ids]
+
+    def iter_members(self, c_id, chunk_size=1000):
+        after = 0
+        while True:
+            rows = self.db.execute(self.MEMBERS_AFTER, (c_id, after, chunk_size)).fetchall()
+            for x in rows:
+                yield x[1]
+            if len(rows) < chunk_size:
+                return
+            after = rows[-1][0]
+
+    def ls_members_many(self, c_ids, limit):
+        # Queries cost no round trips here, so one per container is cheap, but
+        # take a snapshot so every page reflects the same moment
+        db = self.db
+        db.execute("BEGIN")
+        try:
+            return super().ls_members_many(c_ids, limit)
+        finally:
+            db.execute("COMMIT")
+
+    def ls_member_containers(self, m_id, cursor, limit):
+        return self.page_keys(self.MEMBER_CONTAINERS_AFTER, self.MEMBER_CONTAINERS_FROM,
+                              (m_id,), cursor, limit)
+
+    def containers_version(self):
+        return self.db.execute(self.CONTAINERS_VERSION).fetchone()[0]
+
+    def container_version(self, c_id):
+        row = self.db.execute(self.CONTAINER_VERSION, (c_id,)).fetchone()
+        return None if row is None else row[0]
+
+
+class CachingStorageBackend(IStorageBackend):
+    """
+    Wraps another IStorageBackend, caching container and member existence
+    checks and member pages in a bounded LRU cache
+
+    Cache keys embed generation numbers for whatever they were derived from:
+    the container, the individual member, or the container's member listing.
+    A write through this wrapper bumps exactly the generations it affects,
+    which strands the stale entries to age out of the LRU. A read records the
+    generations *before* asking the backend, so a result racing a write is
+    stored under a generation that write has already retired.
+
+    Writes made by other processes sharing the backend can't be seen, and
+    are only picked up once the entries expire after ttl seconds.
+    """
+    def __init__(self, backend, maxsize=10000, ttl=60):
+        self.backend = backend
+        self.cache = LRUCache(maxsize, ttl)
+        self.generations = LRUCache(maxsize)
+        self.counter = count()
+
+    def generation(self, *key):
+        gen = self.generations.get(key)
+        if gen is MISSING:
+            # Forgotten generations restart from a number never used before,
+            # so nothing cached under the old one can be reached again.
+            gen = next(self.counter)
+            self.generations.set(key, gen)
+        return gen
+
+    def invalidate(self, *key):
+        self.generations.set(key, next(self.counter))
+
+    def cached(self, key, func, *args):
+        value = self.cache.get(key)
+        if value is MISSING:
+            value = func(*args)
+            self.cache.set(key, value)
+        return value
+
+    def cache_info(self):
+        return self.cache.info()
+
+    def mint_container(self):
+        return self.mint_containers(1)[0]
+
+    def mint_containers(self, num):
+        c_ids = self.backend.mint_containers(num)
+        for c_id in c_ids:
+            self.invalidate('c', c_id)
+        return c_ids
+
+    def create_containers(self, c_ids):
+        c_ids = self.backend.create_containers(c_ids)
+        for c_id in c_ids:
+            self.invalidate('c', c_id)
+        return c_ids
+
+    def rm_container(self, c_id):
+        return self.rm_containers([c_id])[0]
+
+    def rm_containers(self, c_ids):
+        c_ids = self.backend.rm_containers(c_ids)
+        for c_id in c_ids:
+            self.invalidate('c', c_id)
+        return c_ids
+
+    def ls_containers(self, cursor, limit):
+        return self.backend.ls_containers(cursor, limit)
+
+    def container_exists(self, c_id):
+        key = ('c', c_id, self.generation('c', c_id))
+        return self.cached(key, self.backend.container_exists, c_id)
+
+    def add_member(self, c_id, m_id):
+        return self.add_members(c_id, [m_id])[0]
+
+    def add_members(self, c_id, m_ids):
+        m_ids = list(m_ids)
+        try:
+            return self.backend.add_members(c_id, m_ids)
+        finally:
+            self.invalidate_members(c_id, m_ids)
+
+    def ls_members(self, c_id, cursor, limit):
+        key = ('p', c_id, cursor, limit,
+               self.generation('c', c_id), self.generation('p', c_id))
+        return self.cached(key, self.backend.ls_members, c_id, cursor, limit)
+
+    def rm_member(self, c_id, m_id):
+        return self.rm_members(c_id, [m_id])[0]
+
+    def rm_members(self, c_id, m_ids):
+        m_ids = list(m_ids)
+        try:
+            return self.backend.rm_members(c_id, m_ids)
+        finally:
+            self.invalidate_members(c_id, m_ids)
+
+    def member_exists(self, c_id, m_id):
+        key = ('m', c_id, m_id,
+               self.generation('c', c_id), self.generation('m', c_id, m_id))
+        return self.cached(key, self.backend.member_exists, c_id, m_id)
+
+    def members_exist(self, c_id, m_ids):
+        m_ids = list(m_ids)
+        c_gen = self.generation('c', c_id)
+        keys = [('m', c_id, m_id, c_gen, self.generation('m', c_id, m_id)) for m_id in m_ids]
+        results = [self.cache.get(key) for key in keys]
+        misses = [i for i, x in enumerate(results) if x is MISSING]
+        if misses:
+            found = self.backend.members_exist(c_id, [m_ids[i] for i in misses])
+            for i, exists in zip(misses, found):
+                results[i] = exists
+                self.cache.set(keys[i], exists)
+        return results
+
+    def iter_members(self, c_id, chunk_size=1000):
+        return self.backend.iter_members(c_id, chunk_size)
+
+    def ls_members_many(self, c_ids, limit):
+        return self.backend.ls_members_many(c_ids, limit)
+
+    def ls_member_containers(self, m_id, cursor, limit):
+        return self.backend.ls_member_containers(m_id, cursor, limit)
+
+    def containers_version(self):
+        return self.backend.containers_version()
+
+    def container_version(self, c_id):
+        key = ('v', c_id, self.generation('c', c_id), self.generation('p', c_id))
+        return self.cached(key, self.backend.container_version, c_id)
+
+    def count_members(self, c_id):
+        key = ('n', c_id, self.generation('c', c_id), self.generation('p', c_id))
+        return self.cached(key, self.backend.count_members, c_id)
+
+    def invalidate_members(self, c_id, m_ids):
+        self.invalidate('p', c_id)
+        for m_id in m_ids:
+            self.invalidate('m', c_id, m_id)
+
+
+class WriteBatch:
+    def __init__(self):
+        # (op, c_id, m_ids, future) in the order they were made
+        self.writes = []
+        self.size = 0
+        # Set once no more writes may join
+        self.closed = threading.Event()
+
+
+class CoalescingStorageBackend(IStorageBackend):
+    """
+    Wraps another IStorageBackend, gathering the members that concurrent
+    callers add and remove into one bulk call per container
+
+    The first write into an empty batch waits up to window seconds (or until
+    the batch holds max_batch members) for others to join it, then applies
+    the whole batch while the rest wait on their own results. Batches are
+    applied one at a time, and a batch gathers for as long as the one ahead
+    of it is being applied, so the busier the backend the bigger they get.
+
+    Within a container, writes are applied in the order they were made, as
+    runs of adds or removes. If a bulk call fails, every write in it fails
+    with the same error, and if applying a batch fails any other way, every
+    write in it still waiting fails with that error.
+    """
+    ADD = "add"
+    RM = "rm"
+
+    def __init__(self, backend, window=0.002, max_batch=1000):
+        self.backend = backend
+        self.window = window
+        self.max_batch = max_batch
+        # Guards the gathering batch, flush_lock the applying of them
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.batch = None
+        # How many writes were made, and how many bulk calls they took
+        self.writes = 0
+        self.flushes = 0
+
+    def write(self, op, c_id, m_ids):
+        m_ids = list(m_ids)
+        if not m_ids:
+            return m_ids
+        future = Future()
+        with self.lock:
+            batch = self.batch
+            leader = batch is None
+            if leader:
+                batch = self.batch = WriteBatch()
+            batch.writes.append((op, c_id, m_ids, future))
+            batch.size += len(m_ids)
+            self.writes += 1
+            if batch.size >= self.max_batch:
+                self.batch = None
+                batch.closed.set()
+        if leader:
+            batch.closed.wait(self.window)
+            with self.flush_lock:
+                with self.lock:
+                    if self.batch is batch:
+                        self.batch = None
+                try:
+                    self.flush(batch.writes)
+                except Exception as e:
+                    # Never leave the rest waiting on results that won't come
+                    for *_, pending in batch.writes:
+                        if not pending.done():
+                            pending.set_exception(e)
+        return future.result()
+
+    def flush(self, writes):
+        by_container = {}
+        for write in writes:
+            by_container.setdefault(write[1], []).append(write)
+        for c_id, c_writes in by_container.items():
+            for op, run in groupby(c_writes, key=itemgetter(0)):
+                run = list(run)
+                bulk = self.backend.add_members if op == self.ADD else self.backend.rm_members
+                self.flushes += 1
+                submitted = [m_id for _, _, m_ids, _ in run for m_id in m_ids]
+                try:
+                    results = list(bulk(c_id, submitted))
+                    if len(results) != len(submitted):
+                        raise RuntimeError(
+                            "Expected {} results from a bulk write, got {}".format(
+                                len(submitted), len(results)))
+                except Exception as e:
+                    for *_, future in run:
+                        future.set_exception(e)
+                    continue
+                pos = 0
+                for _, _, m_ids, future in run:
+                    future.set_result(results[pos:pos + len(m_ids)])
+                    pos += len(m_ids)
+
+    def mint_container(self):
+        return self.backend.mint_container()
+
+    def mint_containers(self, num):
+        return self.backend.mint_containers(num)
+
+    def create_containers(self, c_ids):
+        return self.backend.create_containers(c_ids)
+
+    def rm_container(self, c_id):
+        return self.backend.rm_container(c_id)
+
+    def rm_containers(self, c_ids):
+        return self.backend.rm_containers(c_ids)
+
+    def ls_containers(self, cursor, limit):
+        return self.backend.ls_containers(cursor, limit)
+
+    def container_exists(self, c_id):
+        return self.backend.container_exists(c_id)
+
+    def add_member(self, c_id, m_id):
+        return self.add_members(c_id, [m_id])[0]
+
+    def add_members(self, c_id, m_ids):
+        return self.write(self.ADD, c_id, m_ids)
+
+    def ls_members(self, c_id, cursor, limit):
+        return self.backend.ls_members(c_id, cursor, limit)
+
+    def rm_member(self, c_id, m_id):
+        return self.rm_members(c_id, [m_id])[0]
+
+    def rm_members(self, c_id, m_ids):
+        return self.write(self.RM, c_id, m_ids)
+
+    def member_exists(self, c_id, m_id):
+        return self.backend.member_exists(c_id, m_id)
+
+    def members_exist(self, c_id, m_ids):
+        return self.backend.members_exist(c_id, m_ids)
+
+    def iter_members(self, c_id, chunk_size=1000):
+        return self.backend.iter_members(c_id, chunk_size)
+
+    def count_members(self, c_id):
+        return self.backend.count_members(c_id)
+
+    def ls_members_many(self, c_ids, limit):
+        return self.backend.ls_members_many(c_ids, limit)
+
+    def ls_member_containers(self, m_id, cursor, limit):
+        return self.backend.ls_member_containers(m_id, cursor, limit)
+
+    def containers_version(self):
+        return self.backend.containers_version()
+
+    def container_version(self, c_id):
+        return self.backend.container_version(c_id)
+
+
+class ShardedStorageBackend(IStorageBackend):
+    """
+    Spreads containers across several IStorageBackends (the shards, by name),
+    each container living wholly on the one its id hashes to
+
+    Shards own the arcs of a consistent hash ring ahead of vnodes points each,
+    so adding a shard only takes containers over from the others, rather
+    than reshuffling them all. Listings across shards are k-way merges of
+    theirs, which are all in id order.
+
+    Containers are minted here and placed with create_containers, which
+    every shard has to support. Container versions are qualified by the
+    name of the shard holding the container, as a container moved to a new
+    shard starts its versions over there.
+    """
+    def __init__(self, shards, id_scheme="uuid4", vnodes=64):
+        self.mint_ids = minter(id_scheme)
+        self.vnodes = vnodes
+        self.shards = dict(shards)
+        if not self.shards:
+            raise ValueError("A sharded backend needs at least one shard")
+        for name, backend in self.shards.items():
+            self.check_shard(name, backend)
+        self.ring = self.build_ring(self.shards)
+        # Guards next_ring, the ring add_shard is moving containers over to,
+        # and writing, how many writes are under way to each container
+        self.lock = threading.Condition()
+        self.next_ring = None
+        self.writing = {}
+        self.add_shard_lock = threading.Lock()
+
+    @staticmethod
+    def check_shard(name, backend):
+        if not callable(getattr(backend, "create_containers", None)):
+            raise RuntimeError(
+                "Shard {} can't be used: {} doesn't support ".format(
+                    name, type(backend).__name__) +
+                "create_containers"
+            )
+
+    @staticmethod
+    def point(key):
+        """
+        Where key falls on the ring, the same in every process
+        """
+        return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+    def build_ring(self, names):
+        ring = sorted((self.point("{}#{}".format(name, i)), name)
+                      for name in names for i in range(self.vnodes))
+        return [x for x, _ in ring], [name for _, name in ring]
+
+    def owner(self, c_id, ring=None):
+        """
+        The name of the shard the container belongs on
+        """
+        points, names = ring or self.ring
+        return names[bisect_right(points, self.point(c_id)) % len(points)]
+
+    def shard(self, c_id):
+        return self.shards[self.owner(c_id)]
+
+    def moving(self, c_id):
+        return self.next_ring is not None and \
+            self.owner(c_id, self.next_ring) != self.owner(c_id)
+
+    @contextmanager
+    def write_fence(self, c_ids):
+        """
+        Hold a write to the given containers off while add_shard is moving
+        any of them, and count it as under way until it's done, for
+        add_shard to wait out
+        """
+        with self.lock:
+            while any(self.moving(x) for x in c_ids):
+                self.lock.wait()
+            for x in c_ids:
+                self.writing[x] = self.writing.get(x, 0) + 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                for x in c_ids:
+                    n = self.writing.pop(x) - 1
+                    if n:
+                        self.writing[x] = n
+                self.lock.notify_all()
+
+    def group(self, c_ids):
+        """
+        Split container ids into lists by the name of the shard they belong on
+        """
+        groups = {}
+        for c_id in c_ids:
+            groups.setdefault(self.owner(c_id), []).append(c_id)
+        return groups
+
+    def merge_pages(self, fetch, cursor, limit):
+        """
+        Page through the id ordered listings fetch(shard, cursor, limit) gives
+        of each shard as one
+
+        Keyset cursors are the last id handed out, which every shard can
+        resume after, and which still holds after a rebalance. Offset cursors
+        have each shard list from the start.
+        """
+        if limit < 1:
+            return None, []
+        offset, after = decode_cursor(cursor)
+        if after is not None:
+            offset = 0
+        else:
+            cursor = "0"
+        more = False
+        pages = []
+        for shard in list(self.shards.values()):
+            next_cursor, page = fetch(shard, cursor, offset + limit)
+            more = more or next_cursor is not None
+            pages.append(page)
+        # A container being moved by add_shard can be on two shards at once
+        merged = (x for x, _ in groupby(heapq.merge(*pages)))
+        merged = list(islice(merged, offset + limit + 1))
+        page = merged[offset:offset + limit]
+        if page and (more or len(merged) > offset + limit):
+            return encode_cursor(page[-1]), page
+        return None, page
+
+    def mint_container(self):
+        return self.mint_containers(1)[0]
+
+    def mint_containers(self, num):
+        return self.create_containers(self.mint_ids(num))
+
+    def create_containers(self, c_ids):
+        c_ids = list(c_ids)
+        with self.write_fence(c_ids):
+            return self.create_grouped(c_ids)
+
+    def create_grouped(self, c_ids):
+        created = []
+        for name, group in self.group(c_ids).items():
+            try:
+                created.extend(self.shards[name].create_containers(group))
+            except Exception as e:
+                created.extend(getattr(e, "succeeded", []))
+                if not created:
+                    raise
+                log.critical("Minted {} of {} containers before shard {} failed: {}".format(
+                    len(created), len(c_ids), name, e))
+                done = set(created)
+                raise PartialBulkOperationError(
+                    "Minted {} of {} containers".format(len(created), len(c_ids)),
+                    succeeded=[x for x in c_ids if x in done],
+                    failed=[x for x in c_ids if x not in done]
+                )
+        return c_ids
+
+    def rm_container(self, c_id):
+        with self.write_fence([c_id]):
+            return self.shard(c_id).rm_container(c_id)
+
+    def rm_containers(self, c_ids):
+        c_ids = list(c_ids)
+        with self.write_fence(c_ids):
+            for name, group in self.group(c_ids).items():
+                self.shards[name].rm_containers(group)
+        return c_ids
+
+    def ls_containers(self, cursor, limit):
+        return self.merge_pages(lambda shard, cursor, limit: shard.ls_containers(cursor, limit),
+                                cursor, limit)
+
+    def container_exists(self, c_id):
+        return self.shard(c_id).container_exists(c_id)
+
+    def add_member(self, c_id, m_id):
+        with self.write_fence([c_id]):
+            return self.shard(c_id).add_member(c_id, m_id)
+
+    def add_members(self, c_id, m_ids):
+        with self.write_fence([c_id]):
+            return self.shard(c_id).add_members(c_id, m_ids)
+
+    def ls_members(self, c_id, cursor, limit):
+        return self.shard(c_id).ls_members(c_id, cursor, limit)
+
+    def rm_member(self, c_id, m_id):
+        with self.write_fence([c_id]):
+            return self.shard(c_id).rm_member(c_id, m_id)
+
+    def rm_members(self, c_id, m_ids):
+        with self.write_fence([c_id]):
+            return self.shard(c_id).rm_members(c_id, m_ids)
+
+    def member_exists(self, c_id, m_id):
+        return self.shard(c_id).member_exists(c_id, m_id)
+
+    def members_exist(self, c_id, m_ids):
+        return self.shard(c_id).members_exist(c_id, m_ids)
+
+    def iter_members(self, c_id, chunk_size=1000):
+        return self.shard(c_id).iter_members(c_id, chunk_size)
+
+    def count_members(self, c_id):
+        return self.shard(c_id).count_members(c_id)
+
+    def ls_members_many(self, c_ids, limit):
+        c_ids = list(c_ids)
+        pages = {}
+        for name, group in self.group(c_ids).items():
+            pages.update(self.shards[name].ls_members_many(group, limit))
+        return {c_id: pages[c_id] for c_id in c_ids}
+
+    def ls_member_containers(self, m_id, cursor, limit):
+        return self.merge_pages(
+            lambda shard, cursor, limit: shard.ls_member_containers(m_id, cursor, limit),
+            cursor, limit
+        )
+
+    def containers_version(self):
+        versions = [shard.containers_version() for shard in list(self.shards.values())]
+        if any(x is None for x in versions):
+            return None
+        return ".".join(str(x) for x in versions)
+
+    def container_version(self, c_id):
+        name = self.owner(c_id)
+        version = self.shards[name].container_version(c_id)
+        if version is None:
+            return None
+        return "{}.{}".format(name, version)
+
+    def add_shard(self, name, backend, chunk_size=1000):
+        """
+        Add a shard, moving over the containers it takes on, and return how
+        many moved
+
+        Each container is copied to the new shard, members in order, before
+        the ring switches over and it is removed from the old one, so reads
+        find it throughout. Writes to the containers being moved (including
+        minting one that will live on the new shard) wait until the ring has
+        switched over, after those already under way have finished; writes
+        to every other container carry on throughout.
+        """
+        with self.add_shard_lock:
+            if name in self.shards:
+                raise ValueError("There is already a shard named {}".format(name))
+            self.check_shard(name, backend)
+            ring = self.build_ring(list(self.shards) + [name])
+            with self.lock:
+                self.next_ring = ring
+                while any(self.moving(x) for x in self.writing):
+                    self.lock.wait()
+            try:
+                moving = self.copy_to_shard(name, backend, ring, chunk_size)
+                with self.lock:
+                    # Shards before the ring, so routing never meets a name it
+                    # can't find
+                    self.shards = dict(self.shards, **{name: backend})
+                    self.ring = ring
+            finally:
+                with self.lock:
+                    self.next_ring = None
+                    self.lock.notify_all()
+            for old_name, c_ids in moving.items():
+                if c_ids:
+                    self.shards[old_name].rm_containers(c_ids)
+        return sum(len(x) for x in moving.values())
+
+    def copy_to_shard(self, name, backend, ring, chunk_size=1000):
+        """
+        Copy the containers shard name would own under ring over to it,
+        returning their ids by the name of the shard they were copied from
+        """
+        moving = {}
+        for old_name, shard in self.shards.items():
+            c_ids = moving[old_name] = []
+            cursor = "0"
+            while cursor is not None:
+                cursor, page = shard.ls_containers(cursor, chunk_size)
+                c_ids.extend(x for x in page if self.owner(x, ring) == name)
+        for old_name, c_ids in moving.items():
+            for c_id in c_ids:
+                self.copy_container(c_id, self.shards[old_name], backend, chunk_size)
+        return moving
+
+    @staticmethod
+    def copy_container(c_id, source, target, chunk_size=1000):
+        target.create_containers([c_id])
+        chunk = []
+        for m_id in source.iter_members(c_id, chunk_size):
+            chunk.append(m_id)
+            if len(chunk) == chunk_size:
+                target.add_members(c_id, chunk)
+                chunk = []
+        if chunk:
+            target.add_members(c_id, chunk)
+
+
+class ShardConfig:
+    """
+    Stands in for the blueprint when building a shard, with the settings for
+    where the shard is laid over the blueprint's configuration
+    """
+    def __init__(self, config, **settings):
+        self.config = dict(config, **settings)
+
+
+def shard_settings(kind, location, config):
+    """
+    The configuration values putting a shard of the given kind at location
+    """
+    if kind in ("mongodb", "redis"):
+        prefix = "MONGO_" if kind == "mongodb" else "REDIS_"
+        host, _, port = location.partition(":")
+        settings = {prefix + "HOST": host}
+        if port:
+            settings[prefix + "PORT"] = int(port)
+        return settings
+    if kind == "sqlite":
+        return {"SQLITE_PATH": location}
+    if config.get("RAM_JOURNAL_DIR"):
+        return {"RAM_JOURNAL_DIR": os.path.join(config["RAM_JOURNAL_DIR"], location)}
+    return {}
+
+
+def sharded_storage_backend(config):
+    """
+    A ShardedStorageBackend over a SHARD_BACKEND at each of the SHARDS
+    """
+    supported_backends = {
+        "mongodb": MongoStorageBackend,
+        "redis": RedisStorageBackend,
+        "ram": ram_storage_backend(config),
+        "sqlite": SQLiteStorageBackend
+    }
+    kind = str(config.get("SHARD_BACKEND", "ram")).lower()
+    if kind not in supported_backends:
+        raise RuntimeError(
+            "Unsupported SHARD_BACKEND: {}\n".format(kind) +
+            "Supported shard backends include: " +
+            "{}".format(", ".join(supported_backends.keys()))
+        )
+    locations = [x.strip() for x in str(config.get("SHARDS") or "").split(",") if x.strip()]
+    if not locations:
+        raise RuntimeError("Missing required configuration value 'SHARDS'")
+    shards = {
+        location: supported_backends[kind](
+            ShardConfig(config, **shard_settings(kind, location, config)))
+        for location in locations
+    }
+    return ShardedStorageBackend(shards, config.get("ID_SCHEME", "uuid4"),
+                                 config.get("SHARD_VNODES", 64))
 
 
 def output_html(data, code, headers=None):
@@ -290,6 +2550,67 @@ def output_html(data, code, headers=None):
     return resp
 
 
+def make_etag(*parts, variant=()):
+    """
+    Tag a representation built from the given versions, if they are known
+
+    variant is whatever else shapes the representation (the page of a
+    listing asked for, how it is encoded), hashed into the tag so that no
+    two pages or forms of the same data share one.
+    """
+    if any(x is None for x in parts):
+        return None
+    tag = "-".join(str(x) for x in parts)
+    if variant:
+        tag += "-" + hashlib.blake2b(json.dumps(variant).encode("utf-8"),
+                                     digest_size=8).hexdigest()
+    return tag
+
+
+def representation(*args):
+    """
+    The variant for make_etag of a response to the given request args,
+    encoded as this app encodes its responses
+    """
+    return (BLUEPRINT.config.get("JSON_LIBRARY", "json").lower(), current_app.debug) + args
+
+
+def check_not_modified(etag):
+    """
+    Answer 304 if the client already holds the representation tagged etag
+    """
+    if etag is not None and request.if_none_match.contains(etag):
+        abort(Response(status=304, headers={"ETag": quote_etag(etag)}))
+
+
+def etag_headers(etag):
+    return {} if etag is None else {"ETag": quote_etag(etag)}
+
+
+# Answers HEAD requests for a container with how many members it holds
+COUNT_HEADER = "X-Total-Count"
+
+
+def link_template(resource, field, **values):
+    """
+    Return a function building the link API.url_for(resource, field=x,
+    **values) for any x, without a trip through the URL map for each
+
+    The link is built once around a placeholder, which each x then stands
+    in for, quoted by the same converter url_for would use.
+    """
+    placeholder = uuid4().hex
+    values[field] = placeholder
+    prefix, _, suffix = API.url_for(resource, **values).rpartition(placeholder)
+    to_url = current_app.url_map.converters["string"](current_app.url_map).to_url
+    return lambda x: prefix + to_url(x) + suffix
+
+
+@API.representation('application/json')
+def output_json_representation(data, code, headers=None):
+    return output_json(data, code, headers, BLUEPRINT.config.get("JSON_LIBRARY", "json"))
+
+
 def check_limit(limit):
     if limit > BLUEPRINT.config.get("MAX_LIMIT", 1000):
         log.warning(
@@ -305,6 +2626,9 @@ pagination_args_parser.add_argument(
 pagination_args_parser.add_argument(
     'limit', type=int, default=1000
 )
+pagination_args_parser.add_argument(
+    'links', type=inputs.boolean, default=True
+)
 
 
 class Root(Resource):
@@ -315,12 +2639,17 @@ class Root(Resource):
         parser.add_argument('num', type=int,
                             help="How many containers to mint.",
                             default=1)
+        parser.add_argument('links', type=inputs.boolean, default=True)
         args = parser.parse_args()
         args['num'] = check_limit(args['num'])
         log.debug("Arguments parsed")
+        try:
+            minted = BLUEPRINT.config['storage'].mint_containers(args['num'])
+        except PartialBulkOperationError as e:
+            return e.to_dict(), e.status_code
         return {
-            "Minted": [{"identifier": x, "_link": API.url_for(Container, container_id=x)} for
-                       x in BLUEPRINT.config['storage'].mint_containers(args['num'])],
+            "Minted": Listing(
+                minted, link_template(Container, "container_id") if args['links'] else None),
             "_self": {"identifier": None, "_link": API.url_for(Root)}
         }
 
@@ -330,18 +2659,26 @@ class Root(Resource):
         parser = pagination_args_parser.copy()
         args = parser.parse_args()
         args['limit'] = check_limit(args['limit'])
-        next_cursor, paginated_ids = BLUEPRINT.config['storage'].ls_containers(
-            cursor=args['cursor'], limit=args['limit'])
+        etag = make_etag("containers", BLUEPRINT.config['storage'].containers_version(),
+                         variant=representation(args['cursor'], args['limit'], args['links']))
+        check_not_modified(etag)
+        try:
+            next_cursor, paginated_ids = BLUEPRINT.config['storage'].ls_containers(
+                cursor=args['cursor'], limit=args['limit'])
+        except ValueError:
+            log.critical("Malformed cursor: {}".format(args['cursor']))
+            abort(400)
         return {
-            "Containers": [{"identifier": x, "_link": API.url_for(Container, container_id=x)} for
-                           x in paginated_ids],
+            "Containers": Listing(
+                paginated_ids,
+                link_template(Container, "container_id") if args['links'] else None),
             "pagination": {
                 "cursor": args['cursor'],
                 "limit": args['limit'],
                 "next_cursor": next_cursor
             },
             "_self": {"identifier": None, "_link": API.url_for(Root)}
-        }
+        }, 200, etag_headers(etag)
 
 
 class HTMLMint(Resource):
@@ -394,16 +2731,16 @@ class Container(Resource):
         parser = reqparse.RequestParser()
         parser.add_argument('member', type=str, help="The member id to add",
                             action="append", required=True)
+        parser.add_argument('links', type=inputs.boolean, default=True)
         args = parser.parse_args()
         log.debug("Args parsed")
         try:
             return {
-                "Added": [
-                    {
-                        "identifier": x,
-                        "_link": API.url_for(Member, container_id=container_id, member_id=x)
-                    } for x in BLUEPRINT.config['storage'].add_members(container_id, args['member'])
-                ],
+                "Added": Listing(
+                    BLUEPRINT.config['storage'].add_members(container_id, args['member']),
+                    link_template(Member, "member_id", container_id=container_id)
+                    if args['links'] else None
+                ),
                 "_self": {
                     "identifier": container_id,
                     "_link": API.url_for(Container, container_id=container_id)
@@ -416,33 +2753,67 @@ class Container(Resource):
     def get(self, container_id):
         log.info("Received GET @ Container endpoint")
         parser = pagination_args_parser.copy()
+        parser.add_argument('total', type=inputs.boolean, default=False)
         args = parser.parse_args()
         args['limit'] = check_limit(args['limit'])
         try:
-            if not BLUEPRINT.config['storage'].container_exists(container_id):
+            if args['total']:
+                # Counting them answers whether the container exists too
+                total = BLUEPRINT.config['storage'].count_members(container_id)
+                if total is None:
+                    raise KeyError
+            elif not BLUEPRINT.config['storage'].container_exists(container_id):
                 raise KeyError
+            etag = make_etag(container_id,
+                             BLUEPRINT.config['storage'].container_version(container_id),
+                             variant=representation(args['cursor'], args['limit'],
+                                                    args['links'], args['total']))
+            check_not_modified(etag)
             next_cursor, paginated_ids = BLUEPRINT.config['storage'].ls_members(
                 container_id, cursor=args['cursor'], limit=args['limit'])
+            pagination = {
+                "cursor": args['cursor'],
+                "limit": args['limit'],
+                "next_cursor": next_cursor
+            }
+            if args['total']:
+                pagination['total'] = total
             return {
-                "Members": [
-                    {
-                        "identifier": x,
-                        "_link": API.url_for(Member, container_id=container_id, member_id=x)
-                    } for x in paginated_ids
-                ],
-                "pagination": {
-                    "cursor": args['cursor'],
-                    "limit": args['limit'],
-                    "next_cursor": next_cursor
-                },
+                "Members": Listing(
+                    paginated_ids,
+                    link_template(Member, "member_id", container_id=container_id)
+                    if args['links'] else None
+                ),
+                "pagination": pagination,
                 "_self": {
                     "identifier": container_id,
                     "_link": API.url_for(Container, container_id=container_id)
                 }
-            }
+            }, 200, etag_headers(etag)
         except KeyError:
             log.critical("Container with id {} not found".format(container_id))
             abort(404)
+        except ValueError:
+            log.critical("Malformed cursor: {}".format(args['cursor']))
+            abort(400)
+
+    def head(self, container_id):
+        log.info("Received HEAD @ Container endpoint")
+        # Parsed as GET would, to answer with the tag GET would
+        parser = pagination_args_parser.copy()
+        parser.add_argument('total', type=inputs.boolean, default=False)
+        args = parser.parse_args()
+        args['limit'] = check_limit(args['limit'])
+        total = BLUEPRINT.config['storage'].count_members(container_id)
+        if total is None:
+            log.critical("Container with id {} not found".format(container_id))
+            abort(404)
+        etag = make_etag(container_id,
+                         BLUEPRINT.config['storage'].container_version(container_id),
+                         variant=representation(args['cursor'], args['limit'],
+                                                args['links'], args['total']))
+        check_not_modified(etag)
+        return Response(headers=dict(etag_headers(etag), **{COUNT_HEADER: str(total)}))
 
     def delete(self, container_id):
         log.info("Received DELETE @ Container endpoint")
@@ -456,11 +2827,64 @@ class Container(Resource):
         }
 
 
+class ContainerMembersExist(Resource):
+    def post(self, container_id):
+        log.info("Received POST @ Container members exist endpoint")
+        log.debug("Parsing args")
+        parser = reqparse.RequestParser()
+        parser.add_argument('member', type=str, help="The member ids to check for",
+                            action="append", required=True)
+        args = parser.parse_args()
+        log.debug("Args parsed")
+        storage = BLUEPRINT.config['storage']
+        if not storage.container_exists(container_id):
+            log.critical("Container with id {} not found".format(container_id))
+            abort(404)
+        return {
+            "Members": [
+                {"identifier": x, "exists": exists} for x, exists in
+                zip(args['member'], storage.members_exist(container_id, args['member']))
+            ],
+            "_self": {
+                "identifier": container_id,
+                "_link": API.url_for(Container, container_id=container_id)
+            }
+        }
+
+
+class ContainerExport(Resource):
+    def get(self, container_id):
+        log.info("Received GET @ Container export endpoint")
+        storage = BLUEPRINT.config['storage']
+        if not storage.container_exists(container_id):
+            log.critical("Container with id {} not found".format(container_id))
+            abort(404)
+        etag = make_etag(container_id, storage.container_version(container_id),
+                         variant=("ndjson",))
+        check_not_modified(etag)
+
+        link = link_template(Member, "member_id", container_id=container_id)
+
+        def generate():
+            for x in storage.iter_members(
+                    container_id, BLUEPRINT.config.get("EXPORT_CHUNK_SIZE", 1000)):
+                yield item_json(x, link) + "\n"
+
+        return Response(stream_with_context(generate()), mimetype="application/x-ndjson",
+                        headers=etag_headers(etag))
+
+
 class Member(Resource):
     def get(self, container_id, member_id):
         log.info("Received GET @ Member endpoint")
         try:
+            # Checked before the tag, as If-None-Match: * matches any tag,
+            # including that of a member that isn't there
             if BLUEPRINT.config['storage'].member_exists(container_id, member_id):
+                etag = make_etag(container_id, member_id,
+                                 BLUEPRINT.config['storage'].container_version(container_id),
+                                 variant=representation())
+                check_not_modified(etag)
                 return {
                     "_self": {
                         "identifier": member_id,
@@ -471,7 +2895,7 @@ class Member(Resource):
                     "Container": {
                         "identifier": container_id,
                         "_link": API.url_for(Container, container_id=container_id)}
-                }
+                }, 200, etag_headers(etag)
             else:
                 raise KeyError()
         except KeyError:
@@ -496,11 +2920,228 @@ class Member(Resource):
         }
 
 
+class BulkImporter:
+    """
+    Gathers (container, member) rows into per-container batches and flushes
+    them through the storage backend's bulk methods
+
+    A container given as "@<alias>" names a container to be minted by this
+    import; its first mention mints it and every mention refers to it.
+    """
+    def __init__(self, storage, batch_size=1000, max_pending=10000):
+        self.storage = storage
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        # container (id or alias) -> member ids waiting to be added
+        self.pending = {}
+        self.num_pending = 0
+        self.minted = {}
+        self.batches = []
+        self.errors = []
+        self.rows = 0
+        self.added = 0
+
+    def add(self, container, member=None):
+        self.rows += 1
+        if container.startswith("@") and container not in self.minted:
+            self.pending.setdefault(container, [])
+        if member is None:
+            return
+        batch = self.pending.setdefault(container, [])
+        batch.append(member)
+        self.num_pending += 1
+        if len(batch) >= self.batch_size:
+            self.flush([container])
+        elif self.num_pending >= self.max_pending:
+            self.flush()
+
+    def flush(self, containers=None):
+        if containers is None:
+            containers = list(self.pending.keys())
+        to_mint = [x for x in containers if x.startswith("@") and x not in self.minted]
+        if to_mint:
+            self.minted.update(zip(to_mint, self.storage.mint_containers(len(to_mint))))
+        for container in containers:
+            m_ids = self.pending.pop(container)
+            self.num_pending -= len(m_ids)
+            if not m_ids:
+                continue
+            c_id = self.minted.get(container, container)
+            result = {"container": c_id, "submitted": len(m_ids)}
+            try:
+                result["added"] = len(self.storage.add_members(c_id, m_ids))
+                self.added += result["added"]
+            except KeyError:
+                log.critical("Container with id {} not found".format(c_id))
+                result["added"] = 0
+                result["error"] = "Container not found"
+            self.batches.append(result)
+
+    def error(self, line, message):
+        log.warning("Skipping import line {}: {}".format(line, message))
+        self.errors.append({"line": line, "error": message})
+
+    def decode(self, lines, encoding="utf-8"):
+        # Blank out undecodable lines so the parsers skip them while line
+        # numbers stay aligned with the body
+        for i, line in enumerate(lines, start=1):
+            try:
+                yield line.decode(encoding)
+            except UnicodeDecodeError:
+                self.error(i, "Line is not valid {}".format(encoding.upper()))
+                yield "\n"
+
+    def import_ndjson(self, lines):
+        for i, line in enumerate(lines, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+                container = row["container"]
+                member = row.get("member")
+            except (ValueError, KeyError, TypeError, AttributeError):
+                self.error(i, "Expected an object with a container and an optional member")
+                continue
+            if not isinstance(container, str) or not (member is None or isinstance(member, str)):
+                self.error(i, "Identifiers must be strings")
+                continue
+            self.add(container, member)
+
+    def import_csv(self, lines):
+        # A line at a time, so a malformed line (a stray quote, say) is
+        # reported and skipped rather than swallowing the lines after it
+        for i, line in enumerate(lines, start=1):
+            try:
+                row = next(csv.reader([line], strict=True), [])
+            except csv.Error as e:
+                self.error(i, str(e))
+                continue
+            if not row or row == ["container", "member"]:
+                continue
+            if len(row) > 2 or not row[0]:
+                self.error(i, "Expected a container and an optional member")
+                continue
+            if any("\r" in x or "\n" in x for x in row):
+                self.error(i, "Identifiers can't contain line breaks")
+                continue
+            self.add(row[0], row[1] if len(row) > 1 and row[1] else None)
+
+    def report(self):
+        return {
+            "Minted": self.minted,
+            "Batches": self.batches,
+            "Errors": self.errors,
+            "rows": self.rows,
+            "added": self.added
+        }
+
+
+class Import(Resource):
+    def post(self):
+        log.info("Received POST @ import endpoint")
+        importer = BulkImporter(
+            BLUEPRINT.config['storage'],
+            batch_size=BLUEPRINT.config.get("IMPORT_BATCH_SIZE", 1000),
+            max_pending=BLUEPRINT.config.get("IMPORT_MAX_PENDING", 10000)
+        )
+        # Read the body a line at a time rather than all at once
+        lines = importer.decode(request.stream)
+        if request.mimetype == "text/csv":
+            importer.import_csv(lines)
+        else:
+            importer.import_ndjson(lines)
+        importer.flush()
+        return importer.report()
+
+
+class MemberContainers(Resource):
+    def get(self, member_id):
+        log.info("Received GET @ member containers endpoint")
+        parser = pagination_args_parser.copy()
+        args = parser.parse_args()
+        args['limit'] = check_limit(args['limit'])
+        try:
+            next_cursor, paginated_ids = BLUEPRINT.config['storage'].ls_member_containers(
+                member_id, cursor=args['cursor'], limit=args['limit'])
+        except ValueError:
+            log.critical("Malformed cursor: {}".format(args['cursor']))
+            abort(400)
+        return {
+            "Containers": Listing(
+                paginated_ids,
+                link_template(Container, "container_id") if args['links'] else None),
+            "pagination": {
+                "cursor": args['cursor'],
+                "limit": args['limit'],
+                "next_cursor": next_cursor
+            },
+            "_self": {
+                "identifier": member_id,
+                "_link": API.url_for(MemberContainers, member_id=member_id)
+            }
+        }
+
+
+class BatchMembers(Resource):
+    def post(self):
+        log.info("Received POST @ batch members endpoint")
+        log.debug("Parsing args")
+        parser = reqparse.RequestParser()
+        parser.add_argument('container', type=str, help="The container ids to list",
+                            action="append", required=True)
+        parser.add_argument('limit', type=int, help="How many members to list per container",
+                            default=1000)
+        parser.add_argument('links', type=inputs.boolean, default=True)
+        args = parser.parse_args()
+        args['limit'] = check_limit(args['limit'])
+        log.debug("Args parsed")
+        if len(args['container']) > BLUEPRINT.config.get("MAX_LIMIT", 1000):
+            log.critical("Received a batch of more than MAX_LIMIT (or 1000) containers")
+            abort(400)
+        results = BLUEPRINT.config['storage'].ls_members_many(args['container'], args['limit'])
+        container_link = link_template(Container, "container_id")
+        listings = []
+        for c_id in args['container']:
+            container = {
+                "identifier": c_id,
+                "_link": container_link(c_id)
+            }
+            if results.get(c_id) is None:
+                container["error"] = "Container not found"
+            else:
+                next_cursor, paginated_ids = results[c_id]
+                container["Members"] = Listing(
+                    paginated_ids,
+                    link_template(Member, "member_id", container_id=c_id)
+                    if args['links'] else None
+                )
+                container["pagination"] = {
+                    "cursor": "0",
+                    "limit": args['limit'],
+                    "next_cursor": next_cursor
+                }
+            listings.append(container)
+        return {
+            "Containers": listings,
+            "_self": {"identifier": None, "_link": API.url_for(BatchMembers)}
+        }
+
+
 class Version(Resource):
     def get(self):
         return {"version": __version__}
 
 
+class CacheInfo(Resource):
+    def get(self):
+        storage = BLUEPRINT.config['storage']
+        if not isinstance(storage, CachingStorageBackend):
+            log.critical("Cache info requested, but caching isn't enabled")
+            abort(404)
+        return storage.cache_info()
+
+
 @BLUEPRINT.record
 def handle_configs(setup_state):
     app = setup_state.app
@@ -520,6 +3161,8 @@ def handle_configs(setup_state):
         "mongodb": MongoStorageBackend,
         "redis": RedisStorageBackend,
         "ram": RAMStorageBackend,
+        "sqlite": SQLiteStorageBackend,
+        "sharded": ShardedStorageBackend,
         "noerror": None
     }
 
@@ -530,7 +3173,32 @@ def handle_configs(setup_state):
             "{}".format(", ".join(supported_backends.keys()))
         )
     else:
-        BLUEPRINT.config['storage'] = supported_backends.get(storage_choice.lower())(BLUEPRINT)
+        backend = supported_backends.get(storage_choice.lower())
+        if backend is RAMStorageBackend:
+            backend = ram_storage_backend(BLUEPRINT.config)
+        if backend is ShardedStorageBackend:
+            BLUEPRINT.config['storage'] = sharded_storage_backend(BLUEPRINT.config)
+        else:
+            BLUEPRINT.config['storage'] = backend(BLUEPRINT)
+
+    # Fail now, rather than on the first response, if it isn't installed
+    json_dumper(BLUEPRINT.config.get("JSON_LIBRARY", "json"))
+
+    if BLUEPRINT.config.get("COALESCE_WRITES"):
+        log.debug("Wrapping storage backend in a write coalescer")
+        BLUEPRINT.config['storage'] = CoalescingStorageBackend(
+            BLUEPRINT.config['storage'],
+            window=BLUEPRINT.config.get("COALESCE_WINDOW", 0.002),
+            max_batch=BLUEPRINT.config.get("COALESCE_MAX_BATCH", 1000)
+        )
+
+    if BLUEPRINT.config.get("CACHE"):
+        log.debug("Wrapping storage backend in a cache")
+        BLUEPRINT.config['storage'] = CachingStorageBackend(
+            BLUEPRINT.config['storage'],
+            maxsize=BLUEPRINT.config.get("CACHE_MAXSIZE", 10000),
+            ttl=BLUEPRINT.config.get("CACHE_TTL", 60)
+        )
 
     if BLUEPRINT.config.get("VERBOSITY"):
         log.debug("Setting verbosity to {}".format(str(BLUEPRINT.config['VERBOSITY'])))
@@ -552,5 +3220,11 @@ API.add_resource(HTMLMint, "/mint")
 API.add_resource(HTMLMemberAdd, "/<string:container_id>/add")
 # Trailing slash as a reminder that this is "directory-esque"
 API.add_resource(Container, "/<string:container_id>/")
+API.add_resource(ContainerExport, "/<string:container_id>/_export")
+API.add_resource(ContainerMembersExist, "/<string:container_id>/_exists")
 API.add_resource(Member, "/<string:container_id>/<string:member_id>")
 API.add_resource(Version, "/version")
+API.add_resource(CacheInfo, "/_cache")
+API.add_resource(Import, "/_import")
+API.add_resource(BatchMembers, "/_batch/members")
+API.add_resource(MemberContainers, "/_members/<string:member_id>/containers")
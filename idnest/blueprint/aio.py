@@ -0,0 +1,464 @@
+"""
+asyncio counterparts of the storage backends, for serving idnest over ASGI
+
+They keep exactly the same data layout as their synchronous namesakes, so
+the Flask app and the ASGI app can share a database.
+"""
+
+from abc import ABCMeta, abstractmethod
+from asyncio import get_running_loop
+import logging
+
+import redis.asyncio
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError
+
+from . import RedisStorageBackend, decode_cursor, encode_cursor, ram_storage_backend
+from .exceptions import PartialBulkOperationError
+from .identifiers import minter
+
+log = logging.getLogger(__name__)
+
+
+class IAsyncStorageBackend(metaclass=ABCMeta):
+    """
+    IStorageBackend, but every method is a coroutine
+
+    _Abstracts_
+
+    * mint_container
+    * rm_container
+    * ls_containers
+    * container_exists
+    * add_member
+    * rm_member
+    * ls_members
+    * member_exists
+
+    _Provided Convenience_
+    (Over-ride these if there is a faster way to do it in your implementation)
+
+    * mint_containers
+    * rm_containers
+    * add_members
+    * rm_members
+    * count_members
+
+    _Optional_
+    (Over-ride these to enable the features that rely on them)
+
+    * setup
+    * containers_version
+    * container_version
+    """
+    async def setup(self):
+        """
+        Called once before the first request is served
+        """
+        pass
+
+    @abstractmethod
+    async def mint_container(self):
+        pass
+
+    async def mint_containers(self, num):
+        return [await self.mint_container() for _ in range(num)]
+
+    @abstractmethod
+    async def rm_container(self, c_id):
+        pass
+
+    async def rm_containers(self, c_ids):
+        return [await self.rm_container(c_id) for c_id in c_ids]
+
+    @abstractmethod
+    async def ls_containers(self, cursor, limit):
+        pass
+
+    @abstractmethod
+    async def container_exists(self, c_id):
+        pass
+
+    @abstractmethod
+    async def add_member(self, c_id, m_id):
+        pass
+
+    async def add_members(self, c_id, m_ids):
+        return [await self.add_member(c_id, m_id) for m_id in m_ids]
+
+    @abstractmethod
+    async def ls_members(self, c_id, cursor, limit):
+        pass
+
+    @abstractmethod
+    async def rm_member(self, c_id, m_id):
+        pass
+
+    async def rm_members(self, c_id, m_ids):
+        return [await self.rm_member(c_id, m_id) for m_id in m_ids]
+
+    @abstractmethod
+    async def member_exists(self, c_id, m_id):
+        pass
+
+    async def count_members(self, c_id):
+        if not await self.container_exists(c_id):
+            return None
+        total = 0
+        cursor = "0"
+        while cursor is not None:
+            cursor, page = await self.ls_members(c_id, cursor, 1000)
+            total += len(page)
+        return total
+
+    async def containers_version(self):
+        return None
+
+    async def container_version(self, c_id):
+        return None
+
+
+class AsyncStorageAdapter(IAsyncStorageBackend):
+    """
+    Serve a synchronous backend that never blocks (one that lives in this
+    process) through the async interface
+
+    Anything that does I/O would stall the event loop, those need a native
+    implementation instead.
+    """
+    def __init__(self, backend):
+        self.backend = backend
+
+    async def mint_container(self):
+        return self.backend.mint_container()
+
+    async def mint_containers(self, num):
+        return self.backend.mint_containers(num)
+
+    async def rm_container(self, c_id):
+        return self.backend.rm_container(c_id)
+
+    async def rm_containers(self, c_ids):
+        return self.backend.rm_containers(c_ids)
+
+    async def ls_containers(self, cursor, limit):
+        return self.backend.ls_containers(cursor, limit)
+
+    async def container_exists(self, c_id):
+        return self.backend.container_exists(c_id)
+
+    async def add_member(self, c_id, m_id):
+        return self.backend.add_member(c_id, m_id)
+
+    async def add_members(self, c_id, m_ids):
+        return self.backend.add_members(c_id, m_ids)
+
+    async def ls_members(self, c_id, cursor, limit):
+        return self.backend.ls_members(c_id, cursor, limit)
+
+    async def rm_member(self, c_id, m_id):
+        return self.backend.rm_member(c_id, m_id)
+
+    async def rm_members(self, c_id, m_ids):
+        return self.backend.rm_members(c_id, m_ids)
+
+    async def member_exists(self, c_id, m_id):
+        return self.backend.member_exists(c_id, m_id)
+
+    async def count_members(self, c_id):
+        return self.backend.count_members(c_id)
+
+    async def containers_version(self):
+        return self.backend.containers_version()
+
+    async def container_version(self, c_id):
+        return self.backend.container_version(c_id)
+
+
+class AsyncRAMStorageBackend(AsyncStorageAdapter):
+    def __init__(self, bp):
+        if bp.config.get("RAM_JOURNAL_DIR"):
+            # Waiting on the journal's fsyncs would stall the event loop
+            raise RuntimeError("The ASGI app doesn't support journaling the RAM backend")
+        super().__init__(ram_storage_backend(bp.config)(bp))
+
+
+class AsyncMongoStorageBackend(IAsyncStorageBackend):
+    """
+    MongoStorageBackend over motor, which is an optional dependency
+    (pip install idnest[async])
+    """
+    def __init__(self, bp):
+        try:
+            from motor.motor_asyncio import AsyncIOMotorClient
+        except ImportError:
+            raise RuntimeError(
+                "The async mongodb storage backend requires motor, " +
+                "install idnest[async] to use it"
+            )
+        self.mint_ids = minter(bp.config.get("ID_SCHEME", "uuid4"))
+        client = AsyncIOMotorClient(bp.config["MONGO_HOST"],
+                                    bp.config.get("MONGO_PORT", 27017))
+        self.db = client[bp.config["MONGO_DB"]]
+
+    async def setup(self):
+        await self.db.containers.create_index([('members', ASCENDING), ('_id', ASCENDING)])
+
+    async def mint_container(self):
+        return (await self.mint_containers(1))[0]
+
+    async def bump_containers_version(self):
+        await self.db.meta.update_one({'_id': 'containers'}, {'$inc': {'version': 1}},
+                                      upsert=True)
+
+    async def mint_containers(self, num):
+        ids = self.mint_ids(num)
+        if not ids:
+            return ids
+        try:
+            await self.db.containers.insert_many([{'members': [], '_id': x, 'version': 0}
+                                                  for x in ids])
+        except BulkWriteError as e:
+            inserted = e.details['nInserted']
+            log.critical("Minted {} of {} containers before failing: {}".format(
+                inserted, num, e.details['writeErrors']))
+            raise PartialBulkOperationError(
+                "Minted {} of {} containers".format(inserted, num),
+                succeeded=ids[:inserted], failed=ids[inserted:]
+            )
+        finally:
+            await self.bump_containers_version()
+        return ids
+
+    async def rm_container(self, c_id):
+        return (await self.rm_containers([c_id]))[0]
+
+    async def rm_containers(self, c_ids):
+        c_ids = list(c_ids)
+        if (await self.db.containers.delete_many({'_id': {'$in': c_ids}})).deleted_count:
+            await self.bump_containers_version()
+        return c_ids
+
+    async def ls_containers(self, cursor, limit):
+        if limit < 1:
+            return None, []
+        offset, after = decode_cursor(cursor)
+        if after is not None:
+            results = self.db.containers.find({'_id': {'$gt': after}}, {'_id': 1})
+        else:
+            results = self.db.containers.find({}, {'_id': 1}).skip(offset)
+        results = results.sort('_id', ASCENDING).limit(limit + 1)
+        page = [str(x['_id']) async for x in results]
+        if len(page) > limit:
+            del page[limit:]
+            return encode_cursor(page[-1]), page
+        return None, page
+
+    async def container_exists(self, c_id):
+        return await self.db.containers.find_one({'_id': c_id}, {'_id': 1}) is not None
+
+    async def add_member(self, c_id, m_id):
+        return (await self.add_members(c_id, [m_id]))[0]
+
+    async def add_members(self, c_id, m_ids):
+        m_ids = list(m_ids)
+        if not m_ids:
+            return m_ids
+        r = await self.db.containers.update_one({'_id': c_id},
+                                                {'$push': {'members': {'$each': m_ids}},
+                                                 '$inc': {'version': 1}})
+        if r.matched_count < 1:
+            raise KeyError(c_id)
+        return m_ids
+
+    async def ls_members(self, c_id, cursor, limit):
+        offset, _ = decode_cursor(cursor)
+        if offset is None:
+            raise ValueError("Member cursors are offsets in this backend")
+        if limit < 1:
+            return None, []
+        c = await self.db.containers.find_one(
+            {'_id': c_id}, {'_id': 0, 'members': {'$slice': [offset, limit + 1]}}
+        )
+        if c is None:
+            raise KeyError(c_id)
+        page = c['members']
+        if len(page) > limit:
+            return str(offset + limit), page[:limit]
+        return None, page
+
+    async def rm_member(self, c_id, m_id):
+        return (await self.rm_members(c_id, [m_id]))[0]
+
+    async def rm_members(self, c_id, m_ids):
+        m_ids = list(m_ids)
+        await self.db.containers.update_one({'_id': c_id, 'members': {'$in': m_ids}},
+                                            {'$pullAll': {'members': m_ids},
+                                             '$inc': {'version': 1}})
+        return m_ids
+
+    async def member_exists(self, c_id, m_id):
+        return await self.db.containers.find_one({'_id': c_id, 'members': m_id},
+                                                 {'_id': 1}) is not None
+
+    async def count_members(self, c_id):
+        async for c in self.db.containers.aggregate([
+                {'$match': {'_id': c_id}},
+                {'$project': {'_id': 0, 'count': {'$size': '$members'}}}
+        ]):
+            return c['count']
+        return None
+
+    async def containers_version(self):
+        meta = await self.db.meta.find_one({'_id': 'containers'})
+        return 0 if meta is None else meta['version']
+
+    async def container_version(self, c_id):
+        c = await self.db.containers.find_one({'_id': c_id}, {'_id': 0, 'version': 1})
+        if c is None:
+            return None
+        return c.get('version', 0)
+
+
+class AsyncRedisStorageBackend(IAsyncStorageBackend):
+    """
+    RedisStorageBackend over redis.asyncio, running the same scripts
+    against the same keys
+    """
+    layout = RedisStorageBackend
+
+    def __init__(self, bp):
+        self.bp = bp
+        self.mint_ids = minter(bp.config.get("ID_SCHEME", "uuid4"))
+        # With many requests in flight, queue for a connection instead of
+        # failing once they are all in use
+        self.r = redis.asyncio.StrictRedis(connection_pool=redis.asyncio.BlockingConnectionPool(
+            host=bp.config["REDIS_HOST"],
+            port=bp.config.get("REDIS_PORT", 6379),
+            db=bp.config["REDIS_DB"],
+            max_connections=bp.config.get("REDIS_MAX_CONNECTIONS", 100)
+        ))
+        self.add_members_script = self.r.register_script(self.layout.ADD_MEMBERS_SCRIPT)
+        self.rm_members_script = self.r.register_script(self.layout.RM_MEMBERS_SCRIPT)
+        self.rm_containers_script = self.r.register_script(self.layout.RM_CONTAINERS_SCRIPT)
+
+    async def setup(self):
+        version = int(await self.r.get(self.layout.SCHEMA_VERSION_KEY) or 0)
+        if version < self.layout.SCHEMA_VERSION:
+            # Migrating is a one off, leave it to the synchronous backend
+            await get_running_loop().run_in_executor(None, self.layout, self.bp)
+
+    async def mint_container(self):
+        return (await self.mint_containers(1))[0]
+
+    async def mint_containers(self, num):
+        c_ids = self.mint_ids(num)
+        if c_ids:
+            async with self.r.pipeline() as p:
+                for c_id in c_ids:
+                    p.lpush(c_id, 0)
+                p.zadd(self.layout.CONTAINERS_KEY, {c_id: 0 for c_id in c_ids})
+                p.incr(self.layout.CONTAINERS_VERSION_KEY)
+                await p.execute()
+        return c_ids
+
+    async def rm_container(self, c_id):
+        return (await self.rm_containers([c_id]))[0]
+
+    async def rm_containers(self, c_ids):
+        c_ids = list(c_ids)
+        valid = [c_id for c_id in c_ids if self.layout.is_container_id(c_id)]
+        if valid:
+            await self.rm_containers_script(
+                keys=[self.layout.CONTAINERS_KEY, self.layout.CONTAINERS_VERSION_KEY],
+                args=[self.layout.MEMBER_KEY_PREFIX] + valid
+            )
+        return c_ids
+
+    async def ls_containers(self, cursor, limit):
+        if limit < 1:
+            return None, []
+        offset, after = decode_cursor(cursor)
+        if after is not None:
+            page = await self.r.zrangebylex(self.layout.CONTAINERS_KEY, "(" + after, "+",
+                                            start=0, num=limit + 1)
+        else:
+            page = await self.r.zrange(self.layout.CONTAINERS_KEY, offset, offset + limit)
+        page = [x.decode("utf-8") for x in page]
+        if len(page) > limit:
+            del page[limit:]
+            return encode_cursor(page[-1]), page
+        return None, page
+
+    async def container_exists(self, c_id):
+        return self.layout.is_container_id(c_id) and \
+            await self.r.zscore(self.layout.CONTAINERS_KEY, c_id) is not None
+
+    async def add_member(self, c_id, m_id):
+        return (await self.add_members(c_id, [m_id]))[0]
+
+    async def add_members(self, c_id, m_ids):
+        m_ids = list(m_ids)
+        if not m_ids:
+            return m_ids
+        keys = self.layout.members_script_keys(c_id, m_ids)
+        if not self.layout.is_container_id(c_id) or \
+                await self.add_members_script(keys=keys, args=m_ids) < 0:
+            raise KeyError(
+                "Can't put a member in a container that doesn't exist. c_id: {}".format(
+                    c_id
+                )
+            )
+        return m_ids
+
+    async def ls_members(self, c_id, cursor, limit):
+        cursor = int(cursor)
+        # Skip the sentinel
+        if cursor == 0:
+            cursor = 1
+        if limit < 1 or not self.layout.is_container_id(c_id):
+            return None, []
+        # Fetch one extra member to find out whether there is a next page
+        page = [x.decode("utf-8") for x in
+                await self.r.lrange(c_id, cursor, cursor + limit)]
+        if len(page) > limit:
+            return str(cursor + limit), page[:limit]
+        return None, page
+
+    async def rm_member(self, c_id, m_id):
+        return (await self.rm_members(c_id, [m_id]))[0]
+
+    async def rm_members(self, c_id, m_ids):
+        m_ids = list(m_ids)
+        if m_ids and self.layout.is_container_id(c_id):
+            await self.rm_members_script(keys=self.layout.members_script_keys(c_id, m_ids),
+                                         args=m_ids)
+        return m_ids
+
+    async def member_exists(self, c_id, m_id):
+        return self.layout.is_container_id(c_id) and \
+            bool(await self.r.hexists(self.layout.index_key(c_id), m_id))
+
+    async def count_members(self, c_id):
+        if not self.layout.is_container_id(c_id):
+            return None
+        async with self.r.pipeline() as p:
+            p.zscore(self.layout.CONTAINERS_KEY, c_id)
+            p.llen(c_id)
+            registered, length = await p.execute(raise_on_error=False)
+        # Less the sentinel
+        return None if registered is None else length - 1
+
+    async def containers_version(self):
+        return int(await self.r.get(self.layout.CONTAINERS_VERSION_KEY) or 0)
+
+    async def container_version(self, c_id):
+        if not self.layout.is_container_id(c_id):
+            return None
+        async with self.r.pipeline() as p:
+            p.zscore(self.layout.CONTAINERS_KEY, c_id)
+            p.get(self.layout.version_key(c_id))
+            registered, version = await p.execute(raise_on_error=False)
+        if registered is None:
+            return None
+        return int(version or 0)
@@ -0,0 +1,68 @@
+"""
+A small bounded cache for the caching storage backend
+"""
+
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+# Returned by LRUCache.get on a miss, as None and False are cacheable values
+MISSING = object()
+
+
+class LRUCache:
+    """
+    A thread safe mapping holding at most maxsize entries, dropping the least
+    recently used one to make room, whose entries expire ttl seconds after
+    being set (never, if ttl is falsey)
+    """
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # key -> (expiry time or None, value), least recently used first
+        self.data = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, key):
+        with self.lock:
+            try:
+                expires, value = self.data[key]
+            except KeyError:
+                self.misses += 1
+                return MISSING
+            if expires is not None and expires <= monotonic():
+                del self.data[key]
+                self.misses += 1
+                return MISSING
+            self.data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        expires = monotonic() + self.ttl if self.ttl else None
+        with self.lock:
+            self.data[key] = (expires, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def info(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self.data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl
+        }
@@ -15,3 +15,19 @@ class Error(Exception):
 class ImproperConfigurationError(Error):
     err_name = "ImproperConfigurationError"
     message = "The server appears to be improperly configured"
+
+
+class PartialBulkOperationError(Error):
+    err_name = "PartialBulkOperationError"
+    message = "A bulk operation only partially succeeded"
+
+    def __init__(self, message=None, succeeded=None, failed=None):
+        super().__init__(message)
+        self.succeeded = succeeded or []
+        self.failed = failed or []
+
+    def to_dict(self):
+        d = super().to_dict()
+        d['succeeded'] = self.succeeded
+        d['failed'] = self.failed
+        return d
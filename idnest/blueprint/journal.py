@@ -0,0 +1,322 @@
+"""
+A write-ahead journal and binary snapshots, to make the RAM backend durable
+
+The journal is a sequence of numbered files, each a run of records framed as
+
+    payload length (uint32) | crc32 of payload (uint32) | payload
+
+where the payload is an operation code (uint8), a count of ids (uint32) and
+then that many ids, each its UTF-8 length (uint32) followed by its bytes.
+A torn record at the end of the last file (a crash mid-write) fails its
+length or checksum and is dropped, along with anything after it.
+
+A snapshot holds everything up to the start of a given journal file, so
+restoring is loading the snapshot and replaying the journal files from that
+one on. Snapshots are laid out so every array in them can be used straight
+out of a memory map, all in native byte order and 8 byte aligned:
+
+    header: magic (8 bytes), byte order (8 bytes), journal generation,
+            number of strings, length of the string blob, number of containers
+            (uint64 each)
+    string offsets: uint64[number of strings + 1], into the blob
+    string blob: UTF-8, padded to 8 bytes
+    then for each container:
+        its id as an index into the strings, its number of members and its
+        next member sequence number (uint64 each), the members as indexes
+        into the strings (uint32[n], padded to 8 bytes) and their sequence
+        numbers (uint64[n])
+
+Every id appears in the strings once, however many containers hold it.
+"""
+
+from array import array
+from mmap import mmap, ACCESS_READ
+from struct import Struct
+from threading import Condition, Lock, Thread
+from time import sleep
+from zlib import crc32
+import logging
+import os
+import sys
+
+log = logging.getLogger(__name__)
+
+# Operation codes
+MINT = 1
+RM_CONTAINERS = 2
+ADD_MEMBERS = 3
+RM_MEMBERS = 4
+
+FRAME = Struct("<II")
+RECORD = Struct("<BI")
+LENGTH = Struct("<I")
+
+SNAPSHOT_MAGIC = b"IDNSNAP1"
+SNAPSHOT_HEADER = Struct("=8s8sQQQQ")
+SNAPSHOT_CONTAINER = Struct("=QQQ")
+
+JOURNAL_PREFIX = "journal."
+SNAPSHOT_NAME = "snapshot"
+
+
+def encode_record(op, ids):
+    parts = [RECORD.pack(op, len(ids))]
+    for x in ids:
+        x = x.encode("utf-8")
+        parts.append(LENGTH.pack(len(x)))
+        parts.append(x)
+    payload = b"".join(parts)
+    return FRAME.pack(len(payload), crc32(payload)) + payload
+
+
+def decode_record(payload):
+    op, num = RECORD.unpack_from(payload)
+    pos = RECORD.size
+    ids = []
+    for _ in range(num):
+        length, = LENGTH.unpack_from(payload, pos)
+        pos += LENGTH.size
+        ids.append(payload[pos:pos + length].decode("utf-8"))
+        pos += length
+    return op, ids
+
+
+def read_journal(path):
+    """
+    Yield the (op, ids) records in a journal file, dropping (and truncating
+    the file at) a torn record at its end
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    pos = 0
+    while pos < len(data):
+        if pos + FRAME.size > len(data):
+            break
+        length, checksum = FRAME.unpack_from(data, pos)
+        payload = data[pos + FRAME.size:pos + FRAME.size + length]
+        if len(payload) < length or crc32(payload) != checksum:
+            break
+        yield decode_record(payload)
+        pos += FRAME.size + length
+    if pos < len(data):
+        log.warning("Dropping {} bytes of torn records from the end of {}".format(
+            len(data) - pos, path))
+        with open(path, "r+b") as f:
+            f.truncate(pos)
+            os.fsync(f.fileno())
+
+
+def journal_path(directory, generation):
+    return os.path.join(directory, "{}{:020d}".format(JOURNAL_PREFIX, generation))
+
+
+def journal_generations(directory):
+    """
+    The generations of the journal files in directory, oldest first
+    """
+    return sorted(int(x[len(JOURNAL_PREFIX):]) for x in os.listdir(directory)
+                  if x.startswith(JOURNAL_PREFIX) and x[len(JOURNAL_PREFIX):].isdigit())
+
+
+def fsync_directory(directory):
+    # Makes creating, renaming and removing files in it durable
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def pad(n):
+    return -n % 8
+
+
+def write_snapshot(path, generation, containers):
+    """
+    Atomically write a snapshot of containers, an iterable of
+    (c_id, member ids, their sequence numbers, next sequence number)
+    """
+    strings = {}
+    encoded = []
+    for c_id, m_ids, seqs, next_seq in containers:
+        c_index = strings.setdefault(c_id, len(strings))
+        indexes = array('I', [strings.setdefault(m_id, len(strings)) for m_id in m_ids])
+        encoded.append((c_index, indexes, seqs, next_seq))
+    blob = []
+    offsets = array('Q', [0])
+    for x in strings:
+        x = x.encode("utf-8")
+        blob.append(x)
+        offsets.append(offsets[-1] + len(x))
+    blob = b"".join(blob)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, sys.byteorder.encode("ascii"),
+                                     generation, len(strings), len(blob), len(encoded)))
+        f.write(offsets.tobytes())
+        f.write(blob + b"\0" * pad(len(blob)))
+        for c_index, indexes, seqs, next_seq in encoded:
+            f.write(SNAPSHOT_CONTAINER.pack(c_index, len(indexes), next_seq))
+            indexes = indexes.tobytes()
+            f.write(indexes + b"\0" * pad(len(indexes)))
+            f.write(seqs.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    fsync_directory(os.path.dirname(path))
+
+
+def read_snapshot(path):
+    """
+    Return the journal generation a snapshot runs up to and a list of the
+    (c_id, member ids, their sequence numbers, next sequence number) in it
+    """
+    with open(path, "rb") as f, mmap(f.fileno(), 0, access=ACCESS_READ) as m:
+        view = memoryview(m)
+        try:
+            return parse_snapshot(view)
+        finally:
+            view.release()
+
+
+def parse_snapshot(view):
+    magic, byteorder, generation, num_strings, blob_length, num_containers = \
+        SNAPSHOT_HEADER.unpack_from(view)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError("Not an idnest snapshot")
+    if byteorder.rstrip(b"\0").decode("ascii") != sys.byteorder:
+        raise ValueError("Snapshot was written on a machine of the other byte order")
+    pos = SNAPSHOT_HEADER.size
+    offsets = view[pos:pos + (num_strings + 1) * 8].cast('Q')
+    pos += (num_strings + 1) * 8
+    blob = bytes(view[pos:pos + blob_length])
+    pos += blob_length + pad(blob_length)
+    # Slicing str is much cheaper than decoding every id, and byte offsets
+    # are character offsets when everything is ASCII
+    if blob.isascii():
+        blob = blob.decode("ascii")
+        strings = list(map(blob.__getitem__, map(slice, offsets[:-1], offsets[1:])))
+    else:
+        strings = [blob[a:b].decode("utf-8") for a, b in zip(offsets[:-1], offsets[1:])]
+    offsets.release()
+    containers = []
+    for _ in range(num_containers):
+        c_index, num, next_seq = SNAPSHOT_CONTAINER.unpack_from(view, pos)
+        pos += SNAPSHOT_CONTAINER.size
+        indexes = view[pos:pos + num * 4].cast('I')
+        m_ids = list(map(strings.__getitem__, indexes))
+        indexes.release()
+        pos += num * 4 + pad(num * 4)
+        seqs = array('Q')
+        seqs.frombytes(view[pos:pos + num * 8])
+        pos += num * 8
+        containers.append((strings[c_index], m_ids, seqs, next_seq))
+    return generation, containers
+
+
+class Journal:
+    """
+    Appends records to the current journal file with group commit: a
+    background thread writes out and fsyncs everything appended since its
+    last pass in one go, so concurrent writers share the cost of an fsync
+
+    append() hands back a ticket, wait(ticket) returns once the record is
+    durable. commit_delay seconds are spent gathering records before each
+    pass, trading latency for fewer fsyncs.
+
+    A failed write may leave a torn record at the end of the file, which a
+    restart drops, so nothing more is written after one: the records still
+    buffered are dropped, their waiters and any later append raise IOError.
+    """
+    def __init__(self, directory, generation, commit_delay=0):
+        self.directory = directory
+        self.generation = generation
+        self.commit_delay = commit_delay
+        self.file = open(journal_path(directory, generation), "ab")
+        fsync_directory(directory)
+        self.cond = Condition()
+        # Held while writing to (or swapping) the file
+        self.io_lock = Lock()
+        self.buffer = []
+        self.appended = 0
+        self.synced = 0
+        self.error = None
+        self.closed = False
+        self.flusher = Thread(target=self.run, name="idnest-journal", daemon=True)
+        self.flusher.start()
+
+    def append(self, op, ids):
+        record = encode_record(op, ids)
+        with self.cond:
+            if self.closed:
+                raise RuntimeError("Journal is closed")
+            if self.error is not None:
+                raise IOError("Journal write failed: {}".format(self.error))
+            self.buffer.append(record)
+            self.appended += 1
+            self.cond.notify_all()
+            return self.appended
+
+    def wait(self, ticket):
+        with self.cond:
+            while self.synced < ticket:
+                if self.error is not None:
+                    raise IOError("Journal write failed: {}".format(self.error))
+                self.cond.wait()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.buffer and not self.closed:
+                    self.cond.wait()
+                if not self.buffer:
+                    return
+            if self.commit_delay:
+                sleep(self.commit_delay)
+            self.flush()
+
+    def flush(self):
+        with self.io_lock:
+            with self.cond:
+                records, self.buffer = self.buffer, []
+                ticket = self.appended
+                if self.error is not None:
+                    return
+            try:
+                if records:
+                    self.file.write(b"".join(records))
+                    self.file.flush()
+                    os.fsync(self.file.fileno())
+            except Exception as e:
+                log.critical("Journal write failed: {}".format(e))
+                with self.cond:
+                    self.error = e
+                    self.cond.notify_all()
+                return
+            with self.cond:
+                self.synced = max(self.synced, ticket)
+                self.cond.notify_all()
+
+    def rotate(self):
+        """
+        Make everything appended so far durable and start a new journal
+        file, returning its generation
+        """
+        self.flush()
+        with self.io_lock:
+            self.file.close()
+            self.generation += 1
+            self.file = open(journal_path(self.directory, self.generation), "ab")
+            fsync_directory(self.directory)
+        return self.generation
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.flusher.join()
+        self.flush()
+        self.file.close()
@@ -0,0 +1,155 @@
+"""
+JSON representations of API responses
+
+Responses are encoded by the library named by JSON_LIBRARY:
+
+* json (the default) gives exactly the output flask_restful's own
+  representation would, but writes listings of identifiers straight out as
+  text rather than encoding a dict per identifier
+* orjson and ujson, if installed, are faster still, but write compact JSON
+  (and orjson leaves non-ASCII characters unescaped), so their output only
+  matches once parsed
+
+Listings are built as Listing objects, which each library encodes as the
+list of {"identifier": x, "_link": link} objects they stand for.
+"""
+
+from json import dumps
+from json.encoder import encode_basestring_ascii
+
+from flask import current_app, make_response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def item_json(x, link=None):
+    """
+    The JSON for a single listing entry, as json.dumps() writes the dict,
+    and a good deal quicker
+    """
+    if link is None:
+        return '{"identifier": ' + encode_basestring_ascii(x) + '}'
+    return '{"identifier": ' + encode_basestring_ascii(x) + \
+        ', "_link": ' + encode_basestring_ascii(link(x)) + '}'
+
+
+class Listing:
+    """
+    A list of identifiers, along with a function building the link to each
+    (or None, for a listing without links)
+    """
+    __slots__ = ("ids", "link")
+
+    def __init__(self, ids, link=None):
+        self.ids = ids
+        self.link = link
+
+    def __len__(self):
+        return len(self.ids)
+
+    def to_list(self):
+        if self.link is None:
+            return [{"identifier": x} for x in self.ids]
+        return [{"identifier": x, "_link": self.link(x)} for x in self.ids]
+
+    def json(self):
+        link = self.link
+        return "[" + ", ".join(item_json(x, link) for x in self.ids) + "]"
+
+
+def to_plain(o):
+    """
+    Return o with any Listing in it turned into a list
+    """
+    if isinstance(o, Listing):
+        return o.to_list()
+    if isinstance(o, dict):
+        return {k: to_plain(v) for k, v in o.items()}
+    if isinstance(o, list):
+        return [to_plain(x) for x in o]
+    return o
+
+
+def default(o):
+    if isinstance(o, Listing):
+        return o.to_list()
+    raise TypeError("Object of type {} is not JSON serializable".format(type(o).__name__))
+
+
+def encode_json(o):
+    # Writes exactly what json.dumps(to_plain(o)) would
+    if type(o) is str:
+        return encode_basestring_ascii(o)
+    if isinstance(o, Listing):
+        return o.json()
+    if isinstance(o, dict) and all(type(k) is str for k in o):
+        return "{" + ", ".join(encode_basestring_ascii(k) + ": " + encode_json(v)
+                               for k, v in o.items()) + "}"
+    if isinstance(o, list):
+        return "[" + ", ".join(map(encode_json, o)) + "]"
+    return dumps(o, default=default)
+
+
+def dumps_json(data):
+    return (encode_json(data) + "\n").encode("utf-8")
+
+
+def dumps_orjson(data):
+    return orjson.dumps(data, default=default) + b"\n"
+
+
+def dumps_ujson(data):
+    return (ujson.dumps(to_plain(data), escape_forward_slashes=False) + "\n").encode("utf-8")
+
+
+LIBRARIES = {
+    "json": (dumps_json, True),
+    "orjson": (dumps_orjson, orjson is not None),
+    "ujson": (dumps_ujson, ujson is not None)
+}
+
+
+def json_dumper(library):
+    """
+    The function encoding responses (as bytes, ending in a newline) with the
+    named library
+    """
+    try:
+        dumper, installed = LIBRARIES[library.lower()]
+    except KeyError:
+        raise RuntimeError(
+            "Unsupported JSON_LIBRARY: {}\n".format(library) +
+            "Supported JSON libraries include: " +
+            "{}".format(", ".join(LIBRARIES.keys()))
+        )
+    if not installed:
+        raise RuntimeError("JSON_LIBRARY {} is not installed".format(library))
+    return dumper
+
+
+def output_json(data, code, headers=None, library="json"):
+    """
+    flask_restful's output_json, with a choice of library
+    """
+    settings = current_app.config.get('RESTFUL_JSON', {})
+    if settings or current_app.debug:
+        # Only the standard library can indent and so on, as flask_restful
+        # does in debug mode
+        settings = dict(settings)
+        if current_app.debug:
+            settings.setdefault('indent', 4)
+            settings.setdefault('sort_keys', False)
+        dumped = dumps(data, default=default, **settings) + "\n"
+    else:
+        dumped = json_dumper(library)(data)
+    resp = make_response(dumped, code)
+    resp.headers.extend(headers or {})
+    return resp
@@ -26,6 +26,10 @@ setup(
         'pymongo',
         'redis'
     ],
+    extras_require={
+        'async': ['motor'],
+        'fastjson': ['orjson']
+    },
     tests_require=[
         'pytest'
     ],
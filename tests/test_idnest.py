@@ -1,14 +1,35 @@
 import unittest
-from uuid import uuid4
+import asyncio
+import time
+from concurrent.futures import Future
+from unittest import mock
+from uuid import uuid4, UUID, RFC_4122
 import json
-from os import environ
+import os
+import sqlite3
+from os import environ, path
+from tempfile import TemporaryDirectory
+from threading import Thread
+from urllib.parse import urlencode, unquote
 
+import flask_restful.representations.json
 from pymongo import MongoClient
 
 # Defer any configuration to the tests setUp()
 environ['IDNEST_DEFER_CONFIG'] = "True"
 
 import idnest
+import idnest.asgi
+
+try:
+    import motor
+except ImportError:
+    motor = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 class Mixin:
@@ -82,8 +103,12 @@ class Mixin:
         pcrj = self.response_200_json(pcrv)
         return pcrj['Added'][0]['identifier']
 
-    def add_multiple_members(self, c_id):
-        pass
+    def add_multiple_members(self, c_id, num=2):
+        m_ids = [uuid4().hex for _ in range(num)]
+        pcrv = self.app.post("/{}/".format(c_id), data={"member": m_ids})
+        pcrj = self.response_200_json(pcrv)
+        self.assertEqual([x['identifier'] for x in pcrj['Added']], m_ids)
+        return m_ids
 
     def test_get_empty_root(self):
         rj = self.get_root()
@@ -121,6 +146,30 @@ class Mixin:
         self.assertEqual(m_id, self.get_container(c_id)['Members'][0]['identifier'])
         self.get_member(c_id, m_id)
 
+    def test_add_multiple_members_to_container(self):
+        c_id = self.add_container()
+        m_ids = self.add_multiple_members(c_id, 5)
+        self.assertEqual([x['identifier'] for x in self.get_container(c_id)['Members']], m_ids)
+        self.remove_member(c_id, m_ids[2])
+        self.assertEqual([x['identifier'] for x in self.get_container(c_id)['Members']],
+                         m_ids[:2] + m_ids[3:])
+
+    def test_add_multiple_members_to_container_that_doesnt_exist_404s(self):
+        pcrv = self.app.post("/{}/".format(uuid4().hex), data={"member": ["a", "b"]})
+        self.assertEqual(pcrv.status_code, 404)
+
+    def test_bulk_removal(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        c_ids = storage.mint_containers(3)
+        m_ids = storage.add_members(c_ids[0], ["a", "b", "c"])
+        self.assertEqual(storage.rm_members(c_ids[0], ["a", "c"]), ["a", "c"])
+        self.assertEqual(storage.ls_members(c_ids[0], "0", 10)[1], ["b"])
+        self.assertEqual(m_ids, ["a", "b", "c"])
+        storage.rm_containers(c_ids[:2])
+        self.assertFalse(storage.container_exists(c_ids[0]))
+        self.assertFalse(storage.container_exists(c_ids[1]))
+        self.assertTrue(storage.container_exists(c_ids[2]))
+
     def test_add_member_to_container_that_doesnt_exist_404s(self):
         c_id = uuid4().hex
         pcrv = self.app.post("/{}/".format(c_id), data={"member": uuid4().hex})
@@ -210,6 +259,271 @@ class Mixin:
         for x in m_ids:
             self.assertIn(x, comp_m_ids)
 
+    def test_members_pages_in_insertion_order(self):
+        c_id = self.add_container()
+        m_ids = [self.add_member(c_id) for _ in range(7)]
+        next_cursor = "0"
+        pages = []
+        while next_cursor is not None:
+            rv = self.app.get("/{}/".format(c_id), data={"limit": 3, "cursor": next_cursor})
+            rj = self.response_200_json(rv)
+            next_cursor = rj['pagination']['next_cursor']
+            pages.append([x['identifier'] for x in rj['Members']])
+        self.assertEqual(pages, [m_ids[0:3], m_ids[3:6], m_ids[6:]])
+
+    def test_container_conditional_get(self):
+        c_id = self.add_container()
+        rv = self.app.get("/{}/".format(c_id))
+        etag = rv.headers['ETag']
+        rv = self.app.get("/{}/".format(c_id), headers={"If-None-Match": etag})
+        self.assertEqual(rv.status_code, 304)
+        self.assertEqual(rv.headers['ETag'], etag)
+        m_id = self.add_member(c_id)
+        rv = self.app.get("/{}/".format(c_id), headers={"If-None-Match": etag})
+        rj = self.response_200_json(rv)
+        self.assertEqual(rj['Members'][0]['identifier'], m_id)
+        self.assertNotEqual(rv.headers['ETag'], etag)
+        etag = rv.headers['ETag']
+        self.app.delete("/{}/{}".format(c_id, uuid4().hex))
+        rv = self.app.get("/{}/".format(c_id), headers={"If-None-Match": etag})
+        self.assertEqual(rv.status_code, 304)
+        self.remove_member(c_id, m_id)
+        rv = self.app.get("/{}/".format(c_id), headers={"If-None-Match": etag})
+        self.assertEqual(rv.status_code, 200)
+        self.remove_container(c_id)
+        rv = self.app.get("/{}/".format(c_id), headers={"If-None-Match": etag})
+        self.assertEqual(rv.status_code, 404)
+
+    def test_member_conditional_get(self):
+        c_id = self.add_container()
+        m_id = self.add_member(c_id)
+        etag = self.app.get("/{}/{}".format(c_id, m_id)).headers['ETag']
+        rv = self.app.get("/{}/{}".format(c_id, m_id), headers={"If-None-Match": etag})
+        self.assertEqual(rv.status_code, 304)
+        rv = self.app.get("/{}/{}".format(c_id, m_id), headers={"If-None-Match": "*"})
+        self.assertEqual(rv.status_code, 304)
+        rv = self.app.get("/{}/nope".format(c_id), headers={"If-None-Match": "*"})
+        self.assertEqual(rv.status_code, 404)
+        self.remove_member(c_id, m_id)
+        rv = self.app.get("/{}/{}".format(c_id, m_id), headers={"If-None-Match": etag})
+        self.assertEqual(rv.status_code, 404)
+
+    def test_listing_variants_tagged_apart(self):
+        c_id = self.add_container()
+        self.app.post("/{}/".format(c_id), data={"member": ["a", "b"]})
+        url = "/{}/".format(c_id)
+        rv = self.app.get(url, data={"limit": 1})
+        etag = rv.headers.get('ETag')
+        if etag is None:
+            self.skipTest("Backend doesn't version containers")
+        for args in [{"limit": 1, "cursor": rv.get_json()['pagination']['next_cursor']},
+                     {"limit": 2}, {"limit": 1, "links": "false"},
+                     {"limit": 1, "total": "true"}]:
+            rv = self.app.get(url, data=args, headers={"If-None-Match": etag})
+            self.assertEqual(rv.status_code, 200)
+            self.assertNotEqual(rv.headers['ETag'], etag)
+        rv = self.app.get(url, data={"limit": 1}, headers={"If-None-Match": etag})
+        self.assertEqual(rv.status_code, 304)
+        # HEAD answers with the tag GET would
+        self.assertEqual(self.app.head(url, data={"limit": 1}).headers['ETag'], etag)
+        etag = self.app.get("/", data={"limit": 1}).headers['ETag']
+        rv = self.app.get("/", data={"limit": 1, "links": "false"},
+                          headers={"If-None-Match": etag})
+        self.assertEqual(rv.status_code, 200)
+        if idnest.blueprint.representations.orjson is not None:
+            # Other bytes, so another tag
+            etag = self.app.get(url).headers['ETag']
+            with mock.patch.dict(idnest.blueprint.BLUEPRINT.config, {'JSON_LIBRARY': "orjson"}):
+                rv = self.app.get(url, headers={"If-None-Match": etag})
+            self.assertEqual(rv.status_code, 200)
+
+    def test_root_conditional_get(self):
+        etag = self.app.get("/").headers['ETag']
+        rv = self.app.get("/", headers={"If-None-Match": etag})
+        self.assertEqual(rv.status_code, 304)
+        c_id = self.add_container()
+        rv = self.app.get("/", headers={"If-None-Match": etag})
+        self.assertEqual(rv.status_code, 200)
+        etag = rv.headers['ETag']
+        self.remove_container(c_id)
+        rv = self.app.get("/", headers={"If-None-Match": etag})
+        self.assertEqual(rv.status_code, 200)
+
+    def test_export_members(self):
+        c_id = self.add_container()
+        m_ids = self.add_multiple_members(c_id, 25)
+        self.remove_member(c_id, m_ids[3])
+        del m_ids[3]
+        rv = self.app.get("/{}/_export".format(c_id))
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(rv.mimetype, "application/x-ndjson")
+        lines = [json.loads(x) for x in rv.data.decode().splitlines()]
+        self.assertEqual([x['identifier'] for x in lines], m_ids)
+        self.assertEqual(lines[0]['_link'], "/{}/{}".format(c_id, m_ids[0]))
+
+    def test_member_named_like_a_file(self):
+        c_id = self.add_container()
+        self.app.post("/{}/".format(c_id), data={"member": "members.ndjson"})
+        rv = self.app.get("/{}/members.ndjson".format(c_id))
+        rj = self.response_200_json(rv)
+        self.assertEqual(rj['_self']['identifier'], "members.ndjson")
+        self.assertEqual(self.app.delete("/{}/members.ndjson".format(c_id)).status_code, 200)
+        self.assertEqual(self.app.get("/{}/members.ndjson".format(c_id)).status_code, 404)
+
+    def test_export_chunks(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        c_id = storage.mint_container()
+        m_ids = [str(x) for x in range(1, 11)]
+        storage.add_members(c_id, m_ids)
+        for chunk_size in (1, 3, 5, 10, 11):
+            self.assertEqual(list(storage.iter_members(c_id, chunk_size)), m_ids)
+
+    def test_export_empty_container(self):
+        c_id = self.add_container()
+        rv = self.app.get("/{}/_export".format(c_id))
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(rv.data, b"")
+
+    def test_export_nonexistant_container_404s(self):
+        rv = self.app.get("/{}/_export".format(uuid4().hex))
+        self.assertEqual(rv.status_code, 404)
+
+    def test_import_ndjson(self):
+        c_id = self.add_container()
+        rows = [{"container": c_id, "member": str(x)} for x in range(5)] + \
+            [{"container": "@new", "member": "a"}, {"container": "@empty"},
+             {"container": "@new", "member": "b"}, {"member": "orphan"}, "garbage",
+             {"container": uuid4().hex, "member": "c"}]
+        body = "\n".join(json.dumps(x) for x in rows) + "\nnot json\n"
+        with mock.patch.dict(idnest.blueprint.BLUEPRINT.config, {'IMPORT_BATCH_SIZE': 2}):
+            rv = self.app.post("/_import", data=body, content_type="application/x-ndjson")
+        rj = self.response_200_json(rv)
+        self.assertEqual(rj['rows'], 9)
+        self.assertEqual(rj['added'], 7)
+        self.assertEqual([x['line'] for x in rj['Errors']], [9, 10, 12])
+        self.assertEqual(sorted(rj['Minted'].keys()), ["@empty", "@new"])
+        self.assertEqual([x['identifier'] for x in self.get_container(c_id)['Members']],
+                         [str(x) for x in range(5)])
+        new = self.get_container(rj['Minted']['@new'])['Members']
+        self.assertEqual([x['identifier'] for x in new], ["a", "b"])
+        self.assertEqual(self.get_container(rj['Minted']['@empty'])['Members'], [])
+        self.assertEqual(sum(x['added'] for x in rj['Batches']), 7)
+        self.assertEqual(len([x for x in rj['Batches'] if 'error' in x]), 1)
+        self.assertTrue(all(x['submitted'] <= 2 for x in rj['Batches']))
+
+    def test_import_csv(self):
+        c_id = self.add_container()
+        body = "container,member\n{0},1\n{0},2\n@x,3\n@x\n,4\n{0},5,6\n".format(c_id)
+        rv = self.app.post("/_import", data=body, content_type="text/csv")
+        rj = self.response_200_json(rv)
+        self.assertEqual(rj['added'], 3)
+        self.assertEqual([x['line'] for x in rj['Errors']], [6, 7])
+        self.assertEqual([x['identifier'] for x in self.get_container(c_id)['Members']],
+                         ["1", "2"])
+        self.assertEqual([x['identifier'] for x in
+                          self.get_container(rj['Minted']['@x'])['Members']], ["3"])
+
+    def test_import_csv_stray_quote(self):
+        c_id = self.add_container()
+        body = '{0},1\n{0},"bad\n{0},3\n{0},4\n'.format(c_id)
+        rv = self.app.post("/_import", data=body, content_type="text/csv")
+        rj = self.response_200_json(rv)
+        self.assertEqual(rj['rows'], 3)
+        self.assertEqual([x['line'] for x in rj['Errors']], [2])
+        self.assertEqual([x['identifier'] for x in self.get_container(c_id)['Members']],
+                         ["1", "3", "4"])
+
+    def test_import_csv_malformed_rows(self):
+        c_id = self.add_container()
+        body = '{0},1\n{0},"x"y\n{0},"a\rb"\n{0},2\r\n{0},"3"\n'.format(c_id)
+        rv = self.app.post("/_import", data=body, content_type="text/csv")
+        rj = self.response_200_json(rv)
+        self.assertEqual([x['line'] for x in rj['Errors']], [2, 3])
+        self.assertEqual([x['identifier'] for x in self.get_container(c_id)['Members']],
+                         ["1", "2", "3"])
+
+    def test_import_invalid_utf8(self):
+        c_id = self.add_container()
+        rows = [json.dumps({"container": c_id, "member": x}).encode("utf-8") for x in "abc"]
+        body = b"\n".join(rows[:2] + [b"\xff\xfe"] + rows[2:]) + b"\n"
+        with mock.patch.dict(idnest.blueprint.BLUEPRINT.config, {'IMPORT_BATCH_SIZE': 1}):
+            rv = self.app.post("/_import", data=body, content_type="application/x-ndjson")
+        rj = self.response_200_json(rv)
+        self.assertEqual(rj['added'], 3)
+        self.assertEqual([x['line'] for x in rj['Errors']], [3])
+        self.assertEqual([x['identifier'] for x in self.get_container(c_id)['Members']],
+                         ["a", "b", "c"])
+        body = "container,member\n{},1\n".format(c_id).encode("utf-8") + b"@x,\xff\n"
+        rv = self.app.post("/_import", data=body, content_type="text/csv")
+        rj = self.response_200_json(rv)
+        self.assertEqual(rj['added'], 1)
+        self.assertEqual([x['line'] for x in rj['Errors']], [3])
+        self.assertEqual(rj['Minted'], {})
+
+    def test_batch_members(self):
+        c_ids = self.add_multiple_containers(3)
+        m_ids = [self.add_multiple_members(c_ids[0], 5), self.add_multiple_members(c_ids[1], 1)]
+        missing = uuid4().hex
+        rv = self.app.post("/_batch/members",
+                           data=json.dumps({"container": c_ids + [missing], "limit": 3}),
+                           content_type="application/json")
+        rj = self.response_200_json(rv)
+        listings = rj['Containers']
+        self.assertEqual([x['identifier'] for x in listings], c_ids + [missing])
+        self.assertEqual([x['identifier'] for x in listings[0]['Members']], m_ids[0][:3])
+        self.assertEqual([x['identifier'] for x in listings[1]['Members']], m_ids[1])
+        self.assertEqual(listings[2]['Members'], [])
+        self.assertIn("error", listings[3])
+        self.assertIsNone(listings[1]['pagination']['next_cursor'])
+        # The next cursor picks up where the batch left off
+        rv = self.app.get("/{}/".format(c_ids[0]),
+                          data={"cursor": listings[0]['pagination']['next_cursor']})
+        rj = self.response_200_json(rv)
+        self.assertEqual([x['identifier'] for x in rj['Members']], m_ids[0][3:])
+
+    def test_batch_members_form(self):
+        c_ids = self.add_multiple_containers(2)
+        rv = self.app.post("/_batch/members", data={"container": c_ids})
+        rj = self.response_200_json(rv)
+        self.assertEqual([x['identifier'] for x in rj['Containers']], c_ids)
+
+    def test_member_containers(self):
+        c_ids = sorted(self.add_multiple_containers(5))
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        for c_id in c_ids[:4]:
+            storage.add_members(c_id, ["shared", "other"])
+        storage.rm_member(c_ids[1], "shared")
+        storage.rm_container(c_ids[2])
+        next_cursor = "0"
+        found = []
+        while next_cursor is not None:
+            rv = self.app.get("/_members/shared/containers",
+                              data={"limit": 1, "cursor": next_cursor})
+            rj = self.response_200_json(rv)
+            next_cursor = rj['pagination']['next_cursor']
+            found.extend(x['identifier'] for x in rj['Containers'])
+        self.assertEqual(found, [c_ids[0], c_ids[3]])
+        self.assertEqual(rj['_self']['_link'], "/_members/shared/containers")
+        self.assertEqual(storage.ls_member_containers("other", "0", 10),
+                         (None, [c_ids[0], c_ids[1], c_ids[3]]))
+        self.assertEqual(storage.ls_member_containers("nothing", "0", 10), (None, []))
+
+    def test_members_exist(self):
+        c_id = self.add_container()
+        m_ids = self.add_multiple_members(c_id, 3)
+        self.remove_member(c_id, m_ids[1])
+        asked = m_ids + [uuid4().hex, m_ids[0]]
+        rv = self.app.post("/{}/_exists".format(c_id), data=json.dumps({"member": asked}),
+                           content_type="application/json")
+        rj = self.response_200_json(rv)
+        self.assertEqual([x['identifier'] for x in rj['Members']], asked)
+        self.assertEqual([x['exists'] for x in rj['Members']],
+                         [True, False, True, False, True])
+
+    def test_members_exist_in_nonexistant_container_404s(self):
+        rv = self.app.post("/{}/_exists".format(uuid4().hex), data={"member": ["a"]})
+        self.assertEqual(rv.status_code, 404)
+
     def test_outside_pagination_range_containers(self):
         rv = self.app.get("/", data={"offset": 1001})
         self.response_200_json(rv)
@@ -222,19 +536,871 @@ class Mixin:
         rj = self.response_200_json(rv)
         self.assertEqual(rj['version'], idnest.blueprint.__version__)
 
+    def test_listings_without_links(self):
+        rv = self.app.post("/", data={"num": 2, "links": "false"})
+        rj = self.response_200_json(rv)
+        self.assertNotIn("_link", rj['Minted'][0])
+        c_id = rj['Minted'][0]['identifier']
+        rv = self.app.post("/{}/?links=false".format(c_id), data={"member": ["a", "b"]})
+        rj = self.response_200_json(rv)
+        self.assertEqual(rj['Added'], [{"identifier": "a"}, {"identifier": "b"}])
+        rj = self.response_200_json(self.app.get("/{}/".format(c_id), data={"links": "false"}))
+        self.assertEqual(rj['Members'], [{"identifier": "a"}, {"identifier": "b"}])
+        self.assertEqual(rj['_self']['_link'], "/{}/".format(c_id))
+        rj = self.response_200_json(self.app.get("/", data={"links": "False"}))
+        self.assertTrue(all(x.keys() == {"identifier"} for x in rj['Containers']))
+        rj = self.response_200_json(self.app.get("/_members/a/containers?links=0"))
+        self.assertEqual(rj['Containers'], [{"identifier": c_id}])
+        rj = self.response_200_json(self.app.get("/", data={"links": "true"}))
+        self.assertTrue(all("_link" in x for x in rj['Containers']))
+        rv = self.app.get("/", data={"links": "maybe"})
+        self.assertEqual(rv.status_code, 400)
 
-class RAMIdnestTestCase(unittest.TestCase, Mixin):
+    def test_count_members(self):
+        c_id = self.add_container()
+        rv = self.app.head("/{}/".format(c_id))
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(rv.headers[idnest.blueprint.COUNT_HEADER], "0")
+        self.app.post("/{}/".format(c_id), data={"member": ["a", "b", "c"]})
+        self.app.delete("/{}/b".format(c_id))
+        rv = self.app.head("/{}/".format(c_id))
+        self.assertEqual(rv.headers[idnest.blueprint.COUNT_HEADER], "2")
+        self.assertEqual(rv.data, b"")
+        etag = rv.headers.get("ETag")
+        if etag is not None:
+            rv = self.app.head("/{}/".format(c_id), headers={"If-None-Match": etag})
+            self.assertEqual(rv.status_code, 304)
+        rv = self.app.get("/{}/".format(c_id), data={"total": "true", "limit": 1})
+        rj = self.response_200_json(rv)
+        self.assertEqual(rj['pagination']['total'], 2)
+        self.assertEqual([x['identifier'] for x in rj['Members']], ["a"])
+        rj = self.response_200_json(self.app.get("/{}/".format(c_id)))
+        self.assertNotIn("total", rj['pagination'])
+        self.assertEqual(self.app.head("/{}/".format(uuid4().hex)).status_code, 404)
+        rv = self.app.get("/{}/".format(uuid4().hex), data={"total": "true"})
+        self.assertEqual(rv.status_code, 404)
+
+
+class KeysetContainersMixin:
+    """
+    Tests for backends which list containers in id order with keyset cursors
+    """
+    def test_containers_keyset_pagination_is_sorted(self):
+        c_ids = self.add_multiple_containers(25)
+        next_cursor = "0"
+        comp_c_ids = []
+        while next_cursor is not None:
+            rv = self.app.get("/", data={"limit": 10, "cursor": next_cursor})
+            rj = self.response_200_json(rv)
+            next_cursor = rj['pagination']['next_cursor']
+            if next_cursor is not None:
+                self.assertTrue(next_cursor.startswith(idnest.blueprint.KEYSET_CURSOR_PREFIX))
+            comp_c_ids.extend(x['identifier'] for x in rj['Containers'])
+        self.assertEqual(comp_c_ids, sorted(c_ids))
+
+    def test_containers_legacy_offset_cursor(self):
+        c_ids = sorted(self.add_multiple_containers(5))
+        rv = self.app.get("/", data={"limit": 2, "cursor": "2"})
+        rj = self.response_200_json(rv)
+        self.assertEqual([x['identifier'] for x in rj['Containers']], c_ids[2:4])
+        rv = self.app.get("/", data={"limit": 2, "cursor": rj['pagination']['next_cursor']})
+        rj = self.response_200_json(rv)
+        self.assertEqual([x['identifier'] for x in rj['Containers']], c_ids[4:])
+        self.assertIsNone(rj['pagination']['next_cursor'])
+
+    def test_containers_keyset_cursor_survives_removal(self):
+        c_ids = sorted(self.add_multiple_containers(4))
+        rv = self.app.get("/", data={"limit": 2})
+        rj = self.response_200_json(rv)
+        self.remove_container(c_ids[1])
+        rv = self.app.get("/", data={"limit": 2, "cursor": rj['pagination']['next_cursor']})
+        rj = self.response_200_json(rv)
+        self.assertEqual([x['identifier'] for x in rj['Containers']], c_ids[2:])
+
+    def test_malformed_cursor_400s(self):
+        rv = self.app.get("/", data={"cursor": "nonsense"})
+        self.assertEqual(rv.status_code, 400)
+
+
+class RAMIdnestTestCase(unittest.TestCase, Mixin, KeysetContainersMixin):
     def setUp(self):
         idnest.app.config['TESTING'] = True
         self.app = idnest.app.test_client()
         idnest.blueprint.BLUEPRINT.config['storage'] = idnest.blueprint.RAMStorageBackend(
-            idnest.blueprint)
+            idnest.blueprint.BLUEPRINT)
 
     def tearDown(self):
         del idnest.blueprint.BLUEPRINT.config['storage']
 
+    def test_cache_info_404s_without_caching(self):
+        rv = self.app.get("/_cache")
+        self.assertEqual(rv.status_code, 404)
+
+    def test_member_containers_fallback(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        c_ids = sorted(storage.mint_containers(7))
+        for c_id in c_ids[1::2]:
+            storage.add_member(c_id, "a")
+        fallback = idnest.blueprint.IStorageBackend.ls_member_containers
+        next_cursor, page = fallback(storage, "a", "0", 2)
+        self.assertEqual(page, c_ids[1:4:2])
+        self.assertEqual(fallback(storage, "a", next_cursor, 2), (None, [c_ids[5]]))
+
+    def test_count_members_counts_duplicates(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        c_id = storage.mint_container()
+        storage.add_members(c_id, ["a", "b", "a", "a"])
+        storage.rm_member(c_id, "a")
+        self.assertEqual(storage.count_members(c_id), 3)
+        fallback = idnest.blueprint.IStorageBackend.count_members
+        self.assertEqual(fallback(storage, c_id), 3)
+        self.assertIsNone(fallback(storage, uuid4().hex))
+        self.assertIsNone(storage.count_members(uuid4().hex))
+
+    def test_member_containers_with_duplicates(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        c_id = storage.mint_container()
+        storage.add_members(c_id, ["a", "a"])
+        storage.rm_member(c_id, "a")
+        self.assertEqual(storage.ls_member_containers("a", "0", 10), (None, [c_id]))
+        storage.rm_member(c_id, "a")
+        self.assertEqual(storage.ls_member_containers("a", "0", 10), (None, []))
+
+    def test_members_keyset_cursor_survives_removal(self):
+        c_id = self.add_container()
+        m_ids = [self.add_member(c_id) for _ in range(6)]
+        rv = self.app.get("/{}/".format(c_id), data={"limit": 3})
+        rj = self.response_200_json(rv)
+        self.remove_member(c_id, m_ids[0])
+        self.remove_member(c_id, m_ids[4])
+        rv = self.app.get("/{}/".format(c_id),
+                          data={"limit": 3, "cursor": rj['pagination']['next_cursor']})
+        rj = self.response_200_json(rv)
+        self.assertEqual([x['identifier'] for x in rj['Members']], [m_ids[3], m_ids[5]])
+        self.assertIsNone(rj['pagination']['next_cursor'])
+
+
+class JournaledRAMIdnestTestCase(unittest.TestCase, Mixin, KeysetContainersMixin):
+    backend = idnest.blueprint.JournaledRAMStorageBackend
 
-class MongoIdnestTestCase(unittest.TestCase, Mixin):
+    def setUp(self):
+        idnest.app.config['TESTING'] = True
+        self.app = idnest.app.test_client()
+        self.tmpdir = TemporaryDirectory()
+        idnest.blueprint.BLUEPRINT.config['RAM_JOURNAL_DIR'] = self.tmpdir.name
+        idnest.blueprint.BLUEPRINT.config['RAM_SNAPSHOT_INTERVAL'] = 0
+        idnest.blueprint.BLUEPRINT.config['storage'] = self.backend(idnest.blueprint.BLUEPRINT)
+
+    def tearDown(self):
+        idnest.blueprint.BLUEPRINT.config['storage'].close()
+        del idnest.blueprint.BLUEPRINT.config['storage']
+        del idnest.blueprint.BLUEPRINT.config['RAM_JOURNAL_DIR']
+        del idnest.blueprint.BLUEPRINT.config['RAM_SNAPSHOT_INTERVAL']
+        self.tmpdir.cleanup()
+
+    def reopen(self):
+        idnest.blueprint.BLUEPRINT.config['storage'].close()
+        storage = self.backend(idnest.blueprint.BLUEPRINT)
+        idnest.blueprint.BLUEPRINT.config['storage'] = storage
+        return storage
+
+    def populate(self, storage):
+        c_ids = storage.mint_containers(3)
+        storage.add_members(c_ids[0], ["a", "b", "a", "c"])
+        storage.add_members(c_ids[1], ["b", "\u00e9t\u00e9"])
+        storage.rm_member(c_ids[0], "a")
+        storage.rm_container(c_ids[2])
+        return c_ids
+
+    def assert_populated(self, storage, c_ids):
+        self.assertEqual(storage.ls_containers("0", 10)[1], sorted(c_ids[:2]))
+        self.assertEqual(list(storage.iter_members(c_ids[0])), ["b", "a", "c"])
+        self.assertEqual(list(storage.iter_members(c_ids[1])), ["b", "\u00e9t\u00e9"])
+        self.assertEqual(storage.ls_member_containers("b", "0", 10)[1], sorted(c_ids[:2]))
+        self.assertEqual(storage.ls_member_containers("a", "0", 10)[1], [c_ids[0]])
+
+    def test_replays_journal(self):
+        c_ids = self.populate(idnest.blueprint.BLUEPRINT.config['storage'])
+        self.assert_populated(self.reopen(), c_ids)
+
+    def test_restores_snapshot_and_journal_tail(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        c_ids = self.populate(storage)
+        cursor, _ = storage.ls_members(c_ids[0], "0", 1)
+        generation = storage.snapshot()
+        storage.add_member(c_ids[1], "d")
+        self.assertEqual(idnest.blueprint.journal.journal_generations(self.tmpdir.name),
+                         [generation])
+        storage = self.reopen()
+        self.assertEqual(list(storage.iter_members(c_ids[1])), ["b", "\u00e9t\u00e9", "d"])
+        storage.rm_member(c_ids[1], "d")
+        self.assert_populated(storage, c_ids)
+        # Sequence numbers are kept, so cursors handed out before still work
+        self.assertEqual(storage.ls_members(c_ids[0], cursor, 10)[1], ["a", "c"])
+        # As is everything else after another round
+        storage.snapshot()
+        self.assert_populated(self.reopen(), c_ids)
+
+    def test_drops_torn_record(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        c_id = storage.mint_container()
+        storage.add_member(c_id, "a")
+        storage.close()
+        generation = idnest.blueprint.journal.journal_generations(self.tmpdir.name)[-1]
+        path = idnest.blueprint.journal.journal_path(self.tmpdir.name, generation)
+        size = os.path.getsize(path)
+        record = idnest.blueprint.journal.encode_record(
+            idnest.blueprint.journal.ADD_MEMBERS, [c_id, "b"])
+        with open(path, "ab") as f:
+            f.write(record[:-1])
+        storage = self.backend(idnest.blueprint.BLUEPRINT)
+        idnest.blueprint.BLUEPRINT.config['storage'] = storage
+        self.assertEqual(list(storage.iter_members(c_id)), ["a"])
+        self.assertEqual(os.path.getsize(path), size)
+        storage.add_member(c_id, "c")
+        self.assertEqual(list(self.reopen().iter_members(c_id)), ["a", "c"])
+
+    def test_failed_writes_are_not_journaled(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        with self.assertRaises(KeyError):
+            storage.add_member(uuid4().hex, "a")
+        self.assertEqual(storage.journal.appended, 0)
+
+    def test_read_only_after_journal_failure(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        c_id = storage.mint_container()
+        storage.add_member(c_id, "a")
+        with mock.patch("idnest.blueprint.journal.os.fsync", side_effect=OSError("disk full")):
+            with self.assertRaises(IOError):
+                storage.add_member(c_id, "b")
+        # Nothing more reaches the journal, after what may be a torn record
+        appended = storage.journal.appended
+        for write in [lambda: storage.add_member(c_id, "c"), storage.mint_container,
+                      lambda: storage.rm_container(c_id), storage.snapshot]:
+            with self.assertRaises(IOError):
+                write()
+        self.assertEqual(storage.journal.appended, appended)
+        self.assertTrue(storage.container_exists(c_id))
+        # Whether "b" made it to disk before the failed fsync is up to the
+        # disk, but nothing refused after it is there
+        self.assertIn(list(self.reopen().iter_members(c_id)), (["a"], ["a", "b"]))
+
+    def test_group_commit(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        storage.journal.commit_delay = 0.01
+        c_id = storage.mint_container()
+        fsync = os.fsync
+        with mock.patch("idnest.blueprint.journal.os.fsync", wraps=fsync) as counted:
+            threads = [Thread(target=lambda n=n: [storage.add_member(c_id, "{}-{}".format(n, i))
+                                                  for i in range(10)])
+                       for n in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        self.assertLess(counted.call_count, 80)
+        self.assertEqual(len(list(self.reopen().iter_members(c_id))), 80)
+
+
+class CompactRAMIdnestTestCase(unittest.TestCase, Mixin, KeysetContainersMixin):
+    def setUp(self):
+        idnest.app.config['TESTING'] = True
+        self.app = idnest.app.test_client()
+        idnest.blueprint.BLUEPRINT.config['storage'] = \
+            idnest.blueprint.CompactRAMStorageBackend(idnest.blueprint.BLUEPRINT)
+
+    def tearDown(self):
+        del idnest.blueprint.BLUEPRINT.config['storage']
+
+    def test_malformed_container_ids(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        for c_id in ["foo", uuid4().hex.upper(), uuid4().hex + "0"]:
+            self.assertFalse(storage.container_exists(c_id))
+            self.assertFalse(storage.member_exists(c_id, "a"))
+            self.assertEqual(storage.rm_container(c_id), c_id)
+            with self.assertRaises(KeyError):
+                storage.add_member(c_id, "a")
+            rv = self.app.get("/{}/".format(c_id))
+            self.assertEqual(rv.status_code, 404)
+
+    def test_symbols_are_shared_and_freed(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        # Going from a number, to an array and then a set of containers
+        storage.MAX_HOLDERS_ARRAY = 2
+        c_ids = sorted(storage.mint_containers(3))
+        for c_id in c_ids:
+            storage.add_members(c_id, ["a", "b"])
+        self.assertEqual(len(storage.symbols), 2)
+        self.assertIsInstance(storage.holders[storage.symbols["a"]], set)
+        self.assertEqual(storage.ls_member_containers("a", "0", 10), (None, c_ids))
+        storage.rm_container(c_ids[0])
+        storage.rm_member(c_ids[1], "a")
+        self.assertEqual(storage.ls_member_containers("a", "0", 10), (None, c_ids[2:]))
+        storage.rm_member(c_ids[2], "a")
+        self.assertNotIn("a", storage.symbols)
+        self.assertEqual(storage.ls_member_containers("a", "0", 10), (None, []))
+        # Its symbol goes to the next new member
+        storage.add_member(c_ids[1], "c")
+        self.assertEqual(len(storage.names), 2)
+        self.assertEqual(list(storage.iter_members(c_ids[1])), ["b", "c"])
+        self.assertEqual(list(storage.iter_members(c_ids[2])), ["b"])
+
+    def test_duplicates(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        c_id = storage.mint_container()
+        storage.add_members(c_id, ["a", "b", "a"])
+        storage.rm_member(c_id, "a")
+        self.assertEqual(list(storage.iter_members(c_id)), ["b", "a"])
+        self.assertEqual(storage.ls_member_containers("a", "0", 10), (None, [c_id]))
+        storage.rm_member(c_id, "a")
+        self.assertFalse(storage.member_exists(c_id, "a"))
+        self.assertEqual(storage.ls_member_containers("a", "0", 10), (None, []))
+
+    def test_no_duplicates(self):
+        with mock.patch.dict(idnest.blueprint.BLUEPRINT.config,
+                             {'RAM_ALLOW_DUPLICATE_MEMBERS': False}):
+            storage = idnest.blueprint.CompactRAMStorageBackend(idnest.blueprint.BLUEPRINT)
+        c_id = storage.mint_container()
+        storage.add_members(c_id, ["a", "a"])
+        self.assertEqual(list(storage.iter_members(c_id)), ["a"])
+
+    def test_paging_across_compaction(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        c_id = storage.mint_container()
+        m_ids = [str(i) for i in range(100)]
+        storage.add_members(c_id, m_ids)
+        cursor, page = storage.ls_members(c_id, "0", 10)
+        self.assertEqual(page, m_ids[:10])
+        storage.rm_members(c_id, m_ids[:60])
+        self.assertIsNotNone(storage.members(c_id).stored_seqs)
+        storage.add_member(c_id, "a")
+        self.assertEqual(storage.ls_members(c_id, cursor, 50), (None, m_ids[60:] + ["a"]))
+
+    def test_requires_hex_ids(self):
+        with mock.patch.dict(idnest.blueprint.BLUEPRINT.config, {'ID_SCHEME': "ulid"}):
+            with self.assertRaises(RuntimeError):
+                idnest.blueprint.CompactRAMStorageBackend(idnest.blueprint.BLUEPRINT)
+
+
+class JournaledCompactRAMIdnestTestCase(JournaledRAMIdnestTestCase):
+    backend = idnest.blueprint.JournaledCompactRAMStorageBackend
+
+    def test_restores_compact_state(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        c_ids = self.populate(storage)
+        storage.snapshot()
+        storage = self.reopen()
+        self.assertIsInstance(storage.data[bytes.fromhex(c_ids[0])],
+                              idnest.blueprint.CompactMemberList)
+        # The untouched container needn't store its sequence numbers
+        self.assertIsNone(storage.members(c_ids[1]).stored_seqs)
+        self.assertEqual(len(storage.symbols), 4)
+        self.assert_populated(storage, c_ids)
+
+
+class MemberListTestCase(unittest.TestCase):
+    def test_duplicates_removed_oldest_first(self):
+        members = idnest.blueprint.MemberList()
+        for m_id in ["a", "b", "a", "c"]:
+            members.append(m_id)
+        self.assertTrue(members.remove("a"))
+        self.assertIn("a", members)
+        self.assertEqual(list(members), ["b", "a", "c"])
+        self.assertTrue(members.remove("a"))
+        self.assertNotIn("a", members)
+        self.assertFalse(members.remove("a"))
+        self.assertEqual(len(members), 2)
+
+    def test_no_duplicates(self):
+        members = idnest.blueprint.MemberList(allow_duplicates=False)
+        self.assertTrue(members.append("a"))
+        self.assertFalse(members.append("a"))
+        self.assertEqual(list(members), ["a"])
+
+    def test_paging_across_tombstones_and_compaction(self):
+        members = idnest.blueprint.MemberList()
+        for i in range(100):
+            members.append(str(i))
+        for i in range(0, 100, 3):
+            members.remove(str(i))
+        live = [str(i) for i in range(100) if i % 3]
+        self.assertEqual(members.page(5, offset=10)[0], live[10:15])
+        paged = []
+        page, after = members.page(7, offset=0)
+        paged.extend(page)
+        while after is not None:
+            page, after = members.page(7, after=after)
+            paged.extend(page)
+        self.assertEqual(paged, live)
+        for m_id in live[:60]:
+            members.remove(m_id)
+        self.assertLessEqual(members.removed, len(members))
+        self.assertLess(len(members.slots), 66)
+        self.assertEqual(list(members), live[60:])
+        self.assertIn(live[61], members)
+
+
+class CachingRAMIdnestTestCase(unittest.TestCase, Mixin, KeysetContainersMixin):
+    def setUp(self):
+        idnest.app.config['TESTING'] = True
+        self.app = idnest.app.test_client()
+        idnest.blueprint.BLUEPRINT.config['storage'] = idnest.blueprint.CachingStorageBackend(
+            idnest.blueprint.RAMStorageBackend(idnest.blueprint.BLUEPRINT), maxsize=100)
+
+    def tearDown(self):
+        del idnest.blueprint.BLUEPRINT.config['storage']
+
+    def test_repeated_reads_hit_the_cache(self):
+        c_id = self.add_container()
+        m_id = self.add_member(c_id)
+        for _ in range(3):
+            self.get_container(c_id)
+            self.get_member(c_id, m_id)
+        rj = self.response_200_json(self.app.get("/_cache"))
+        # Container.get checks existence, version and lists, Member.get checks
+        # version and membership, and the container's version is shared
+        self.assertEqual(rj['misses'], 4)
+        self.assertEqual(rj['hits'], 11)
+
+    def test_writes_invalidate(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        c_id = storage.mint_container()
+        self.assertFalse(storage.member_exists(c_id, "a"))
+        self.assertEqual(storage.ls_members(c_id, "0", 10), (None, []))
+        storage.add_member(c_id, "a")
+        self.assertTrue(storage.member_exists(c_id, "a"))
+        self.assertEqual(storage.ls_members(c_id, "0", 10), (None, ["a"]))
+        storage.rm_member(c_id, "a")
+        self.assertFalse(storage.member_exists(c_id, "a"))
+        storage.add_member(c_id, "b")
+        self.assertTrue(storage.member_exists(c_id, "b"))
+        storage.rm_container(c_id)
+        self.assertFalse(storage.container_exists(c_id))
+        self.assertFalse(storage.member_exists(c_id, "b"))
+
+    def test_members_exist_fills_the_cache(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        c_id = storage.mint_container()
+        storage.add_members(c_id, ["a", "b"])
+        self.assertEqual(storage.members_exist(c_id, ["a", "c"]), [True, False])
+        self.assertEqual(storage.cache_info()['misses'], 2)
+        self.assertEqual(storage.members_exist(c_id, ["a", "b", "c"]), [True, True, False])
+        self.assertEqual(storage.cache_info()['hits'], 2)
+        storage.rm_member(c_id, "a")
+        self.assertFalse(storage.member_exists(c_id, "a"))
+
+    def test_evictions_are_counted(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        c_id = storage.mint_container()
+        for x in range(150):
+            storage.member_exists(c_id, str(x))
+        self.assertEqual(len(storage.cache), 100)
+        self.assertEqual(storage.cache_info()['evictions'], 50)
+
+    def test_entries_expire(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        c_id = storage.mint_container()
+        storage.cache.ttl = 0.01
+        storage.container_exists(c_id)
+        time.sleep(0.02)
+        storage.container_exists(c_id)
+        self.assertEqual(storage.cache_info()['hits'], 0)
+
+
+class LinkTemplateTestCase(unittest.TestCase):
+    def test_matches_url_for(self):
+        m_ids = ["a", "a b", "caf\u00e9", "50%", "x?y#z", "+&=;", "ark:/61001/b2x"]
+        with idnest.app.test_request_context("/", base_url="http://localhost/prefix"):
+            link = idnest.blueprint.link_template(idnest.blueprint.Container, "container_id")
+            for x in m_ids:
+                self.assertEqual(
+                    link(x),
+                    idnest.blueprint.API.url_for(idnest.blueprint.Container, container_id=x))
+            for c_id in m_ids:
+                link = idnest.blueprint.link_template(idnest.blueprint.Member, "member_id",
+                                                      container_id=c_id)
+                for x in m_ids:
+                    self.assertEqual(
+                        link(x),
+                        idnest.blueprint.API.url_for(idnest.blueprint.Member,
+                                                     container_id=c_id, member_id=x))
+
+
+class RepresentationTestCase(unittest.TestCase):
+    IDS = ["a", "caf\u00e9", "\U0001f600", 'q"uo\\te', "tab\there", "\x00\x1f\x7f", "</script>",
+           "ark:/61001/b2x"]
+
+    def setUp(self):
+        idnest.app.config['TESTING'] = True
+        self.app = idnest.app.test_client()
+        idnest.blueprint.BLUEPRINT.config['storage'] = idnest.blueprint.RAMStorageBackend(
+            idnest.blueprint.BLUEPRINT)
+
+    def tearDown(self):
+        del idnest.blueprint.BLUEPRINT.config['storage']
+
+    def assert_matches_flask_restful(self, data):
+        with idnest.app.test_request_context("/"):
+            expected = flask_restful.representations.json.output_json(
+                idnest.blueprint.representations.to_plain(data), 200).get_data()
+            self.assertEqual(
+                idnest.blueprint.representations.output_json(data, 200).get_data(), expected)
+
+    def test_matches_flask_restful(self):
+        Listing = idnest.blueprint.representations.Listing
+        for data in [
+            {"Members": Listing(self.IDS, lambda x: "/c/" + x),
+             "pagination": {"cursor": "0", "limit": 1000, "next_cursor": None},
+             "_self": {"identifier": "c", "_link": "/c/"}},
+            {"Containers": [{"identifier": x, "error": "Container not found"}
+                            for x in self.IDS] +
+             [{"identifier": "c", "Members": Listing(self.IDS), "pagination": {}}]},
+            {"Members": Listing([]), "nested": [[], {}, [1, 2.5, True, False, None]]},
+            {"message": {"limit": "invalid literal for int() with base 10: 'x'"}},
+            {"Deleted": True, "version": "0.0.1", 1: "non-string key"},
+            []
+        ]:
+            self.assert_matches_flask_restful(data)
+
+    def test_item_json_matches_json(self):
+        item_json = idnest.blueprint.representations.item_json
+        for x in self.IDS:
+            self.assertEqual(item_json(x), json.dumps({"identifier": x}))
+            self.assertEqual(item_json(x, lambda x: "/c/" + x),
+                             json.dumps({"identifier": x, "_link": "/c/" + x}))
+
+    def test_responses_match_flask_restful(self):
+        c_id = self.app.post("/", data={"num": 3}).get_json()['Minted'][0]['identifier']
+        self.app.post("/{}/".format(c_id), data={"member": self.IDS})
+        for rv in [
+            self.app.get("/"),
+            self.app.get("/{}/".format(c_id), data={"limit": 3}),
+            self.app.get("/{}/?links=false".format(c_id)),
+            self.app.post("/{}/".format(c_id), data={"member": self.IDS}),
+            self.app.post("/_batch/members", data={"container": [c_id, "nope"]}),
+            self.app.get("/{}/".format(c_id), data={"cursor": "!"}),
+            self.app.get("/_members/a/containers")
+        ]:
+            self.assertEqual(rv.get_data(), (json.dumps(rv.get_json()) + "\n").encode("utf-8"))
+        rv = self.app.get("/{}/_export".format(c_id))
+        for line in rv.get_data(as_text=True).splitlines():
+            self.assertEqual(line, json.dumps(json.loads(line)))
+
+    @unittest.skipUnless(orjson, "orjson isn't installed")
+    def test_orjson(self):
+        c_id = self.app.post("/").get_json()['Minted'][0]['identifier']
+        self.app.post("/{}/".format(c_id), data={"member": self.IDS})
+        expected = self.app.get("/{}/".format(c_id)).get_json()
+        with mock.patch.dict(idnest.blueprint.BLUEPRINT.config, {'JSON_LIBRARY': "orjson"}):
+            rv = self.app.get("/{}/".format(c_id))
+        self.assertEqual(rv.get_json(), expected)
+        self.assertEqual(rv.get_data(), orjson.dumps(expected) + b"\n")
+
+    def test_unsupported_library(self):
+        with self.assertRaises(RuntimeError):
+            idnest.blueprint.representations.json_dumper("pickle")
+        with mock.patch.object(idnest.blueprint.representations, "LIBRARIES",
+                               {"ujson": (None, False)}):
+            with self.assertRaises(RuntimeError):
+                idnest.blueprint.representations.json_dumper("ujson")
+
+
+class CoalescingRAMIdnestTestCase(unittest.TestCase, Mixin, KeysetContainersMixin):
+    def setUp(self):
+        idnest.app.config['TESTING'] = True
+        self.app = idnest.app.test_client()
+        idnest.blueprint.BLUEPRINT.config['storage'] = \
+            idnest.blueprint.CoalescingStorageBackend(
+                idnest.blueprint.RAMStorageBackend(idnest.blueprint.BLUEPRINT), window=0)
+
+    def tearDown(self):
+        del idnest.blueprint.BLUEPRINT.config['storage']
+
+    def concurrently(self, storage, calls):
+        results = [None] * len(calls)
+
+        def call(i, f, *args):
+            try:
+                results[i] = f(*args)
+            except Exception as e:
+                results[i] = e
+
+        threads = [Thread(target=call, args=(i,) + x) for i, x in enumerate(calls)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+
+    def test_coalesces_concurrent_writes(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        storage.window = 0.05
+        c_ids = storage.mint_containers(2)
+        with mock.patch.object(storage.backend, "add_members",
+                               wraps=storage.backend.add_members) as add_members:
+            results = self.concurrently(storage, [
+                (storage.add_member, c_ids[i % 2], str(i)) for i in range(40)
+            ] + [(storage.add_members, c_ids[0], ["x", "y"])])
+        self.assertEqual(results, [str(i) for i in range(40)] + [["x", "y"]])
+        self.assertLessEqual(add_members.call_count, 6)
+        self.assertEqual(storage.writes, 41)
+        self.assertEqual(sorted(storage.iter_members(c_ids[1])),
+                         sorted(str(i) for i in range(1, 40, 2)))
+        self.assertEqual(len(list(storage.iter_members(c_ids[0]))), 22)
+
+    def test_errors_reach_only_their_callers(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        storage.window = 0.05
+        c_id = storage.mint_container()
+        results = self.concurrently(storage, [
+            (storage.add_member, c_id, "a"),
+            (storage.add_member, uuid4().hex, "b"),
+            (storage.rm_member, uuid4().hex, "c"),
+            (storage.add_member, c_id, "d")
+        ])
+        self.assertEqual(results[0], "a")
+        self.assertIsInstance(results[1], KeyError)
+        self.assertIsInstance(results[2], KeyError)
+        self.assertEqual(results[3], "d")
+
+    def test_failed_batches_fail_every_write(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        storage.window = 0.05
+        c_id = storage.mint_container()
+        # A backend answering with the wrong number of results
+        with mock.patch.object(storage.backend, "add_members", return_value=["a"]):
+            results = self.concurrently(storage, [
+                (storage.add_member, c_id, str(i)) for i in range(4)
+            ])
+        self.assertTrue(all(isinstance(x, RuntimeError) for x in results))
+        # Or failing outside of a bulk call
+        with mock.patch.object(storage, "flush", side_effect=ValueError("boom")):
+            results = self.concurrently(storage, [
+                (storage.add_member, c_id, str(i)) for i in range(4)
+            ])
+        self.assertTrue(all(isinstance(x, ValueError) for x in results))
+        self.assertIsNone(storage.batch)
+        self.assertEqual(storage.add_member(c_id, "a"), "a")
+
+    def test_writes_to_a_container_keep_their_order(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        c_id = storage.mint_container()
+        batch = idnest.blueprint.WriteBatch()
+        futures = []
+        for op, m_id in [("add", "a"), ("add", "b"), ("rm", "a"), ("add", "a"), ("rm", "b")]:
+            futures.append(Future())
+            batch.writes.append((op, c_id, [m_id], futures[-1]))
+        storage.flush(batch.writes)
+        self.assertEqual([x.result() for x in futures], [["a"], ["b"], ["a"], ["a"], ["b"]])
+        self.assertEqual(storage.flushes, 4)
+        self.assertEqual(list(storage.iter_members(c_id)), ["a"])
+
+    def test_full_batches_go_at_once(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        storage.window = 10
+        storage.max_batch = 3
+        c_id = storage.mint_container()
+        start = time.monotonic()
+        self.assertEqual(storage.add_members(c_id, ["a", "b", "c"]), ["a", "b", "c"])
+        self.assertLess(time.monotonic() - start, 5)
+
+
+class ShardedRAMIdnestTestCase(unittest.TestCase, Mixin, KeysetContainersMixin):
+    def setUp(self):
+        idnest.app.config['TESTING'] = True
+        self.app = idnest.app.test_client()
+        idnest.blueprint.BLUEPRINT.config['storage'] = idnest.blueprint.ShardedStorageBackend({
+            name: idnest.blueprint.RAMStorageBackend(idnest.blueprint.BLUEPRINT)
+            for name in ["a", "b", "c"]
+        })
+
+    def tearDown(self):
+        del idnest.blueprint.BLUEPRINT.config['storage']
+
+    def test_containers_live_on_the_shard_they_hash_to(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        c_ids = storage.mint_containers(60)
+        storage.add_members(c_ids[0], ["x", "y"])
+        for name, shard in storage.shards.items():
+            held = shard.ls_containers("0", 100)[1]
+            # 60 containers over 3 shards, none should be left out
+            self.assertGreater(len(held), 5)
+            self.assertTrue(all(storage.owner(x) == name for x in held))
+        self.assertEqual(list(storage.shard(c_ids[0]).iter_members(c_ids[0])), ["x", "y"])
+        # Routing depends on nothing but the shard names
+        other = idnest.blueprint.ShardedStorageBackend(
+            {name: idnest.blueprint.RAMStorageBackend(idnest.blueprint.BLUEPRINT)
+             for name in ["c", "b", "a"]})
+        self.assertEqual([other.owner(x) for x in c_ids], [storage.owner(x) for x in c_ids])
+
+    def test_listings_merge_across_shards(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        c_ids = sorted(storage.mint_containers(30))
+        for c_id in c_ids[::3]:
+            storage.add_member(c_id, "shared")
+        for cursor, expected in [("0", c_ids), ("7", c_ids[7:])]:
+            listed = []
+            while cursor is not None:
+                cursor, page = storage.ls_containers(cursor, 4)
+                self.assertLessEqual(len(page), 4)
+                listed.extend(page)
+            self.assertEqual(listed, expected)
+        self.assertEqual(storage.ls_containers("40", 4), (None, []))
+        next_cursor, page = storage.ls_member_containers("shared", "0", 6)
+        self.assertEqual(page, c_ids[::3][:6])
+        self.assertEqual(storage.ls_member_containers("shared", next_cursor, 6),
+                         (None, c_ids[::3][6:]))
+        many = storage.ls_members_many([c_ids[1], c_ids[0], "nope"], 10)
+        self.assertEqual(list(many), [c_ids[1], c_ids[0], "nope"])
+        self.assertEqual(many[c_ids[0]], (None, ["shared"]))
+        self.assertEqual(many[c_ids[1]], (None, []))
+        self.assertIsNone(many["nope"])
+
+    def test_containers_version_covers_every_shard(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        version = storage.containers_version()
+        c_id = storage.mint_container()
+        self.assertNotEqual(storage.containers_version(), version)
+        version = storage.containers_version()
+        storage.rm_containers([c_id, uuid4().hex])
+        self.assertNotEqual(storage.containers_version(), version)
+        self.assertFalse(storage.container_exists(c_id))
+
+    def test_adding_a_shard_moves_only_what_it_takes_on(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        c_ids = sorted(storage.mint_containers(80))
+        for i, c_id in enumerate(c_ids):
+            storage.add_members(c_id, [str(i), "shared", str(i)])
+        before = {c_id: storage.owner(c_id) for c_id in c_ids}
+        new = idnest.blueprint.RAMStorageBackend(idnest.blueprint.BLUEPRINT)
+        moved = storage.add_shard("d", new, chunk_size=2)
+        self.assertEqual(moved, len(new.ls_containers("0", 100)[1]))
+        self.assertGreater(moved, 0)
+        self.assertLess(moved, len(c_ids))
+        for c_id in c_ids:
+            # Containers only ever move to the new shard
+            self.assertIn(storage.owner(c_id), (before[c_id], "d"))
+            self.assertTrue(storage.shard(c_id).container_exists(c_id))
+        for name in "abc":
+            self.assertTrue(all(storage.owner(x) == name
+                                for x in storage.shards[name].ls_containers("0", 100)[1]))
+        self.assertEqual(storage.ls_containers("0", 100), (None, c_ids))
+        for i, c_id in enumerate(c_ids):
+            self.assertEqual(list(storage.iter_members(c_id)), [str(i), "shared", str(i)])
+        self.assertEqual(storage.ls_member_containers("shared", "0", 100), (None, c_ids))
+        with self.assertRaises(ValueError):
+            storage.add_shard("d", new)
+
+    def test_writes_during_add_shard(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        c_ids = sorted(storage.mint_containers(60))
+        for c_id in c_ids:
+            storage.add_member(c_id, "a")
+        versions = {c_id: storage.container_version(c_id) for c_id in c_ids}
+        raw = {c_id: storage.shard(c_id).container_version(c_id) for c_id in c_ids}
+        new = idnest.blueprint.RAMStorageBackend(idnest.blueprint.BLUEPRINT)
+        ring = storage.build_ring(list(storage.shards) + ["d"])
+        moving = [x for x in c_ids if storage.owner(x, ring) == "d"]
+        staying = [x for x in c_ids if storage.owner(x, ring) != "d"]
+        writers = []
+        copy_container = storage.copy_container
+
+        def copy_and_write(c_id, *args):
+            if not writers:
+                # Writes to the containers being moved wait for the move,
+                # those to the rest don't
+                writers.extend(Thread(target=storage.add_member, args=(x, "b"))
+                               for x in moving[:-1])
+                writers.append(Thread(target=storage.rm_container, args=(moving[-1],)))
+                for t in writers:
+                    t.start()
+                storage.add_member(staying[0], "b")
+                time.sleep(0.05)
+                self.assertTrue(all(t.is_alive() for t in writers))
+                self.assertEqual(new.ls_containers("0", 100), (None, []))
+            copy_container(c_id, *args)
+
+        with mock.patch.object(storage, "copy_container", side_effect=copy_and_write):
+            self.assertEqual(storage.add_shard("d", new), len(moving))
+        for t in writers:
+            t.join()
+        self.assertEqual(storage.ls_containers("0", 100)[1],
+                         [x for x in c_ids if x != moving[-1]])
+        for c_id in moving[:-1]:
+            self.assertEqual(list(new.iter_members(c_id)), ["a", "b"])
+            # Versions start over on the new shard, but even where they meet
+            # one from the old shard, the tag doesn't repeat
+            with mock.patch.object(new, "container_version", return_value=raw[c_id]):
+                self.assertNotEqual(storage.container_version(c_id), versions[c_id])
+        self.assertFalse(new.container_exists(moving[-1]))
+        self.assertEqual(list(storage.iter_members(staying[0])), ["a", "b"])
+
+    def test_shards_must_support_create_containers(self):
+        class NoCreate:
+            pass
+
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        with self.assertRaisesRegex(RuntimeError, "NoCreate doesn't support create_containers"):
+            idnest.blueprint.ShardedStorageBackend({"a": storage.shards["a"], "b": NoCreate()})
+        with self.assertRaisesRegex(RuntimeError, "create_containers"):
+            storage.add_shard("d", NoCreate())
+        self.assertEqual(list(storage.shards), ["a", "b", "c"])
+
+    def test_configured_shards(self):
+        config = {"ID_SCHEME": "uuid4", "SHARDS": "one, two,three", "SHARD_VNODES": 8}
+        storage = idnest.blueprint.sharded_storage_backend(config)
+        self.assertEqual(list(storage.shards), ["one", "two", "three"])
+        self.assertEqual(len(storage.ring[0]), 24)
+        with TemporaryDirectory() as tmpdir:
+            config.update(RAM_JOURNAL_DIR=tmpdir, RAM_SNAPSHOT_INTERVAL=0)
+            storage = idnest.blueprint.sharded_storage_backend(config)
+            self.assertEqual([x.directory for x in storage.shards.values()],
+                             [path.join(tmpdir, x) for x in ["one", "two", "three"]])
+            for shard in storage.shards.values():
+                shard.close()
+        self.assertEqual(idnest.blueprint.shard_settings("redis", "host:6380", {}),
+                         {"REDIS_HOST": "host", "REDIS_PORT": 6380})
+        self.assertEqual(idnest.blueprint.shard_settings("mongodb", "host", {}),
+                         {"MONGO_HOST": "host"})
+        with self.assertRaises(RuntimeError):
+            idnest.blueprint.sharded_storage_backend({"SHARDS": ""})
+        with self.assertRaises(RuntimeError):
+            idnest.blueprint.sharded_storage_backend({"SHARDS": "a", "SHARD_BACKEND": "tape"})
+
+
+class IdentifierSchemeTestCase(unittest.TestCase):
+    def test_uuid7_ids_are_time_ordered(self):
+        mint = idnest.blueprint.identifiers.minter("uuid7")
+        ids = mint(500) + mint(1) + mint(500)
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(ids), len(set(ids)))
+        for x in ids:
+            u = UUID(hex=x)
+            self.assertEqual(u.version, 7)
+            self.assertEqual(u.variant, RFC_4122)
+            self.assertEqual(x, u.hex)
+
+    def test_ulids_are_time_ordered(self):
+        mint = idnest.blueprint.identifiers.minter("ULID")
+        ids = mint(500) + mint(1) + mint(500)
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(ids), len(set(ids)))
+        for x in ids:
+            self.assertEqual(len(x), 26)
+            self.assertTrue(set(x) <= set(idnest.blueprint.identifiers.CROCKFORD_BASE32))
+
+    def test_unsupported_scheme(self):
+        with self.assertRaises(RuntimeError):
+            idnest.blueprint.identifiers.minter("uuid1")
+
+    def test_ram_listing_follows_creation_order(self):
+        with mock.patch.dict(idnest.blueprint.BLUEPRINT.config, {'ID_SCHEME': "uuid7"}):
+            storage = idnest.blueprint.RAMStorageBackend(idnest.blueprint.BLUEPRINT)
+        c_ids = [storage.mint_container() for _ in range(10)] + storage.mint_containers(10)
+        self.assertEqual(storage.ls_containers("0", 20)[1], c_ids)
+
+
+class MongoIdnestTestCase(unittest.TestCase, Mixin, KeysetContainersMixin):
     def setUp(self):
         idnest.app.config['TESTING'] = True
         self.app = idnest.app.test_client()
@@ -249,8 +1415,20 @@ class MongoIdnestTestCase(unittest.TestCase, Mixin):
         c.drop_database(idnest.blueprint.BLUEPRINT.config['MONGO_DB'])
         del idnest.blueprint.BLUEPRINT.config['storage']
 
+    def test_partial_mint_reports_what_was_minted(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        taken = storage.mint_container()
+        ids = [uuid4().hex, uuid4().hex, taken, uuid4().hex]
+        with mock.patch.object(storage, "mint_ids", lambda num: ids):
+            with self.assertRaises(idnest.blueprint.PartialBulkOperationError) as cm:
+                storage.mint_containers(4)
+        self.assertEqual(len(cm.exception.succeeded), 2)
+        self.assertEqual(len(cm.exception.failed), 2)
+        for c_id in cm.exception.succeeded:
+            self.assertTrue(storage.container_exists(c_id))
+
 
-class RedisIdnestTestCase(unittest.TestCase, Mixin):
+class RedisIdnestTestCase(unittest.TestCase, Mixin, KeysetContainersMixin):
     def setUp(self):
         idnest.app.config['TESTING'] = True
         self.app = idnest.app.test_client()
@@ -263,6 +1441,565 @@ class RedisIdnestTestCase(unittest.TestCase, Mixin):
         idnest.blueprint.BLUEPRINT.config['storage'].r.flushdb()
         del idnest.blueprint.BLUEPRINT.config['storage']
 
+    def test_migrate_list_only_containers(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        storage.r.delete(storage.SCHEMA_VERSION_KEY)
+        storage.r.rpush("legacy", 0, "a", "b", "a")
+        storage.migrate()
+        self.assertEqual(storage.ls_containers("0", 10)[1], ["legacy"])
+        self.assertTrue(storage.member_exists("legacy", "a"))
+        self.assertTrue(storage.member_exists("legacy", "b"))
+        storage.rm_member("legacy", "a")
+        self.assertTrue(storage.member_exists("legacy", "a"))
+        storage.rm_member("legacy", "a")
+        self.assertFalse(storage.member_exists("legacy", "a"))
+        self.assertEqual(storage.ls_members("legacy", "0", 10)[1], ["b"])
+
+    def test_unrelated_keys_are_not_listed(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        storage.r.set("unrelated", "value")
+        c_ids = self.add_multiple_containers(3)
+        self.assertEqual(storage.ls_containers("0", 3), (None, sorted(c_ids)))
+
+    def test_large_member_batch(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        c_id = storage.mint_containers(1)[0]
+        m_ids = [str(x) for x in range(1, 2501)]
+        storage.add_members(c_id, m_ids)
+        self.assertEqual(storage.ls_members(c_id, "0", 2500)[1], m_ids)
+        storage.rm_members(c_id, m_ids[:1500])
+        self.assertEqual(storage.ls_members(c_id, "0", 2500)[1], m_ids[1500:])
+
+    def test_add_to_removed_container_leaves_nothing_behind(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        c_id = self.add_container()
+        storage.rm_container(c_id)
+        with self.assertRaises(KeyError):
+            storage.add_members(c_id, ["a", "b"])
+        self.assertNotIn(storage.index_key(c_id), storage.r)
+        self.assertNotIn(c_id, storage.r)
+
+    def test_migrate_builds_reverse_index(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        storage.r.delete(storage.SCHEMA_VERSION_KEY)
+        storage.r.rpush("legacy", 0, "a", "b", "a")
+        storage.migrate()
+        self.assertEqual(storage.ls_member_containers("a", "0", 10), (None, ["legacy"]))
+        storage.rm_container("legacy")
+        self.assertEqual(storage.ls_member_containers("a", "0", 10), (None, []))
+
+    def test_removing_member_named_like_the_sentinel(self):
+        c_id = self.add_container()
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        storage.add_members(c_id, ["a", "0", "b"])
+        storage.rm_member(c_id, "0")
+        self.assertFalse(storage.member_exists(c_id, "0"))
+        self.assertEqual(storage.ls_members(c_id, "0", 10)[1], ["a", "b"])
+
+    def test_internal_keys_are_not_containers(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        c_id = self.add_container()
+        self.app.post("/{}/".format(c_id), data={"member": "a"})
+        storage.r.set("unrelated", "value")
+        keys = [storage.CONTAINERS_KEY, storage.CONTAINERS_VERSION_KEY,
+                storage.SCHEMA_VERSION_KEY, storage.member_key("a"), "unrelated"]
+        before = {key: storage.r.dump(key) for key in keys}
+        for key in keys:
+            for rv in [self.app.get("/{}/".format(key)),
+                       self.app.head("/{}/".format(key)),
+                       self.app.get("/{}/_export".format(key)),
+                       self.app.post("/{}/".format(key), data={"member": "x"})]:
+                self.assertEqual(rv.status_code, 404)
+            rv = self.app.post("/_batch/members", data={"container": key})
+            self.assertEqual(self.response_200_json(rv)['Containers'][0]['error'],
+                             "Container not found")
+            self.app.delete("/{}/a".format(key))
+            self.app.delete("/{}/".format(key))
+        # Only the version of the container listing may have moved
+        del before[storage.CONTAINERS_VERSION_KEY]
+        self.assertEqual({key: storage.r.dump(key) for key in before}, before)
+        self.assertEqual(storage.ls_containers("0", 10), (None, [c_id]))
+        self.assertEqual(storage.ls_member_containers("a", "0", 10), (None, [c_id]))
+
+    def test_keys_derived_from_containers_are_not_containers(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        c_id = self.add_container()
+        self.app.post("/{}/".format(c_id), data={"member": ["a", "index"]})
+        for key in [storage.index_key(c_id), storage.version_key(c_id)]:
+            self.assertEqual(self.app.get("/{}/".format(key)).status_code, 404)
+            self.assertEqual(self.app.get("/{}/a".format(key)).status_code, 404)
+            self.app.delete("/{}/a".format(key))
+            self.app.delete("/{}/".format(key))
+            self.assertFalse(storage.members_exist(key, ["a"])[0])
+            self.assertIsNone(storage.ls_members_many([key], 10)[key])
+        # A member key, whose name ends in a member id like an index key
+        self.assertEqual(self.app.get("/idnest:member/index").status_code, 404)
+        self.assertTrue(storage.member_exists(c_id, "a"))
+        self.assertEqual(storage.ls_members(c_id, "0", 10)[1], ["a", "index"])
+        self.assertEqual(storage.container_version(c_id), 1)
+
+
+class SQLiteIdnestTestCase(unittest.TestCase, Mixin, KeysetContainersMixin):
+    def setUp(self):
+        idnest.app.config['TESTING'] = True
+        self.app = idnest.app.test_client()
+        self.tmpdir = TemporaryDirectory()
+        idnest.blueprint.BLUEPRINT.config['SQLITE_PATH'] = path.join(self.tmpdir.name,
+                                                                     "idnest.db")
+        idnest.blueprint.BLUEPRINT.config['storage'] = idnest.blueprint.SQLiteStorageBackend(
+            idnest.blueprint.BLUEPRINT)
+
+    def tearDown(self):
+        del idnest.blueprint.BLUEPRINT.config['storage']
+        self.tmpdir.cleanup()
+
+    def test_wal_mode(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        self.assertEqual(storage.db.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+
+    def test_counts_members_of_older_databases(self):
+        # A database as schema version 1 left it, before containers kept count
+        old_schema = idnest.blueprint.SQLiteStorageBackend.SCHEMA.replace(
+            ",\n    size INTEGER NOT NULL DEFAULT 0", "")
+        self.assertNotIn("size", old_schema)
+        db_path = path.join(self.tmpdir.name, "old.db")
+        db = sqlite3.connect(db_path)
+        db.executescript(old_schema)
+        db.executemany("INSERT INTO containers (id) VALUES (?)", [("c",), ("e",)])
+        db.executemany("INSERT INTO members (container, member) VALUES ('c', ?)",
+                       [("a",), ("b",), ("a",)])
+        db.execute("PRAGMA user_version = 1")
+        db.commit()
+        db.close()
+        with mock.patch.dict(idnest.blueprint.BLUEPRINT.config, {"SQLITE_PATH": db_path}):
+            storage = idnest.blueprint.SQLiteStorageBackend(idnest.blueprint.BLUEPRINT)
+        self.assertEqual(storage.db.execute("PRAGMA user_version").fetchone()[0],
+                         storage.SCHEMA_VERSION)
+        self.assertEqual((storage.count_members("c"), storage.count_members("e")), (3, 0))
+        storage.add_members("e", ["x", "y"])
+        storage.rm_members("c", ["a", "b", "z"])
+        self.assertEqual((storage.count_members("c"), storage.count_members("e")), (1, 2))
+
+    def test_survives_reopening(self):
+        c_id = self.add_container()
+        self.app.post("/{}/".format(c_id), data={"member": ["a", "b"]})
+        storage = idnest.blueprint.SQLiteStorageBackend(idnest.blueprint.BLUEPRINT)
+        self.assertEqual(storage.ls_containers("0", 10), (None, [c_id]))
+        self.assertEqual(storage.ls_members(c_id, "0", 10)[1], ["a", "b"])
+        self.assertEqual(storage.ls_member_containers("b", "0", 10), (None, [c_id]))
+
+    def test_removes_oldest_duplicate(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        c_id = storage.mint_container()
+        storage.add_members(c_id, ["a", "b", "a"])
+        storage.rm_member(c_id, "a")
+        self.assertEqual(storage.ls_members(c_id, "0", 10)[1], ["b", "a"])
+        self.assertEqual(storage.ls_member_containers("a", "0", 10), (None, [c_id]))
+        storage.rm_member(c_id, "a")
+        self.assertFalse(storage.member_exists(c_id, "a"))
+        self.assertEqual(storage.ls_member_containers("a", "0", 10), (None, []))
+
+    def test_rm_container_removes_members(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        c_id = storage.mint_container()
+        storage.add_members(c_id, ["a", "b"])
+        storage.rm_container(c_id)
+        self.assertEqual(storage.db.execute("SELECT count(*) FROM members").fetchone()[0], 0)
+        self.assertEqual(storage.ls_member_containers("a", "0", 10), (None, []))
+
+    def test_connection_per_thread(self):
+        storage = idnest.blueprint.BLUEPRINT.config['storage']
+        c_id = storage.mint_container()
+        connections = []
+
+        def add(n):
+            connections.append(storage.db)
+            for i in range(50):
+                storage.add_member(c_id, "{}-{}".format(n, i))
+
+        threads = [Thread(target=add, args=(n,)) for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(set(map(id, connections))), 4)
+        self.assertEqual(len(list(storage.iter_members(c_id))), 200)
+        self.assertEqual(storage.container_version(c_id), 200)
+
+    def test_members_keyset_cursor_survives_removal(self):
+        c_id = self.add_container()
+        m_ids = [self.add_member(c_id) for _ in range(6)]
+        rv = self.app.get("/{}/".format(c_id), data={"limit": 3})
+        rj = self.response_200_json(rv)
+        self.remove_member(c_id, m_ids[0])
+        self.remove_member(c_id, m_ids[4])
+        rv = self.app.get("/{}/".format(c_id),
+                          data={"limit": 3, "cursor": rj['pagination']['next_cursor']})
+        rj = self.response_200_json(rv)
+        self.assertEqual([x['identifier'] for x in rj['Members']], [m_ids[3], m_ids[5]])
+        self.assertIsNone(rj['pagination']['next_cursor'])
+
+
+# The test client's json argument shadows the module, as in Flask's
+dump_json = json.dumps
+
+
+class ASGIResponse:
+    def __init__(self, status_code, headers, data):
+        self.status_code = status_code
+        self.headers = headers
+        self.data = data
+
+    @property
+    def json(self):
+        return json.loads(self.data.decode())
+
+
+class ASGITestClient:
+    """
+    Drive an ASGI app from synchronous tests, in the style of Flask's
+    test client
+    """
+    def __init__(self, app):
+        self.app = app
+        # One loop for every request, async clients are bound to theirs
+        self.loop = asyncio.new_event_loop()
+
+    def close(self):
+        self.loop.close()
+
+    def run(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    async def request(self, method, path, data=None, json=None, headers=None):
+        path, _, query = path.partition("?")
+        headers = dict(headers or {})
+        body = b""
+        if json is not None:
+            body = dump_json(json).encode("utf-8")
+            headers['Content-Type'] = "application/json"
+        elif data is not None:
+            if method in ("GET", "HEAD"):
+                query = urlencode(data, doseq=True)
+            else:
+                body = urlencode(data, doseq=True).encode("utf-8")
+                headers['Content-Type'] = "application/x-www-form-urlencoded"
+        scope = {
+            "type": "http",
+            "method": method,
+            "path": unquote(path),
+            "raw_path": path.encode("latin-1"),
+            "root_path": "",
+            "query_string": query.encode("utf-8"),
+            "headers": [(k.lower().encode("latin-1"), v.encode("latin-1"))
+                        for k, v in headers.items()]
+        }
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def send(message):
+            messages.append(message)
+
+        await self.app(scope, receive, send)
+        return ASGIResponse(
+            messages[0]['status'],
+            {k.decode("latin-1"): v.decode("latin-1") for k, v in messages[0]['headers']},
+            b"".join(x.get('body', b"") for x in messages[1:])
+        )
+
+    def get(self, path, **kwargs):
+        return self.run(self.request("GET", path, **kwargs))
+
+    def head(self, path, **kwargs):
+        return self.run(self.request("HEAD", path, **kwargs))
+
+    def post(self, path, **kwargs):
+        return self.run(self.request("POST", path, **kwargs))
+
+    def delete(self, path, **kwargs):
+        return self.run(self.request("DELETE", path, **kwargs))
+
+
+class ASGIMixin:
+    def mint(self, num=1):
+        rv = self.client.post("/", data={"num": num})
+        self.assertEqual(rv.status_code, 200)
+        return [x['identifier'] for x in rv.json['Minted']]
+
+    def test_version(self):
+        rv = self.client.get("/version")
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(rv.json, {"version": idnest.blueprint.__version__})
+
+    def test_mint_and_page_containers(self):
+        c_ids = self.mint(5)
+        self.assertEqual(len(set(c_ids)), 5)
+        rv = self.client.post("/")
+        self.assertEqual(rv.json['Minted'][0]['_link'],
+                         "/{}/".format(rv.json['Minted'][0]['identifier']))
+        c_ids.append(rv.json['Minted'][0]['identifier'])
+        listed = []
+        cursor = "0"
+        while cursor is not None:
+            rv = self.client.get("/", data={"cursor": cursor, "limit": 4})
+            self.assertEqual(rv.status_code, 200)
+            self.assertLessEqual(len(rv.json['Containers']), 4)
+            listed.extend(x['identifier'] for x in rv.json['Containers'])
+            cursor = rv.json['pagination']['next_cursor']
+        self.assertEqual(sorted(listed), sorted(c_ids))
+
+    def test_add_page_and_remove_members(self):
+        c_id = self.mint()[0]
+        rv = self.client.post("/{}/".format(c_id), data={"member": ["a", "b"]})
+        self.assertEqual([x['identifier'] for x in rv.json['Added']], ["a", "b"])
+        self.assertEqual(rv.json['Added'][0]['_link'], "/{}/a".format(c_id))
+        self.client.post("/{}/".format(c_id), json={"member": ["c", "d"]})
+        self.client.post("/{}/?member=e".format(c_id))
+        members = []
+        cursor = "0"
+        while cursor is not None:
+            rv = self.client.get("/{}/".format(c_id), data={"cursor": cursor, "limit": 2})
+            self.assertEqual(rv.status_code, 200)
+            members.extend(x['identifier'] for x in rv.json['Members'])
+            cursor = rv.json['pagination']['next_cursor']
+        self.assertEqual(members, ["a", "b", "c", "d", "e"])
+        rv = self.client.get("/{}/c".format(c_id))
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(rv.json['Container']['identifier'], c_id)
+        rv = self.client.delete("/{}/c".format(c_id))
+        self.assertTrue(rv.json['Deleted'])
+        self.assertEqual(self.client.get("/{}/c".format(c_id)).status_code, 404)
+        rv = self.client.delete("/{}/".format(c_id))
+        self.assertTrue(rv.json['Deleted'])
+        self.assertEqual(self.client.get("/{}/".format(c_id)).status_code, 404)
+
+    def test_listings_without_links(self):
+        c_id = self.mint()[0]
+        rv = self.client.post("/{}/?links=false".format(c_id), data={"member": ["a", "b"]})
+        self.assertEqual(rv.json['Added'], [{"identifier": "a"}, {"identifier": "b"}])
+        rv = self.client.get("/{}/".format(c_id), data={"links": "false"})
+        self.assertEqual(rv.json['Members'], [{"identifier": "a"}, {"identifier": "b"}])
+        rv = self.client.get("/", data={"links": "false"})
+        self.assertEqual(rv.json['Containers'], [{"identifier": c_id}])
+        rv = self.client.post("/", data={"links": "false"})
+        self.assertNotIn("_link", rv.json['Minted'][0])
+        rv = self.client.get("/", data={"links": "maybe"})
+        self.assertEqual(rv.status_code, 400)
+
+    def test_errors(self):
+        c_id = self.mint()[0]
+        self.assertEqual(self.client.get("/{}/".format(uuid4().hex)).status_code, 404)
+        self.assertEqual(self.client.get("/{}/a".format(uuid4().hex)).status_code, 404)
+        rv = self.client.post("/{}/".format(uuid4().hex), data={"member": "a"})
+        self.assertEqual(rv.status_code, 404)
+        rv = self.client.post("/{}/".format(c_id))
+        self.assertEqual(rv.status_code, 400)
+        self.assertEqual(rv.json, {"message": {"member": "The member id to add"}})
+        rv = self.client.post("/", data={"num": "x"})
+        self.assertEqual(rv.json, {"message": {"num": "How many containers to mint."}})
+        self.assertEqual(self.client.get("/", data={"limit": "x"}).status_code, 400)
+        self.assertEqual(self.client.get("/", data={"cursor": "kzz"}).status_code, 400)
+        self.assertEqual(self.client.delete("/").status_code, 405)
+        self.assertEqual(self.client.get("/a/b/c").status_code, 404)
+        rv = self.client.get("/{}".format(c_id))
+        self.assertEqual(rv.status_code, 308)
+        self.assertEqual(rv.headers['location'], "/{}/".format(c_id))
+
+    def test_limit_is_capped(self):
+        rv = self.client.post("/", data={"num": 2000})
+        self.assertEqual(len(rv.json['Minted']), 1000)
+
+    def test_conditional_requests(self):
+        c_id = self.mint()[0]
+        self.client.post("/{}/".format(c_id), data={"member": "a"})
+        for url in ("/", "/{}/".format(c_id), "/{}/a".format(c_id)):
+            rv = self.client.get(url)
+            etag = rv.headers['etag']
+            rv = self.client.get(url, headers={"If-None-Match": etag})
+            self.assertEqual(rv.status_code, 304)
+            self.assertEqual(rv.data, b"")
+        self.client.post("/{}/".format(c_id), data={"member": "b"})
+        rv = self.client.get("/{}/".format(c_id), headers={"If-None-Match": etag})
+        self.assertEqual(rv.status_code, 200)
+        rv = self.client.get("/{}/".format(c_id), data={"limit": 1})
+        etag = rv.headers['etag']
+        rv = self.client.get("/{}/".format(c_id), headers={"If-None-Match": etag},
+                             data={"limit": 1, "cursor": rv.json['pagination']['next_cursor']})
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual([x['identifier'] for x in rv.json['Members']], ["b"])
+        rv = self.client.get("/{}/nope".format(c_id), headers={"If-None-Match": "*"})
+        self.assertEqual(rv.status_code, 404)
+        rv = self.client.get("/{}/a".format(c_id), headers={"If-None-Match": "*"})
+        self.assertEqual(rv.status_code, 304)
+        rv = self.client.head("/{}/a".format(c_id))
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(rv.data, b"")
+        self.assertGreater(int(rv.headers['content-length']), 0)
+
+    def test_count_members(self):
+        c_id = self.mint()[0]
+        self.client.post("/{}/".format(c_id), data={"member": ["a", "b", "c"]})
+        self.client.delete("/{}/b".format(c_id))
+        rv = self.client.head("/{}/".format(c_id))
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(rv.headers[idnest.blueprint.COUNT_HEADER.lower()], "2")
+        self.assertEqual(rv.data, b"")
+        rv = self.client.get("/{}/".format(c_id), data={"total": "true", "limit": 1})
+        self.assertEqual(rv.json['pagination']['total'], 2)
+        self.assertEqual(rv.json['Members'], [{"identifier": "a", "_link": "/{}/a".format(c_id)}])
+        rv = self.client.get("/{}/".format(c_id))
+        self.assertNotIn("total", rv.json['pagination'])
+        self.assertEqual(self.client.head("/{}/".format(uuid4().hex)).status_code, 404)
+        rv = self.client.get("/{}/".format(uuid4().hex), data={"total": "true"})
+        self.assertEqual(rv.status_code, 404)
+
+    def test_concurrent_requests(self):
+        c_id = self.mint()[0]
+
+        async def add_all():
+            return await asyncio.gather(*(
+                self.client.request("POST", "/{}/".format(c_id), data={"member": str(i)})
+                for i in range(200)
+            ))
+
+        for rv in self.client.run(add_all()):
+            self.assertEqual(rv.status_code, 200)
+        rv = self.client.get("/{}/".format(c_id))
+        self.assertEqual(sorted(x['identifier'] for x in rv.json['Members']),
+                         sorted(str(i) for i in range(200)))
+
+
+class ASGIRAMIdnestTestCase(unittest.TestCase, ASGIMixin):
+    def setUp(self):
+        self.storage = idnest.blueprint.aio.AsyncRAMStorageBackend(idnest.blueprint.BLUEPRINT)
+        self.client = ASGITestClient(idnest.asgi.IdnestASGI(
+            self.storage, idnest.blueprint.BLUEPRINT.config))
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_matches_flask_app(self):
+        idnest.app.config['TESTING'] = True
+        app = idnest.app.test_client()
+        idnest.blueprint.BLUEPRINT.config['storage'] = self.storage.backend
+        try:
+            c_id = self.mint()[0]
+            self.client.post("/{}/".format(c_id), data={"member": ["a b", "c:d?", "e"]})
+            for url in ("/?limit=1", "/{}/?limit=2".format(c_id), "/{}/a%20b".format(c_id),
+                        "/version", "/{}/".format(uuid4().hex)):
+                ours = self.client.get(url)
+                theirs = app.get(url)
+                self.assertEqual(ours.status_code, theirs.status_code)
+                self.assertEqual(ours.data, theirs.data)
+                self.assertEqual(ours.headers.get('etag'), theirs.headers.get('ETag'))
+        finally:
+            del idnest.blueprint.BLUEPRINT.config['storage']
+
+    def test_lifespan(self):
+        messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        self.client.run(self.client.app({"type": "lifespan"}, receive, send))
+        self.assertEqual(sent, ["lifespan.startup.complete", "lifespan.shutdown.complete"])
+
+
+@unittest.skipUnless(motor, "motor is not installed")
+class ASGIMongoIdnestTestCase(unittest.TestCase, ASGIMixin):
+    def setUp(self):
+        idnest.blueprint.BLUEPRINT.config['MONGO_HOST'] = "localhost"
+        idnest.blueprint.BLUEPRINT.config['MONGO_DB'] = "test"
+        self.storage = idnest.blueprint.aio.AsyncMongoStorageBackend(
+            idnest.blueprint.BLUEPRINT)
+        self.client = ASGITestClient(idnest.asgi.IdnestASGI(
+            self.storage, idnest.blueprint.BLUEPRINT.config))
+
+    def tearDown(self):
+        self.client.run(self.storage.db.client.drop_database(
+            idnest.blueprint.BLUEPRINT.config['MONGO_DB']))
+        self.client.close()
+
+
+class ASGIRedisIdnestTestCase(unittest.TestCase, ASGIMixin):
+    def setUp(self):
+        idnest.blueprint.BLUEPRINT.config['REDIS_HOST'] = "localhost"
+        idnest.blueprint.BLUEPRINT.config['REDIS_DB'] = 0
+        self.storage = idnest.blueprint.aio.AsyncRedisStorageBackend(
+            idnest.blueprint.BLUEPRINT)
+        self.client = ASGITestClient(idnest.asgi.IdnestASGI(
+            self.storage, idnest.blueprint.BLUEPRINT.config))
+
+    def tearDown(self):
+        self.client.run(self.storage.r.flushdb())
+        self.client.run(self.storage.r.aclose())
+        self.client.close()
+
+    def test_shares_data_with_sync_backend(self):
+        c_id = self.mint()[0]
+        self.client.post("/{}/".format(c_id), data={"member": ["a", "0", "b"]})
+        self.client.delete("/{}/0".format(c_id))
+        storage = idnest.blueprint.RedisStorageBackend(idnest.blueprint.BLUEPRINT)
+        self.assertTrue(storage.container_exists(c_id))
+        self.assertEqual(storage.ls_members(c_id, "0", 10)[1], ["a", "b"])
+        self.assertEqual(storage.ls_member_containers("a", "0", 10)[1], [c_id])
+
+    def test_internal_keys_are_not_containers(self):
+        c_id = self.mint()[0]
+        self.client.post("/{}/".format(c_id), data={"member": "a"})
+        layout = self.storage.layout
+        for key in [layout.CONTAINERS_KEY, layout.SCHEMA_VERSION_KEY, layout.member_key("a")]:
+            self.assertEqual(self.client.get("/{}/".format(key)).status_code, 404)
+            self.assertEqual(self.client.head("/{}/".format(key)).status_code, 404)
+            rv = self.client.post("/{}/".format(key), data={"member": "x"})
+            self.assertEqual(rv.status_code, 404)
+            self.client.delete("/{}/a".format(key))
+            self.client.delete("/{}/".format(key))
+        self.assertEqual(self.client.get("/").json['Containers'],
+                         [{"identifier": c_id, "_link": "/{}/".format(c_id)}])
+        storage = idnest.blueprint.RedisStorageBackend(idnest.blueprint.BLUEPRINT)
+        self.assertEqual(storage.ls_member_containers("a", "0", 10), (None, [c_id]))
+
+
+class ConfigurationTestCase(unittest.TestCase):
+    def load(self, **env):
+        # A fresh subclass reads the environment, as the app's did on import
+        with mock.patch.dict(environ, {"IDNEST_" + k: v for k, v in env.items()}):
+            return type("Configuration", (idnest.Configuration,), {"ENV_PREFIX": "IDNEST_"})
+
+    def test_ram_journal_settings(self):
+        config = self.load(RAM_JOURNAL_DIR="/var/lib/idnest", RAM_JOURNAL_COMMIT_DELAY="0.005",
+                           RAM_SNAPSHOT_INTERVAL="60")
+        self.assertEqual(
+            (config.RAM_JOURNAL_DIR, config.RAM_JOURNAL_COMMIT_DELAY, config.RAM_SNAPSHOT_INTERVAL),
+            ("/var/lib/idnest", 0.005, 60)
+        )
+        self.assertIsNone(self.load().RAM_JOURNAL_DIR)
+
+    def test_sqlite_settings(self):
+        config = self.load(SQLITE_PATH="/var/lib/idnest.db", SQLITE_TIMEOUT="30")
+        self.assertEqual((config.SQLITE_PATH, config.SQLITE_TIMEOUT), ("/var/lib/idnest.db", 30))
+
+    def test_ram_duplicates_setting(self):
+        self.assertIs(self.load(RAM_ALLOW_DUPLICATE_MEMBERS="false").RAM_ALLOW_DUPLICATE_MEMBERS,
+                      False)
+
+    def test_export_setting(self):
+        self.assertEqual(self.load(EXPORT_CHUNK_SIZE="200").EXPORT_CHUNK_SIZE, 200)
+
+    def test_import_settings(self):
+        config = self.load(IMPORT_BATCH_SIZE="50", IMPORT_MAX_PENDING="500")
+        self.assertEqual((config.IMPORT_BATCH_SIZE, config.IMPORT_MAX_PENDING), (50, 500))
+
+    def test_redis_connections_setting(self):
+        self.assertEqual(self.load(REDIS_MAX_CONNECTIONS="8").REDIS_MAX_CONNECTIONS, 8)
+
 
 class ImproperSetupTestCase(unittest.TestCase):
     def setUp(self):